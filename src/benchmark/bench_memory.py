@@ -0,0 +1,71 @@
+"""Memory used per variable by a WindowsEnvStore loaded from a synthetic registry.
+
+Run from the ``src`` directory::
+
+    python -m benchmark.bench_memory [count ...]
+"""
+
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from enveditor.envstore import WindowsEnvStore
+from enveditor.registry import synthetic_registry
+
+DEFAULT_COUNTS = (10000, 20000, 50000)
+
+
+def measure(count, path_entries=1000, lists=0.05):
+    """Return a dict of the memory used by a store of `count` variables per location"""
+    registry = synthetic_registry(variables=count, path_entries=path_entries, lists=lists)
+
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+
+    store = WindowsEnvStore(registry)
+    store.update()
+    gc.collect()
+    loaded = tracemalloc.get_traced_memory()[0] - start
+
+    segments = 0
+    for variables in (store.env.system, store.env.user):
+        for value in variables.values():
+            if isinstance(value.value, list):
+                segments += len(value.value)
+    gc.collect()
+    realized = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+
+    total = len(store.env.system) + len(store.env.user)
+    return {
+        'variables': total,
+        'loaded_bytes': loaded,
+        'loaded_per_variable': loaded / total,
+        'realized_bytes': realized,
+        'realized_per_variable': realized / total,
+        'segments': segments,
+        'unique_segments': len(store.env._strings),
+    }
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    counts = [int(arg) for arg in argv] or DEFAULT_COUNTS
+
+    print('%10s %14s %14s %10s %10s' % ('variables', 'loaded B/var', 'values B/var', 'segments', 'unique'))
+    for count in counts:
+        result = measure(count)
+        print('%10d %14.1f %14.1f %10d %10d' % (result['variables'],
+                                                result['loaded_per_variable'],
+                                                result['realized_per_variable'],
+                                                result['segments'],
+                                                result['unique_segments']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+"""Timings of store loading, queries, expansion and GUI population on synthetic environments.
+
+Run from the ``src`` directory::
+
+    python -m benchmark.bench_suite run [-s SIZE ...] [-o results.json] [--xvfb]
+    python -m benchmark.bench_suite compare old.json new.json [-t 0.1]
+
+``run`` writes JSON results: the best and median time per call of each
+case at each size, along with the commit and Python version. ``compare``
+prints the ratio of the best times in two result files and exits with 1 if
+any case is slower than the threshold allows, so it can gate a change.
+
+The GUI cases need a display; with ``--xvfb`` one is started when
+``DISPLAY`` is not set and ``Xvfb`` is installed. Without a display they
+are recorded as skipped.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0,
+                os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from enveditor.envstore import EnvKey, EnvLocation, WindowsEnvStore
+from enveditor.registry import REG_SZ, synthetic_registry
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+PATH_ENTRIES = 1000
+
+CASES = []
+
+
+def case(name, gui=False):
+    """Register a benchmark; the function takes a size and returns the callable to time"""
+    def register(func):
+        CASES.append((name, func, gui))
+        return func
+    return register
+
+
+def _loaded_store(size):
+    store = WindowsEnvStore(synthetic_registry(variables=size, path_entries=PATH_ENTRIES, lists=0.05))
+    store.update()
+    return store
+
+
+@case('store.update')
+def bench_update(size):
+    registry = synthetic_registry(variables=size, path_entries=PATH_ENTRIES, lists=0.05)
+
+    def run():
+        WindowsEnvStore(registry).update()
+    return run
+
+
+@case('store.update_unchanged')
+def bench_update_unchanged(size):
+    store = _loaded_store(size)
+    return store.update
+
+
+@case('env.get_exact')
+def bench_get_exact(size):
+    env = _loaded_store(size).env
+    names = list(env.system)[::max(1, size // 100)][:100]
+
+    def run():
+        for name in names:
+            env.get(name)
+    return run
+
+
+@case('env.get_substring')
+def bench_get_substring(size):
+    env = _loaded_store(size).env
+
+    def run():
+        env.get('var_1', exact=False)
+    return run
+
+
+@case('env.search_refine')
+def bench_search(size):
+    # Typing 'sys_var_12' a character at a time into the filter, matching values too
+    env = _loaded_store(size).env
+    env.build_indexes()
+    text = 'sys_var_12'
+
+    def run():
+        results = None
+        for end in range(1, len(text) + 1):
+            results = env.search(text[:end], EnvLocation.ENV_SYSTEM, values=True, within=results)
+    return run
+
+
+@case('env.expand_path')
+def bench_expand(size):
+    env = _loaded_store(size).env
+    path = env.system['path'].value
+
+    def run():
+        env.invalidate_expansion()
+        env._expand(path, EnvLocation.ENV_SYSTEM)
+    return run
+
+
+@case('env.shared_variables')
+def bench_shared(size):
+    # Adding and removing a shared key makes each call rebuild what it needs to
+    env = _loaded_store(size).env
+    key = EnvKey('x', REG_SZ)
+
+    def run():
+        env.user['bench_shared'] = key
+        env.system['bench_shared'] = key
+        env.shared_variables()
+        del env.system['bench_shared']
+        env.shared_variables()
+    return run
+
+
+_root = []
+
+
+def _tk_root():
+    # Return the Tk root shared by the GUI cases, or None if there is no display
+    import tkinter as tk
+
+    if not _root:
+        try:
+            root = tk.Tk()
+        except tk.TclError:
+            return None
+        root.withdraw()
+        _root.append(root)
+    for child in _root[0].winfo_children():
+        child.destroy()
+    return _root[0]
+
+
+@case('gui.populate_tree', gui=True)
+def bench_populate_tree(size):
+    from enveditor.editor import EnvFrame
+
+    root = _tk_root()
+    if root is None:
+        return None
+    frame = EnvFrame(root, _loaded_store(size))
+
+    def run():
+        frame._tv.delete(*frame._tv.get_children('system'))
+        frame._populated.discard('system')
+        frame._tv_items.clear()
+        frame._populate_node('system', EnvLocation.ENV_SYSTEM)
+        root.update_idletasks()
+    return run
+
+
+@case('gui.populate_listbox', gui=True)
+def bench_populate_listbox(size):
+    from enveditor.editor import EnvFrame
+
+    root = _tk_root()
+    if root is None:
+        return None
+    store = _loaded_store(size)
+    frame = EnvFrame(root, store)
+    view = frame._view(EnvLocation.ENV_SYSTEM, 'path')
+
+    def run():
+        frame._update_listbox(view)
+        root.update()
+    return run
+
+
+def measure(func, repeat=5, min_time=0.05):
+    """Return the best and median seconds per call of `func`, and the calls per timing"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _idx in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+
+    timings = [elapsed / number]
+    for _repeat in range(repeat - 1):
+        start = time.perf_counter()
+        for _idx in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return min(timings), statistics.median(timings), number
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _start_xvfb():
+    # Return the Xvfb process started for the GUI cases, or None
+    if os.environ.get('DISPLAY') or not shutil.which('Xvfb'):
+        return None
+    display = ':%d' % (90 + os.getpid() % 10)
+    process = subprocess.Popen(['Xvfb', display, '-screen', '0', '1280x1024x24'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    os.environ['DISPLAY'] = display
+    time.sleep(0.5)
+    return process
+
+
+def run(sizes=DEFAULT_SIZES, cases=None, repeat=5, min_time=0.05, gui=True, out=None):
+    """Run the cases named in `cases`, or all of them, at each size and return the results"""
+    results = []
+    for name, func, needs_display in CASES:
+        if (cases and name not in cases) or (needs_display and not gui):
+            continue
+        for size in sizes:
+            timed = func(size)
+            if timed is None:
+                results.append({'case': name, 'size': size, 'skipped': 'no display'})
+            else:
+                best, median, number = measure(timed, repeat, min_time)
+                results.append({'case': name, 'size': size, 'best': best, 'median': median,
+                                'number': number, 'repeat': repeat})
+            if out is not None:
+                result = results[-1]
+                if 'skipped' in result:
+                    out.write('%-26s %8d %14s\n' % (name, size, 'skipped'))
+                else:
+                    out.write('%-26s %8d %12.1fus\n' % (name, size, result['best'] * 1e6))
+                out.flush()
+
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'platform': sys.platform,
+        'time': time.time(),
+        'path_entries': PATH_ENTRIES,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold=0.1):
+    """Return ``(case, size, old_best, new_best, ratio, regressed)`` for the cases in both results"""
+    previous = {(result['case'], result['size']): result for result in old['results'] if 'best' in result}
+    rows = []
+    for result in new['results']:
+        before = previous.get((result['case'], result['size']))
+        if before is None or 'best' not in result:
+            continue
+        ratio = result['best'] / before['best']
+        rows.append((result['case'], result['size'], before['best'], result['best'], ratio,
+                     ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run')
+    run_parser.add_argument('-s', '--size', type=int, action='append', dest='sizes')
+    run_parser.add_argument('-c', '--case', action='append', dest='cases', choices=[name for name, _f, _g in CASES])
+    run_parser.add_argument('-r', '--repeat', type=int, default=5)
+    run_parser.add_argument('--min-time', type=float, default=0.05)
+    run_parser.add_argument('-o', '--output', help='write the JSON results here instead of to stdout')
+    run_parser.add_argument('--no-gui', action='store_false', dest='gui', help='skip the GUI cases')
+    run_parser.add_argument('--xvfb', action='store_true', help='start Xvfb for the GUI cases if there is no display')
+
+    compare_parser = commands.add_parser('compare')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                                help='fraction by which a case may slow down before it is a regression')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compare':
+        with open(args.old) as fp:
+            old = json.load(fp)
+        with open(args.new) as fp:
+            new = json.load(fp)
+        rows = compare(old, new, args.threshold)
+        print('%-26s %8s %12s %12s %8s' % ('case', 'size', 'old us', 'new us', 'ratio'))
+        for name, size, before, after, ratio, regressed in rows:
+            print('%-26s %8d %12.1f %12.1f %7.2fx%s' % (name, size, before * 1e6, after * 1e6, ratio,
+                                                        '  REGRESSION' if regressed else ''))
+        return 1 if any(row[5] for row in rows) else 0
+
+    xvfb = _start_xvfb() if args.xvfb else None
+    try:
+        results = run(args.sizes or DEFAULT_SIZES, args.cases, args.repeat, args.min_time, args.gui,
+                      out=sys.stderr)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(results, fp, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
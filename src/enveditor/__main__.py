@@ -1,3 +1,5 @@
-from editor import EnvEditor
-editor = EnvEditor()
-editor.run()
+import sys
+
+from enveditor.cli import main
+
+sys.exit(main())
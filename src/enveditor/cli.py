@@ -0,0 +1,247 @@
+"""Command line interface.
+
+Scripted use should not pay for the GUI, so only :mod:`argparse` is imported
+at module level; the store is imported when a command runs and
+:mod:`tkinter` only when no command is given.
+"""
+
+import argparse
+import sys
+
+LOCATIONS = ('system', 'user', 'both')
+
+
+def _location(name):
+    from .envstore import EnvLocation
+
+    return {'system': EnvLocation.ENV_SYSTEM,
+            'user': EnvLocation.ENV_USER,
+            'both': EnvLocation.ENV_BOTH}[name]
+
+
+def _value(key, expanded, pathsep):
+    if expanded and key.expanded is not None:
+        value = key.expanded
+    else:
+        value = key.value
+    if isinstance(value, list):
+        return pathsep.join(value)
+    return value
+
+
+def cmd_get(store, args, out):
+    result = store.env.get(args.name.lower(), location=_location(args.location), exact=True)
+    if not result:
+        return 1
+
+    for location, key in sorted(result[args.name.lower()].items()):
+        if args.location == 'both':
+            out.write('%s\t%s\n' % (location, _value(key, args.expanded, store.env.pathsep)))
+        else:
+            out.write('%s\n' % _value(key, args.expanded, store.env.pathsep))
+    return 0
+
+
+def cmd_search(store, args, out):
+    location = _location(args.location)
+    if args.prefix:
+        result = store.env.get_prefix(args.text.lower(), location=location)
+    else:
+        result = store.env.get(args.text.lower(), location=location, exact=False)
+
+    for name in sorted(result):
+        out.write('%s\t%s\n' % (name, ','.join(sorted(result[name]))))
+    return 0 if result else 1
+
+
+def cmd_list(store, args, out):
+    env = store.env
+    if args.location == 'both':
+        names = sorted(set(env.system) | set(env.user))
+    else:
+        names = env.sorted_keys(_location(args.location))
+
+    for name in names:
+        out.write('%s\n' % name)
+    return 0
+
+
+def cmd_shared(store, args, out):
+    for name in store.env.shared_variables():
+        out.write('%s\n' % name)
+    return 0
+
+
+def cmd_which(store, args, out):
+    from .which import ExecutableIndex
+
+    index = ExecutableIndex.from_env(store.env, location=_location(args.location))
+    candidates = index.candidates(args.name)
+    if not candidates:
+        return 1
+
+    if args.all:
+        out.write('%s\n' % candidates[0])
+        for path in candidates[1:]:
+            out.write('%s (shadowed)\n' % path)
+    else:
+        out.write('%s\n' % candidates[0])
+    return 0
+
+
+def write_diff(diff, out, prefix=''):
+    """Write one ``+``, ``-`` or ``~`` line per added, removed or changed variable"""
+    from .envstore import EnvLocation
+
+    names = {EnvLocation.ENV_SYSTEM: 'system', EnvLocation.ENV_USER: 'user'}
+    lines = ([('+', item) for item in diff.added] +
+             [('-', item) for item in diff.removed] +
+             [('~', item) for item in diff.changed])
+    for mark, (location, key) in sorted(lines, key=lambda line: (line[1][1], names[line[1][0]])):
+        out.write('%s%s %s\t%s\n' % (prefix, mark, names[location], key))
+
+
+def cmd_snapshot(store, args, out):
+    import time
+    from .snapshot import SnapshotStore
+
+    with SnapshotStore(args.database) as snapshots:
+        if args.action == 'save':
+            out.write('%d\n' % store.save_snapshot(snapshots, args.label))
+        elif args.action == 'list':
+            for snapshot_id, taken, label in snapshots.snapshots():
+                taken = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken))
+                out.write('%d\t%s\t%s\n' % (snapshot_id, taken, label or ''))
+        else:
+            if not args.ids:
+                sys.stderr.write('enveditor: diff needs at least one snapshot id\n')
+                return 2
+            try:
+                if len(args.ids) == 1:
+                    diff = store.diff_snapshot(snapshots, args.ids[0])
+                else:
+                    diff = snapshots.diff(args.ids[0], args.ids[1])
+            except KeyError as exc:
+                sys.stderr.write('enveditor: no snapshot %s\n' % exc.args[0])
+                return 2
+            write_diff(diff, out)
+            return 1 if diff else 0
+    return 0
+
+
+def cmd_fleet(store, args, out):
+    from .fleet import Fleet
+
+    fleet = Fleet.from_paths(args.paths, max_workers=args.jobs)
+    location = _location(args.location)
+    found = False
+    if args.query == 'defines':
+        for machine in fleet.defines(args.name, location):
+            out.write('%s\n' % machine)
+            out.flush()
+            found = True
+    elif args.query == 'distribution':
+        for value, count in fleet.distribution(args.name, location, args.entries).most_common():
+            out.write('%d\t%s\n' % (count, value))
+            found = True
+    else:
+        for machine, diff in fleet.differences(args.name, location):
+            write_diff(diff, out, '%s\t' % machine)
+            out.flush()
+            found = True
+
+    for machine, error in fleet.errors:
+        sys.stderr.write('enveditor: %s: %s\n' % (machine, error))
+    if args.query == 'diff':
+        return 1 if found else 0
+    return 0 if found else 1
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog='enveditor',
+                                     description='View and edit environment variables. '
+                                                 'Starts the editor when no command is given.')
+    parser.add_argument('--env-file', metavar='PATH',
+                        help='use the variables in a .env file instead of the system environment')
+    commands = parser.add_subparsers(dest='command', metavar='command')
+
+    get = commands.add_parser('get', help='print the value of a variable')
+    get.add_argument('name')
+    get.add_argument('-l', '--location', choices=LOCATIONS, default='both')
+    get.add_argument('-e', '--expanded', action='store_true', help='expand %%VAR%% references')
+    get.set_defaults(func=cmd_get)
+
+    search = commands.add_parser('search', help='list variables whose name contains TEXT')
+    search.add_argument('text')
+    search.add_argument('-l', '--location', choices=LOCATIONS, default='both')
+    search.add_argument('-p', '--prefix', action='store_true', help='match names starting with TEXT')
+    search.set_defaults(func=cmd_search)
+
+    list_ = commands.add_parser('list', help='list variable names')
+    list_.add_argument('-l', '--location', choices=LOCATIONS, default='both')
+    list_.set_defaults(func=cmd_list)
+
+    shared = commands.add_parser('shared', help='list variables defined in both system and user')
+    shared.set_defaults(func=cmd_shared)
+
+    which = commands.add_parser('which', help='print the executable a command resolves to using PATH')
+    which.add_argument('name')
+    which.add_argument('-l', '--location', choices=LOCATIONS, default='both')
+    which.add_argument('-a', '--all', action='store_true', help='also list shadowed executables')
+    which.set_defaults(func=cmd_which)
+
+    snapshot = commands.add_parser('snapshot', help='save, list and diff snapshots in a SQLite database')
+    snapshot.add_argument('database')
+    snapshot.add_argument('action', choices=('save', 'list', 'diff'))
+    snapshot.add_argument('ids', nargs='*', type=int,
+                          help='for diff, one snapshot to compare with the live environment or two to compare')
+    snapshot.add_argument('--label')
+    snapshot.set_defaults(func=cmd_snapshot)
+
+    fleet = commands.add_parser('fleet', help='query environments exported from many machines')
+    fleet.add_argument('query', choices=('defines', 'distribution', 'diff'))
+    fleet.add_argument('name', help='the variable to query, or for diff the baseline export file')
+    fleet.add_argument('paths', nargs='+', metavar='path', help='export files, or directories of them')
+    fleet.add_argument('-l', '--location', choices=LOCATIONS, default='both')
+    fleet.add_argument('-j', '--jobs', type=int, help='number of worker processes')
+    fleet.add_argument('--entries', action='store_true', help='for distribution, count each path entry')
+    fleet.set_defaults(func=cmd_fleet, uses_store=False)
+
+    return parser
+
+
+def main(argv=None, store=None, out=None):
+    """Run the command in `argv` and return the exit status"""
+    args = create_parser().parse_args(argv)
+    out = out or sys.stdout
+
+    if not getattr(args, 'uses_store', True):
+        return args.func(None, args, out)
+
+    if store is None and args.env_file:
+        from .filestore import dotenv_store
+
+        store = dotenv_store(args.env_file)
+
+    if args.command is None:
+        from .editor import EnvEditor
+
+        try:
+            editor = EnvEditor(store)
+        except OSError as exc:
+            sys.stderr.write('enveditor: %s\n' % exc)
+            return 2
+        editor.run()
+        return 0
+
+    if store is None:
+        from .envstore import default_store
+
+        try:
+            store = default_store()
+        except OSError as exc:
+            sys.stderr.write('enveditor: %s\n' % exc)
+            return 2
+    store.update()
+
+    return args.func(store, args, out)
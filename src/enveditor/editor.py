@@ -1,12 +1,23 @@
 """Environment Editor"""
 
+from bisect import bisect_left, insort
 from enum import Enum
 import os.path
 import pprint
+import queue
 import sys
+import threading
 import tkinter as tk
+from tkinter import filedialog
+from tkinter import messagebox
+from tkinter import simpledialog
 from tkinter import ttk
-from .envstore import WindowsEnvStore, EnvLocation
+from .envstore import WindowsEnvStore, EnvLocation, PartialCommitError, default_store
+from .history import History, PersistentList
+from . import instrument
+from .instrument import hot
+from .pathcheck import PathChecker, PathState, is_path_variable
+from . import serialize
 
 
 class AutoScrollbar(ttk.Scrollbar):
@@ -37,14 +48,54 @@ class SelectionMode(Enum):
 
 
 class EnvFrame(tk.PanedWindow):
-    def __init__(self, master, env):
+    # Top level tree nodes: id, label and the location whose keys they hold
+    _NODES = (('system', 'System', EnvLocation.ENV_SYSTEM),
+              ('user', 'User', EnvLocation.ENV_USER),
+              ('common', 'Common', EnvLocation.ENV_BOTH))
+
+    _MODES = {EnvLocation.ENV_SYSTEM: SelectionMode.MODE_SYSTEM,
+              EnvLocation.ENV_USER: SelectionMode.MODE_USER,
+              EnvLocation.ENV_BOTH: SelectionMode.MODE_COMMON}
+
+    # Listbox items inserted straight away, and then by each call scheduled with after()
+    _LISTBOX_FIRST = 200
+    _LISTBOX_CHUNK = 1000
+
+    # Milliseconds after the last keystroke before the filter is applied
+    _FILTER_DELAY = 150
+
+    # Milliseconds between checks for path analysis results
+    _PATH_POLL_INTERVAL = 50
+    _PATH_COLOURS = {PathState.MISSING: 'red3',
+                     PathState.NOT_DIRECTORY: 'red3',
+                     PathState.UNREACHABLE: 'gray50',
+                     PathState.DUPLICATE: 'dark orange',
+                     PathState.EMPTY: 'gray50'}
+
+    def __init__(self, master, store, history_depth=100):
         super().__init__(master, orient=tk.HORIZONTAL)
         self._master = master
-        self._env = env
-        self._tv_ids_system = {}
-        self._tv_ids_user = {}
-        self._tv_ids_shared = {}
+        self._store = store
+        self._env = store.env
+        self._history = History(store, history_depth)
+        self._select_row = None
+        self._tv_items = {}
+        self._views = {}
+        self._populated = set()
+        self._render_job = None
+        # Only Windows, which separates paths with ';', has case-insensitive paths
+        self._path_checker = PathChecker(casefold=self._env.pathsep == ';')
+        self._path_results = queue.Queue()
+        self._path_checks = 0
+        self._listbox_token = 0
+        self._annotations = {}
         self._button_ids = {}
+        self._filter = ''
+        self._filter_values = None
+        self._filter_results = {}
+        self._filter_job = None
+        self._editable = True
+        self._index = None
 
         self._tv = None
         self._mode = SelectionMode.MODE_NONE
@@ -57,26 +108,255 @@ class EnvFrame(tk.PanedWindow):
         self.rowconfigure(0, weight=1)
         self.grid(row=0, column=0, sticky=tk.NSEW)
 
+    @hot('EnvFrame._update_treeview')
     def _update_treeview(self):
-        system = self._tv.insert('', 'end', 'system', text='System')
-        user = self._tv.insert('', 'end', 'user', text='User')
-        common = self._tv.insert('', 'end', 'common', text='Common')
-
-        for key in sorted(list(self._env.system.keys())):
-            _id = self._tv.insert(system, 'end', text=key)
-            self._tv_ids_system[_id] = key
+        """Create the top level nodes; their children are inserted when a node is first opened"""
+        for node, text, location in self._NODES:
+            if not self._tv.exists(node):
+                self._tv.insert('', 'end', node, text=text)
+            self._update_placeholder(node, location)
+
+    def set_loading(self, locations):
+        """Mark the nodes for the locations in `locations` as still loading"""
+        for node, text, location in self._NODES:
+            if location == EnvLocation.ENV_BOTH:
+                loading = bool(locations)
+            else:
+                loading = location in locations
+            if loading:
+                text = '%s (loading...)' % text
+            self._tv.item(node, text=text)
+
+        # Edits are written back to the store, so they wait until every location has been read
+        editable = not locations
+        if editable != self._editable:
+            self._editable = editable
+            if editable:
+                self._tv_click()
+            else:
+                self._disable_all_buttons()
 
-        for key in sorted(list(self._env.user.keys())):
-            _id = self._tv.insert(user, 'end', text=key)
-            self._tv_ids_user[_id] = key
+    @property
+    def editable(self):
+        return self._editable
+
+    def _update_placeholder(self, node, location):
+        # An unpopulated node holds a single placeholder child so that it can be opened
+        if node in self._populated:
+            return
+
+        placeholder = '%s:' % node
+        has_keys = bool(self._node_keys(node, location))
+        if has_keys and not self._tv.exists(placeholder):
+            self._tv.insert(node, 'end', placeholder, text='...')
+        elif not has_keys and self._tv.exists(placeholder):
+            self._tv.delete(placeholder)
+
+    @hot('EnvFrame._populate_node')
+    def _populate_node(self, node, location):
+        placeholder = '%s:' % node
+        if self._tv.exists(placeholder):
+            self._tv.delete(placeholder)
+
+        items = self._tv_items
+        for key in self._node_keys(node, location):
+            _id = self._tv.insert(node, 'end', self._item_id(node, key), text=key)
+            items[_id] = (location, key)
+
+        self._populated.add(node)
+
+    def _node_keys(self, node, location):
+        # The sorted keys shown under a node: the filter's matches while a filter is set
+        if self._filter:
+            return self._filter_results[node]
+        return self._env.sorted_keys(location)
+
+    def _item_id(self, node, key):
+        return '%s:%s' % (node, key)
+
+    def _tv_open(self, event=None):
+        node = self._tv.focus()
+        for _node, _text, location in self._NODES:
+            if node == _node and node not in self._populated:
+                self._populate_node(node, location)
+
+    @hot('EnvFrame.refresh')
+    def refresh(self, diff):
+        """Update the tree rows and cached views affected by an :class:`~enveditor.envstore.EnvDiff`"""
+        for key in diff.keys():
+            self._views.pop((EnvLocation.ENV_SYSTEM, key), None)
+            self._views.pop((EnvLocation.ENV_USER, key), None)
+            self._views.pop((EnvLocation.ENV_BOTH, key), None)
+        self._update_index(diff)
+
+        for node, _text, location in self._NODES:
+            if location == EnvLocation.ENV_BOTH:
+                keys = diff.keys()
+            else:
+                keys = diff.keys(location)
+            if not keys:
+                continue
+
+            if self._filter:
+                self._refilter(node, location, keys)
+
+            if node not in self._populated:
+                self._update_placeholder(node, location)
+                continue
+
+            items = self._tv_items
+            sorted_keys = self._node_keys(node, location)
+            for key in sorted(keys):
+                _id = self._item_id(node, key)
+                idx = bisect_left(sorted_keys, key)
+                present = idx < len(sorted_keys) and sorted_keys[idx] == key
+                shown = _id in items
+                if present and not shown:
+                    self._tv.insert(node, idx, _id, text=key)
+                    items[_id] = (location, key)
+                elif shown and not present:
+                    self._tv.delete(_id)
+                    del items[_id]
+
+        focus = self._tv.focus()
+        if focus in self._tv_items and self._tv_items[focus][1] in diff.keys():
+            self._tv_click()
+        elif focus and not self._tv.exists(focus):
+            self._listbox.delete(0, tk.END)
+
+    def _update_index(self, diff):
+        # Keep a built index in step with PATH; set_path only rescans the directories which moved
+        if self._index is None:
+            return
+        if 'pathext' in diff.keys():
+            self._index = None
+        else:
+            from .which import path_directories
+            self._index.set_path(path_directories(self._env))
+
+    def executable_index(self):
+        """Return the :class:`~enveditor.which.ExecutableIndex` of the system and user PATH, building it on first use"""
+        if self._index is None:
+            from .which import ExecutableIndex
+            self._index = ExecutableIndex.from_env(self._env)
+        else:
+            self._index.refresh()
+        return self._index
+
+    def which(self):
+        """Ask for a command name and show the executable it resolves to and the copies it shadows"""
+        if not self._editable:
+            return
+        name = simpledialog.askstring('Which Command', 'Command:', parent=self)
+        if not name:
+            return
+
+        candidates = self.executable_index().candidates(name)
+        if not candidates:
+            text = '%s was not found on the PATH' % name
+        elif len(candidates) == 1:
+            text = candidates[0]
+        else:
+            text = '%s\n\nShadowed:\n%s' % (candidates[0], '\n'.join(candidates[1:]))
+        messagebox.showinfo('Which Command', text, parent=self)
+
+    def _refilter(self, node, location, keys):
+        # Add and remove changed keys in a node's filter results without searching the whole location
+        results = self._filter_results[node]
+        for key in keys:
+            idx = bisect_left(results, key)
+            present = idx < len(results) and results[idx] == key
+            matches = bool(self._env.search(self._filter, location, self._filter_values, within=(key,)))
+            if matches and not present:
+                insort(results, key)
+            elif present and not matches:
+                del results[idx]
+
+    def set_filter(self, text, values=False):
+        """Show only the variables whose name, or with `values` whose value, contains `text`.
+
+        When `text` extends the previous filter only the previous matches
+        are searched again.
+        """
+        text = text.strip().lower()
+        refine = bool(self._filter) and self._filter in text and values == self._filter_values
+        previous = self._filter_results
+        if text:
+            self._filter_results = {
+                node: self._env.search(text, location, values, within=previous[node] if refine else None)
+                for node, _text, location in self._NODES}
+        else:
+            self._filter_results = {}
+        self._filter = text
+        self._filter_values = values
 
-        for key in sorted(list(self._env.shared_variables())):
-            _id = self._tv.insert(common, 'end', text=key)
-            self._tv_ids_shared[_id] = key
+        for node, _text, location in self._NODES:
+            if node in self._populated:
+                self._show_keys(node, location, self._node_keys(node, location))
+            else:
+                self._update_placeholder(node, location)
+
+        focus = self._tv.focus()
+        if focus and not self._tv.exists(focus):
+            self._cancel_render()
+            self._listbox.delete(0, tk.END)
+
+    def _show_keys(self, node, location, keys):
+        # Make the rows under a populated node exactly `keys`, touching only the rows which change
+        items = self._tv_items
+        wanted = set(keys)
+        shown = set()
+        removed = []
+        for _id in self._tv.get_children(node):
+            key = items[_id][1]
+            if key in wanted:
+                shown.add(key)
+            else:
+                removed.append(_id)
+
+        if removed:
+            self._tv.delete(*removed)
+            for _id in removed:
+                del items[_id]
+
+        for idx, key in enumerate(keys):
+            if key not in shown:
+                _id = self._tv.insert(node, idx, self._item_id(node, key), text=key)
+                items[_id] = (location, key)
+
+    def _filter_changed(self, *args):
+        if self._filter_job is not None:
+            self.after_cancel(self._filter_job)
+        self._filter_job = self.after(self._FILTER_DELAY, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_job = None
+        self.set_filter(self._filter_text.get(), self._filter_values_var.get())
+
+    def _view(self, location, key):
+        """Return the values shown for `key` in `location`, keyed by 'system' and 'user'"""
+        view = self._views.get((location, key))
+        if view is None:
+            view = self._views[(location, key)] = self._env.get(key, location=location, exact=True).get(key, {})
+        return view
 
     def _create_left_frame(self):
         _left = tk.Frame(self)
 
+        _filter_frame = tk.Frame(_left)
+        self._filter_text = tk.StringVar(self)
+        self._filter_values_var = tk.BooleanVar(self, value=False)
+        _filter_entry = ttk.Entry(_filter_frame, textvariable=self._filter_text)
+        _filter_entry.grid(row=0, column=0, sticky=tk.EW)
+        # Building the indexes takes a moment for large environments, so do it before the first keystroke
+        _filter_entry.bind('<FocusIn>', lambda event: self._env.build_indexes())
+        _filter_values = ttk.Checkbutton(_filter_frame, text='Values', variable=self._filter_values_var,
+                                         command=self._filter_changed)
+        _filter_values.grid(row=0, column=1, sticky=tk.E, padx=(4,0))
+        _filter_frame.columnconfigure(0, weight=1)
+        _filter_frame.grid(row=0, column=0, sticky=tk.EW, padx=(4,4), pady=(2,2))
+        self._filter_text.trace_add('write', self._filter_changed)
+
         _tv_frame = tk.Frame(_left)
         self._tv = ttk.Treeview(_tv_frame)
         self._tv.heading('#0', text="Environment Variables", anchor=tk.W)
@@ -91,32 +371,35 @@ class EnvFrame(tk.PanedWindow):
         self._tv.grid(row=0, column=0, sticky=tk.NSEW)
         _tv_vsb.grid(row=0, column=1, sticky=(tk.NS, tk.E))
 
-        _tv_frame.grid(row=0, column=0, sticky=tk.NSEW, padx=(4,4), pady=(2,2))
+        _tv_frame.grid(row=1, column=0, sticky=tk.NSEW, padx=(4,4), pady=(2,2))
         _tv_frame.rowconfigure(0, weight=1)
         _tv_frame.rowconfigure(1, weight=0)
         _tv_frame.columnconfigure(0, weight=1)
         _tv_frame.columnconfigure(1, weight=0)
 
         _tv_button_frame = tk.Frame(_left)
-        btn = ttk.Button(_tv_button_frame, text='Add', state='disabled')
+        btn = ttk.Button(_tv_button_frame, text='Add', command=self._btn_add_variable, state='disabled')
         btn.grid(row=0, column=0, sticky=tk.W)
         self._button_ids['add_variable'] = btn
-        btn = ttk.Button(_tv_button_frame, text='Delete', state='disabled')
+        btn = ttk.Button(_tv_button_frame, text='Delete', command=self._btn_delete_variable, state='disabled')
         btn.grid(row=0, column=1, sticky=tk.W)
         self._button_ids['delete_variable'] = btn
-        _tv_button_frame.grid(row=1, column=0, sticky=tk.W, padx=(4,4), pady=(2,2))
+        _tv_button_frame.grid(row=2, column=0, sticky=tk.W, padx=(4,4), pady=(2,2))
         _tv_button_frame.columnconfigure(0, weight=1)
 
         _left.configure(width=200)
         _left.columnconfigure(0, weight=1)
-        _left.rowconfigure(0, weight=1)
-        _left.rowconfigure(1, weight=0)
+        _left.rowconfigure(0, weight=0)
+        _left.rowconfigure(1, weight=1)
+        _left.rowconfigure(2, weight=0)
         _left.grid(row=0, column=0, sticky=(tk.NS, tk.W))
 
         self.add(_left, stretch='never')
         self.paneconfigure(_left, minsize=200)
 
-        self._tv.bind('<<TreeviewSelect>>', self._tv_click)
+        # Look the handler up on each event so that it is timed once instrumentation is enabled
+        self._tv.bind('<<TreeviewSelect>>', lambda event: self._tv_click(event))
+        self._tv.bind('<<TreeviewOpen>>', self._tv_open)
 
     def _create_right_frame(self):
         _right = tk.Frame(self)
@@ -173,6 +456,8 @@ class EnvFrame(tk.PanedWindow):
         self._create_right_frame()
 
     def _enable_button_by_id(self, id_):
+        if not self._editable:
+            return
         self._master.nametowidget(id_).configure(state='enabled')
 
     def _disable_button_by_id(self, id_):
@@ -225,64 +510,136 @@ class EnvFrame(tk.PanedWindow):
     def _mode_none(self):
         self._disable_all_buttons()
 
+    @hot('EnvFrame._tv_click')
     def _tv_click(self, event=None):
+        self._cancel_render()
         self._listbox.delete(0, tk.END)
         _id = self._tv.focus()
         self._disable_button_by_name('move_up')
         self._disable_button_by_name('move_down')
-        value = None
-        key = self._tv_ids_shared.get(_id, None)
-        if key:
-            env_values = self._env.get(key, location=EnvLocation.ENV_BOTH, exact=True)
-            value = list(env_values.values())[0]
-            self._mode = SelectionMode.MODE_COMMON
-            self._mode_common()
-            self._update_listbox(value, show_location=True)
-        else:
-            key = self._tv_ids_system.get(_id, None)
-            if key:
-                env_values = self._env.get(key, location=EnvLocation.ENV_SYSTEM, exact=True)
-                value = list(env_values.values())[0]
-                self._mode = SelectionMode.MODE_SYSTEM
-                self._mode_variable()
-                self._update_listbox(value)
+        item = self._tv_items.get(_id)
+        if item is not None:
+            location, key = item
+            value = self._view(location, key)
+            self._mode = self._MODES[location]
+            if location == EnvLocation.ENV_BOTH:
+                self._mode_common()
+                self._update_listbox(key, value, show_location=True)
             else:
-                key = self._tv_ids_user.get(_id, None)
-                if key:
-                    env_values = self._env.get(key, location=EnvLocation.ENV_USER, exact=True)
-                    value = list(env_values.values())[0]
-                    self._mode = SelectionMode.MODE_USER
-                    self._mode_variable()
-                    self._update_listbox(value)
-                else:
-                    if _id == 'common':
-                        self._mode = SelectionMode.MODE_COMMON
-                        self._disable_all_buttons()
-                    elif _id == 'system':
-                        self._mode = SelectionMode.MODE_SYSTEM
-                        self._enable_button_by_name('add_variable')
-                        self._disable_button_by_name('delete_variable')
-                    elif _id == 'user':
-                        self._mode = SelectionMode.MODE_USER
-                        self._enable_button_by_name('add_variable')
-                        self._disable_button_by_name('delete_variable')
-
-    def _update_listbox(self, value, show_location=False):
-        _prefixes = {'system': 'S:', 'user': 'U:'}
-
+                self._mode_variable()
+                self._update_listbox(key, value)
+        elif _id == 'common':
+            self._mode = SelectionMode.MODE_COMMON
+            self._disable_all_buttons()
+        elif _id == 'system':
+            self._mode = SelectionMode.MODE_SYSTEM
+            self._enable_button_by_name('add_variable')
+            self._disable_button_by_name('delete_variable')
+        elif _id == 'user':
+            self._mode = SelectionMode.MODE_USER
+            self._enable_button_by_name('add_variable')
+            self._disable_button_by_name('delete_variable')
+
+    @hot('EnvFrame._update_listbox')
+    def _update_listbox(self, name, value, show_location=False):
+        self._cancel_render()
         self._listbox.delete(0, tk.END)
+        self._listbox_token += 1
+        self._annotations = {}
+        self._render_listbox(self._listbox_items(value, show_location), 0, self._LISTBOX_FIRST)
+        self._check_paths(name, value)
+
+    def _check_paths(self, name, value):
+        """Analyse the entries of path variables in the background and colour problem rows"""
+        rows = []
+        entries = []
+        expanded = []
+        row = 0
+        for _location, key in value.items():
+            if isinstance(key.value, list) and is_path_variable(name, key.entries):
+                paths = key.expanded if isinstance(key.expanded, list) else key.value
+                # An entry such as %PATH% expands to several directories, which share its row
+                for entry, path in zip(key.value, paths):
+                    for directory in path.split(self._env.pathsep):
+                        rows.append(row)
+                        entries.append(entry)
+                        expanded.append(directory)
+                    row += 1
+            else:
+                row += 1
+
+        if not entries:
+            return
+
+        token = self._listbox_token
+        self._path_checker.check_async(entries,
+                                       lambda statuses: self._path_results.put((token, rows, statuses)),
+                                       expanded)
+        self._path_checks += 1
+        if self._path_checks == 1:
+            self.after(self._PATH_POLL_INTERVAL, self._poll_path_results)
+
+    def _poll_path_results(self):
+        try:
+            while True:
+                token, rows, statuses = self._path_results.get_nowait()
+                self._path_checks -= 1
+                if token != self._listbox_token:
+                    continue
+                for status in statuses:
+                    if status.state != PathState.OK:
+                        self._annotations.setdefault(rows[status.index], self._PATH_COLOURS[status.state])
+                self._annotate(0, self._listbox.size())
+        except queue.Empty:
+            pass
+
+        if self._path_checks:
+            self.after(self._PATH_POLL_INTERVAL, self._poll_path_results)
+
+    def _annotate(self, start, end):
+        for row, colour in self._annotations.items():
+            if start <= row < end:
+                self._listbox.itemconfigure(row, foreground=colour)
+
+    def _listbox_items(self, value, show_location):
+        _prefixes = {'system': 'S: ', 'user': 'U: '}
+
+        items = []
         for _location, key in value.items():
-            if isinstance(key.value, list):
-                for item in key.value:
-                    if show_location:
-                        item = '%s %s' % (_prefixes[_location], item)
-                    self._listbox.insert(tk.END, item)
+            elements = key.value if isinstance(key.value, list) else [key.value]
+            if show_location:
+                prefix = _prefixes[_location]
+                items.extend(['%s%s' % (prefix, item) for item in elements])
             else:
-                if show_location:
-                    item = '%s %s' % (_prefixes[_location], key.value)
-                else:
-                    item = key.value
-                self._listbox.insert(tk.END, item)
+                items.extend(elements)
+        return items
+
+    def _render_listbox(self, items, start, count):
+        """Insert `count` items from `start` in a single call and schedule the rest in chunks"""
+        end = start + count
+        self._listbox.insert(tk.END, *items[start:end])
+        if self._annotations:
+            self._annotate(start, end)
+        if self._select_row is not None and self._select_row < self._listbox.size():
+            self._select_listbox_row(self._select_row)
+            self._select_row = None
+        if end < len(items):
+            self._render_job = self.after(1, self._render_listbox, items, end, self._LISTBOX_CHUNK)
+        else:
+            self._render_job = None
+            self._select_row = None
+
+    def _select_listbox_row(self, row):
+        self._listbox.selection_clear(0, tk.END)
+        self._listbox.selection_set(row)
+        self._listbox.activate(row)
+        self._listbox.see(row)
+        self._variable_select()
+
+    def _cancel_render(self):
+        if self._render_job is not None:
+            self.after_cancel(self._render_job)
+            self._render_job = None
 
     def _listbox_select(self, event=None):
         if self._mode == SelectionMode.MODE_USER or self._mode == SelectionMode.MODE_SYSTEM:
@@ -315,26 +672,229 @@ class EnvFrame(tk.PanedWindow):
             self._disable_button_by_name('move_up')
             self._disable_button_by_name('move_down')
 
+    @property
+    def history(self):
+        return self._history
+
+    def close(self):
+        """Stop the background path checks"""
+        self._path_checker.close()
+
+    def undo(self):
+        self._apply(self._history.undo)
+
+    def redo(self):
+        self._apply(self._history.redo)
+
+    def _apply(self, edit, *args):
+        """Run a :class:`~enveditor.history.History` method and refresh the rows its diff affects"""
+        if not self._editable:
+            return None
+        try:
+            diff = edit(*args)
+        except OSError as exc:
+            messagebox.showerror('Environment Editor', 'Unable to save the change: %s' % exc, parent=self)
+            self._select_row = None
+            if isinstance(exc, PartialCommitError):
+                self.refresh(exc.diff)
+            return None
+        self.refresh(diff)
+        return diff
+
+    def _selected_variable(self):
+        # Return the location, name and state of the variable shown in the listbox, or None
+        item = self._tv_items.get(self._tv.focus())
+        if item is None or item[0] == EnvLocation.ENV_BOTH:
+            return None
+        location, key = item
+        state = self._history.state(location, key)
+        if state is None:
+            return None
+        return location, self._store.name(location, key), state[0]
+
+    def _selected_row(self):
+        selection = self._listbox.curselection()
+        return int(selection[0]) if selection else None
+
+    def _edit_value(self, location, name, value, row=None):
+        self._select_row = row
+        self._apply(self._history.apply, location, name, value)
 
     def _btn_add(self):
-        pass
+        selected = self._selected_variable()
+        if selected is None:
+            return
+        location, name, value = selected
+        text = simpledialog.askstring('Add', 'Value to add to %s:' % name, parent=self)
+        if text is None:
+            return
+
+        row = self._selected_row()
+        if isinstance(value, PersistentList):
+            row = len(value) if row is None else row + 1
+            self._edit_value(location, name, value.insert(row, text), row)
+        elif value:
+            self._edit_value(location, name, PersistentList([value, text]), 1)
+        else:
+            self._edit_value(location, name, text, 0)
 
     def _btn_edit(self):
-        pass
+        selected = self._selected_variable()
+        row = self._selected_row()
+        if selected is None or row is None:
+            return
+        location, name, value = selected
+        multi = isinstance(value, PersistentList)
+        text = simpledialog.askstring('Edit', 'Value of %s:' % name, parent=self,
+                                      initialvalue=value[row] if multi else value)
+        if text is None:
+            return
+        self._edit_value(location, name, value.set(row, text) if multi else text, row)
 
     def _btn_delete(self):
-        pass
+        selected = self._selected_variable()
+        row = self._selected_row()
+        if selected is None or row is None:
+            return
+        location, name, value = selected
+        if isinstance(value, PersistentList):
+            self._edit_value(location, name, value.delete(row), max(min(row, len(value) - 2), 0))
+        else:
+            self._edit_value(location, name, '')
 
     def _btn_move_up(self):
-        pass
+        self._move(-1)
 
     def _btn_move_down(self):
-        pass
+        self._move(1)
+
+    def _move(self, offset):
+        selected = self._selected_variable()
+        row = self._selected_row()
+        if selected is None or row is None:
+            return
+        location, name, value = selected
+        if isinstance(value, PersistentList) and 0 <= row + offset < len(value):
+            self._edit_value(location, name, value.move(row, row + offset), row + offset)
+
+    def _btn_add_variable(self):
+        if self._mode in (SelectionMode.MODE_SYSTEM, SelectionMode.MODE_USER):
+            self.add_variable()
+
+    def add_variable(self, location=None):
+        """Ask for the name and value of a new variable and add it to `location`.
+
+        `location` defaults to the location selected in the tree, or to the
+        user variables if neither location is selected.
+        """
+        if not self._editable:
+            return
+        if location is None:
+            location = EnvLocation.ENV_SYSTEM if self._mode == SelectionMode.MODE_SYSTEM else EnvLocation.ENV_USER
+        node = 'system' if location == EnvLocation.ENV_SYSTEM else 'user'
+
+        name = simpledialog.askstring('Add Variable', 'Name:', parent=self)
+        if not name:
+            return
+        if name.lower() in self._env.variables(location):
+            messagebox.showerror('Add Variable', '%s already exists' % name, parent=self)
+            return
+        value = simpledialog.askstring('Add Variable', 'Value of %s:' % name, parent=self)
+        if value is None:
+            return
+
+        if self._apply(self._history.apply, location, name, value):
+            _id = self._item_id(node, name.lower())
+            if self._tv.exists(_id):
+                self._tv.selection_set(_id)
+                self._tv.focus(_id)
+                self._tv.see(_id)
+
+    def _btn_delete_variable(self):
+        item = self._tv_items.get(self._tv.focus())
+        if item is None or item[0] == EnvLocation.ENV_BOTH:
+            return
+        location, key = item
+        name = self._store.name(location, key)
+        if messagebox.askyesno('Delete Variable', 'Delete %s?' % name, parent=self):
+            self._apply(self._history.apply, location, name, None)
+
+
+class TimingsDialog(tk.Toplevel):
+    """Shows the calls recorded by :mod:`~enveditor.instrument` for each hot function"""
+
+    _COLUMNS = (('count', 'Calls', 'count'),
+                ('total', 'Total ms', 'total_ns'),
+                ('mean', 'Mean ms', 'mean_ns'),
+                ('p50', 'p50 ms', 'p50_ns'),
+                ('p95', 'p95 ms', 'p95_ns'),
+                ('max', 'Max ms', 'max_ns'))
+
+    def __init__(self, master):
+        super().__init__(master)
+        self.title('Timings')
+        self.transient(master)
+
+        self._tv = ttk.Treeview(self, columns=[column for column, _text, _key in self._COLUMNS])
+        self._tv.heading('#0', text='Function', anchor=tk.W)
+        self._tv.column('#0', width=220)
+        for column, text, _key in self._COLUMNS:
+            self._tv.heading(column, text=text, anchor=tk.E)
+            self._tv.column(column, width=80, anchor=tk.E)
+        self._tv.grid(row=0, column=0, sticky=tk.NSEW, padx=4, pady=4)
+
+        _button_frame = tk.Frame(self)
+        ttk.Button(_button_frame, text='Refresh', command=self.refresh).grid(row=0, column=0, padx=2)
+        ttk.Button(_button_frame, text='Reset', command=self._reset).grid(row=0, column=1, padx=2)
+        ttk.Button(_button_frame, text='Save JSON...', command=self._save).grid(row=0, column=2, padx=2)
+        ttk.Button(_button_frame, text='Close', command=self.destroy).grid(row=0, column=3, padx=2)
+        _button_frame.grid(row=1, column=0, sticky=tk.E, padx=4, pady=4)
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.refresh()
+
+    def refresh(self):
+        self._tv.delete(*self._tv.get_children())
+        for name, data in instrument.snapshot().items():
+            values = [data['count']]
+            values.extend('%.3f' % (data[key] / 1e6) for _column, _text, key in self._COLUMNS[1:])
+            self._tv.insert('', 'end', text=name, values=values)
+
+    def _reset(self):
+        instrument.reset()
+        self.refresh()
+
+    def _save(self):
+        path = filedialog.asksaveasfilename(parent=self, title='Save Timings',
+                                            filetypes=(('JSON', '*.json'),), defaultextension='.json')
+        if path:
+            try:
+                instrument.dump(path)
+            except OSError as exc:
+                messagebox.showerror('Timings', 'Unable to save %s: %s' % (path, exc), parent=self)
 
 
 class EnvEditor():
-    def __init__(self):
+    # Milliseconds between checks for results from background work
+    _POLL_INTERVAL = 50
+
+    # Milliseconds between checks for changes found by the store watcher
+    _WATCH_POLL_INTERVAL = 250
+
+    # Number of edits which can be undone
+    _HISTORY_DEPTH = 100
+
+    _FILE_TYPES = (('JSON Lines', '*.jsonl'), ('Environment file', '*.env'), ('Registry file', '*.reg'))
+
+    def __init__(self, store=None):
+        """Edit the variables in `store`, which defaults to the platform's store from :func:`default_store`"""
+        self._store = store if store is not None else default_store()
         self._root = tk.Tk()
+        self._queue = queue.Queue()
+        self._changes = queue.Queue()
+        self._loading = set()
+        self._watcher = None
         self._create_menu()
 
         bitmap_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'favicon.gif')
@@ -342,20 +902,21 @@ class EnvEditor():
             img = tk.PhotoImage(file=bitmap_path)
             self._root.iconphoto(True, img)
 
-        if sys.platform == 'win32':
-            self._store = WindowsEnvStore()
+        if isinstance(self._store, WindowsEnvStore):
             self._root.title('Windows Environment Editor')
+        else:
+            self._root.title('Environment Editor')
 
         self._frame = None
 
     def run(self):
-        self._store.update()
-
-        self._frame = EnvFrame(self._root, self._store.env)
+        self._frame = EnvFrame(self._root, self._store, self._HISTORY_DEPTH)
         self._frame.grid(row=0, column=0, sticky=tk.NSEW)
+        self._start_loading()
 
         self._root.columnconfigure(0, weight=1)
         self._root.rowconfigure(0, weight=1)
+        self._root.protocol('WM_DELETE_WINDOW', self._command_exit)
 
         width = int(self._root.winfo_screenwidth() / 2)
         height = int(self._root.winfo_screenheight() / 2)
@@ -363,6 +924,65 @@ class EnvEditor():
         self._root.geometry('%dx%d+%d+%d' % (width, height, width/2, height/2))
         self._root.mainloop()
 
+    def _start_loading(self):
+        """Read the store on a worker thread; each location is applied on the Tk thread as it arrives"""
+        self._loading = set(self._store.locations)
+        self._frame.set_loading(self._loading)
+        self._update_file_menu()
+
+        thread = threading.Thread(target=self._load, args=(self._queue,), daemon=True)
+        thread.start()
+        self._root.after(self._POLL_INTERVAL, self._poll_queue)
+
+    def _load(self, results):
+        # Runs on the worker thread and must not touch the Env or any widgets
+        for location in self._store.locations:
+            try:
+                results.put((location, self._store.read(location), None))
+            except Exception as exc:
+                results.put((location, None, exc))
+
+    def _poll_queue(self):
+        try:
+            while True:
+                location, values, error = self._queue.get_nowait()
+                self._loading.discard(location)
+                if error is not None:
+                    messagebox.showerror('Environment Editor',
+                                         'Unable to read the environment: %s' % error)
+                elif values is not None:
+                    self._frame.refresh(self._store.env.replace(location, values))
+                self._frame.set_loading(self._loading)
+                self._update_file_menu()
+        except queue.Empty:
+            pass
+
+        if self._loading:
+            self._root.after(self._POLL_INTERVAL, self._poll_queue)
+        else:
+            self._start_watching()
+
+    def _start_watching(self):
+        """Watch the store for changes made by other programs and apply them on the Tk thread"""
+        if self._watcher is None:
+            self._watcher = self._store.watch(self._frame.refresh, dispatch=self._changes.put)
+            self._root.after(self._WATCH_POLL_INTERVAL, self._poll_changes)
+
+    def _poll_changes(self):
+        try:
+            while True:
+                update = self._changes.get_nowait()
+                try:
+                    update()
+                except Exception as exc:
+                    messagebox.showerror('Environment Editor',
+                                         'Unable to read the changed environment: %s' % exc)
+        except queue.Empty:
+            pass
+        finally:
+            if self._watcher is not None:
+                self._root.after(self._WATCH_POLL_INTERVAL, self._poll_changes)
+
     def _create_menu(self):
         if 'win32' in sys.platform:
             first_label = 'File'
@@ -372,7 +992,11 @@ class EnvEditor():
             quit_label = 'Exit'
             quit_underline = 1
             quit_accel = 'Alt + F4'
+            undo_accel = 'Ctrl + Z'
+            redo_accel = 'Ctrl + Y'
             self._root.bind_all('<Control-Key-n>', self._command_new)
+            self._root.bind_all('<Control-Key-z>', self._command_undo)
+            self._root.bind_all('<Control-Key-y>', self._command_redo)
         elif 'darwin' in sys.platform:
             first_label = 'Env Editor'
             first_underline = -1
@@ -381,7 +1005,11 @@ class EnvEditor():
             quit_label = 'Quit'
             quit_underline = 0
             quit_accel = 'Cmd + Q'
+            undo_accel = 'Cmd + Z'
+            redo_accel = 'Cmd + Shift + Z'
             self._root.bind_all('<Command-n>', self._command_new)
+            self._root.bind_all('<Command-z>', self._command_undo)
+            self._root.bind_all('<Command-Z>', self._command_redo)
         elif 'linux' in sys.platform:
             first_label = 'File'
             first_underline = 0
@@ -390,10 +1018,15 @@ class EnvEditor():
             quit_label = 'Quit'
             quit_underline = 0
             quit_accel = 'Ctrl + Q'
+            undo_accel = 'Ctrl + Z'
+            redo_accel = 'Ctrl + Y'
             self._root.bind_all('<Control-Key-n>', self._command_new)
+            self._root.bind_all('<Control-Key-z>', self._command_undo)
+            self._root.bind_all('<Control-Key-y>', self._command_redo)
 
         menu = tk.Menu(self._root, tearoff=False)
         menu_file = tk.Menu(menu, tearoff=False)
+        self._menu_file = menu_file
 
         menu_file.add_command(label='New Variable...', command=self._command_new, accelerator=new_accel, underline=new_underline)
 
@@ -404,16 +1037,97 @@ class EnvEditor():
             menu.add_cascade(label=first_label, underline=first_underline, menu=menu_file)
         else:
             menu.add_cascade(label=first_label, menu=menu_file)
+
+        self._menu_edit = tk.Menu(menu, tearoff=False, postcommand=self._update_edit_menu)
+        self._menu_edit.add_command(label='Undo', command=self._command_undo, accelerator=undo_accel, underline=0)
+        self._menu_edit.add_command(label='Redo', command=self._command_redo, accelerator=redo_accel, underline=0)
+        self._menu_edit.add_separator()
+        self._menu_edit.add_command(label='Which Command...', command=self._command_which, underline=0)
+        menu.add_cascade(label='Edit', underline=0, menu=self._menu_edit)
+
+        self._instrumented = tk.BooleanVar(self._root, value=instrument.enabled())
+        menu_debug = tk.Menu(menu, tearoff=False)
+        menu_debug.add_checkbutton(label='Record Timings', variable=self._instrumented,
+                                   command=self._command_instrument, underline=0)
+        menu_debug.add_command(label='Timings...', command=self._command_timings, underline=0)
+        menu.add_cascade(label='Debug', underline=0, menu=menu_debug)
         self._root.configure(menu=menu)
 
+    def _editable(self):
+        # Commands which read or write the whole store are unavailable until the loaded Env has been applied
+        return self._frame is not None and self._frame.editable and not self._loading
+
+    def _update_file_menu(self):
+        state = 'normal' if self._editable() else 'disabled'
+        for label in ('New Variable...', 'Import', 'Export'):
+            self._menu_file.entryconfigure(label, state=state)
+
+    def _update_edit_menu(self):
+        history = self._frame.history if self._editable() else None
+        for label, enabled in (('Undo', history is not None and history.can_undo),
+                               ('Redo', history is not None and history.can_redo)):
+            self._menu_edit.entryconfigure(label, state='normal' if enabled else 'disabled')
+        self._menu_edit.entryconfigure('Which Command...', state='normal' if self._editable() else 'disabled')
+
     def _command_new(self, event=None):
-        print('New')
+        if self._frame is not None:
+            self._frame.add_variable()
+
+    def _command_undo(self, event=None):
+        if self._frame is not None:
+            self._frame.undo()
+
+    def _command_redo(self, event=None):
+        if self._frame is not None:
+            self._frame.redo()
+
+    def _command_which(self, event=None):
+        if self._editable():
+            self._frame.which()
+
+    def _command_instrument(self, event=None):
+        if self._instrumented.get():
+            instrument.enable()
+        else:
+            instrument.disable()
+
+    def _command_timings(self, event=None):
+        TimingsDialog(self._root)
 
     def _command_import(self, event=None):
-        print('Import')
+        if not self._editable():
+            return
+        path = filedialog.askopenfilename(parent=self._root, title='Import Environment',
+                                          filetypes=self._FILE_TYPES)
+        if not path:
+            return
+
+        try:
+            diff = serialize.import_store(self._store, path)
+        except (OSError, ValueError) as exc:
+            messagebox.showerror('Import', 'Unable to import %s: %s' % (path, exc), parent=self._root)
+            if isinstance(exc, PartialCommitError):
+                self._frame.refresh(exc.diff)
+            return
+        self._frame.refresh(diff)
 
     def _command_export(self, event=None):
-        print('Export')
+        if not self._editable():
+            return
+        path = filedialog.asksaveasfilename(parent=self._root, title='Export Environment',
+                                            filetypes=self._FILE_TYPES, defaultextension='.jsonl')
+        if not path:
+            return
+
+        try:
+            serialize.export_store(self._store, path)
+        except (OSError, ValueError) as exc:
+            messagebox.showerror('Export', 'Unable to export %s: %s' % (path, exc), parent=self._root)
 
     def _command_exit(self, event=None):
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        if self._frame is not None:
+            self._frame.close()
         self._root.destroy()
@@ -1,10 +1,13 @@
 from collections import defaultdict
 from enum import Enum
-from collections import namedtuple
+import functools
 import os
-import pprint
-import re
-import winreg
+import sys
+
+from .expand import DependencyGraph, Expander
+from .instrument import hot
+from .index import KeyIndex
+from .registry import REG_SZ, REG_EXPAND_SZ, SYSTEM_ENVIRONMENT, USER_ENVIRONMENT, system_registry
 
 class EnvLocation(Enum):
     ENV_SYSTEM = 1
@@ -12,98 +15,939 @@ class EnvLocation(Enum):
     ENV_BOTH = 3
 
 
-EnvKey = namedtuple('EnvKey', ['value', 'type', 'expanded'])
+class EnvKey():
+    """A variable's raw value and type.
+
+    The value split on the path separator and its expanded form are only
+    computed when first accessed, and are then cached. Path segments are
+    interned through the owning :class:`Env` so that directories repeated
+    across variables and locations are stored once, and references are
+    expanded against the variables of the location which holds the key.
+    """
+
+    __slots__ = ('raw', 'type', '_owner', '_value', '_expanded')
+
+    def __init__(self, raw, type):
+        self.raw = raw
+        self.type = type
+        self._owner = None
+        self._value = None
+        self._expanded = None
+
+    @property
+    def value(self):
+        """The value as a list if it contains the path separator, otherwise the raw value"""
+        if self._value is None:
+            if self._owner is not None:
+                self._value = self._owner._env.split(self.raw)
+            elif isinstance(self.raw, str) and os.pathsep in self.raw:
+                self._value = self.raw.split(os.pathsep)
+            else:
+                self._value = self.raw
+        return self._value
+
+    @property
+    def expanded(self):
+        """The value with ``%VAR%`` references expanded, or None if it is not a REG_EXPAND_SZ value"""
+        if self.type != REG_EXPAND_SZ or self._owner is None:
+            return None
+
+        env = self._owner._env
+        generation = env.expansion_generation
+        if self._expanded is None or self._expanded[0] != generation:
+            self._expanded = (generation, env._expand(self.value, self._owner.location, self))
+        return self._expanded[1]
+
+    @property
+    def entries(self):
+        """The expanded value as a flat list of entries.
+
+        An element of :attr:`expanded` which references another multi-value
+        variable, such as ``%PATH%``, holds several entries; these are split
+        on the path separator again.
+        """
+        value = self.expanded
+        if value is None:
+            value = self.value
+        if not isinstance(value, list):
+            value = [value]
+
+        pathsep = self._owner._env.pathsep if self._owner is not None else os.pathsep
+        entries = []
+        for elem in value:
+            if isinstance(elem, str) and pathsep in elem:
+                entries.extend(elem.split(pathsep))
+            else:
+                entries.append(elem)
+        return entries
+
+    def __eq__(self, other):
+        if not isinstance(other, EnvKey):
+            return NotImplemented
+        return self.raw == other.raw and self.type == other.type
+
+    def __hash__(self):
+        return hash((self.raw, self.type))
+
+    def __repr__(self):
+        return 'EnvKey(%r, %r)' % (self.raw, self.type)
+
+
+class EnvDiff():
+    """The variables added, removed and changed by an update.
+
+    Each set contains ``(location, key)`` tuples where location is
+    ``EnvLocation.ENV_SYSTEM`` or ``EnvLocation.ENV_USER``.
+    """
+
+    def __init__(self):
+        self.added = set()
+        self.removed = set()
+        self.changed = set()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def __repr__(self):
+        return 'EnvDiff(added=%r, removed=%r, changed=%r)' % (self.added, self.removed, self.changed)
+
+    def keys(self, location=None):
+        """Return the set of keys affected in `location`, or in either location if it is None"""
+        return {key
+                for loc, key in self.added | self.removed | self.changed
+                if location is None or loc == location}
+
+    def merge(self, other):
+        """Fold a later diff into this one so that it describes both updates"""
+        for item in other.added:
+            if item in self.removed:
+                self.removed.discard(item)
+                self.changed.add(item)
+            else:
+                self.added.add(item)
+
+        for item in other.removed:
+            if item in self.added:
+                self.added.discard(item)
+            else:
+                self.changed.discard(item)
+                self.removed.add(item)
+
+        for item in other.changed:
+            if item not in self.added:
+                self.changed.add(item)
+
+        return self
+
+
+class PartialCommitError(OSError):
+    """Raised by :meth:`EnvTransaction.commit` when a location could not be written after another was.
+
+    :attr:`diff` is the :class:`EnvDiff` of the changes which were written
+    and applied; the edits which were not written stay in the transaction.
+    """
+
+    def __init__(self, diff, error):
+        super().__init__('Only some of the changes were written: %s' % error)
+        self.diff = diff
+
+
+class EnvVariables(dict):
+    """The variables for one location, with a :class:`KeyIndex` kept up to date on every change.
+
+    :class:`EnvKey` values are bound to these variables as they are added,
+    and the owning :class:`Env` is told about every key which is set or
+    removed.
+    """
+
+    __slots__ = ('index', 'location', '_env')
+
+    def __init__(self, env=None, location=None):
+        super().__init__()
+        self.index = KeyIndex(self)
+        self.location = location
+        self._env = env
+
+    def __setitem__(self, key, value):
+        added = key not in self
+        value._owner = self if self._env is not None else None
+        super().__setitem__(key, value)
+        if added:
+            self._added(key)
+        if self._env is not None:
+            self._env._variable_set(self.location, key, value, added)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._removed(key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            return super().pop(key, *default)
+        value = super().pop(key)
+        self._removed(key)
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._removed(key)
+        return key, value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        super().clear()
+        self.index.reset()
+        if self._env is not None:
+            self._env._cleared()
+
+    def _added(self, key):
+        self.index.add(key)
+        if self._env is not None:
+            self._env._key_added(self, key)
+
+    def _removed(self, key):
+        self.index.discard(key)
+        if self._env is not None:
+            self._env._key_removed(key)
+            self._env._variable_set(self.location, key, None, True)
 
 
 class Env():
-    """The Environemt which contains the system and user variables"""
+    """The Environemt which contains the system and user variables.
+
+    ``%VAR%`` references are expanded against the environment's own
+    variables: a system value sees the system variables and a user value
+    sees the user variables and then the system ones, as a process started
+    from them would. Names defined in neither come from ``os.environ``. A
+    graph of which variables reference which is built on the first
+    expansion and kept up to date as variables are set, so that a change
+    only invalidates the expansions which depend on it. A user variable
+    which references its own name, such as a user Path of ``%PATH%;...``,
+    sees the system variable of that name. References which form a cycle
+    are left unexpanded.
+    """
+
+    # Number of interned strings above which those no longer used are dropped
+    MIN_INTERNED = 4096
 
     def __init__(self):
-        self.system = {}
-        self.user = {}
+        self.system = EnvVariables(self, EnvLocation.ENV_SYSTEM)
+        self.user = EnvVariables(self, EnvLocation.ENV_USER)
+        self.pathsep = os.pathsep
+        self._expanders = {location: Expander(functools.partial(self._lookup, location))
+                           for location in (EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER)}
+        self._graph = None
+        self._cyclic = None
+        self._generation = 0
+        self._strings = {}
+        self._strings_limit = self.MIN_INTERNED
+        self._shared = set()
+        self._shared_index = KeyIndex(self._shared)
+
+    def __reduce__(self):
+        # Pickle only the raw values; indexes, interned strings and caches are rebuilt when loaded
+        return (_make_env, (self.pathsep,
+                            {key: (value.raw, value.type) for key, value in self.system.items()},
+                            {key: (value.raw, value.type) for key, value in self.user.items()}))
+
+    @property
+    def expansion_generation(self):
+        return self._generation
+
+    def intern(self, string):
+        """Return a canonical copy of `string` shared by every variable in this environment"""
+        return self._strings.setdefault(string, string)
+
+    def split(self, raw):
+        """Split `raw` on the path separator into a list of interned segments.
+
+        Values without a path separator, or which are not strings, are
+        returned unchanged.
+        """
+        if not isinstance(raw, str) or self.pathsep not in raw:
+            return raw
+        if len(self._strings) > self._strings_limit:
+            self._prune_strings()
+        strings = self._strings
+        return [strings.setdefault(segment, segment) for segment in raw.split(self.pathsep)]
+
+    def _prune_strings(self):
+        # Keep only the strings used by the split values, so the segments of
+        # values which have been replaced are not held for the whole session.
+        # The limit doubles with what is kept, so pruning is amortized.
+        strings = {}
+        for variables in (self.system, self.user):
+            for value in variables.values():
+                if isinstance(value._value, list):
+                    for segment in value._value:
+                        strings.setdefault(segment, segment)
+        self._strings = strings
+        self._strings_limit = max(2 * len(strings), self.MIN_INTERNED)
 
     def shared_variables(self):
-        """Returns a list of the environment variables that are common between system and user."""
+        """Returns a sorted list of the environment variables that are common between system and user.
+
+        The list is maintained as variables are added and removed and must not be modified.
+        """
 
-        for system_key in self.system:
-            if system_key in self.user:
-                yield system_key
+        return self._shared_index.sorted()
 
+    def sorted_keys(self, location):
+        """Return the sorted keys for a location; ENV_BOTH returns the keys common to both.
+
+        The lists are maintained as variables are added and removed and must not be modified.
+        """
+        if location == EnvLocation.ENV_BOTH:
+            return self._shared_index.sorted()
+        return self.variables(location).index.sorted()
+
+    def _key_added(self, variables, key):
+        other = self.user if variables is self.system else self.system
+        if key in other and key not in self._shared:
+            self._shared.add(key)
+            self._shared_index.add(key)
+
+    def _key_removed(self, key):
+        if key in self._shared:
+            self._shared.discard(key)
+            self._shared_index.discard(key)
+
+    def _cleared(self):
+        self._shared.clear()
+        self._shared_index.reset()
+        if self._graph is not None:
+            self._graph = None
+            self._cyclic = None
+            self._invalidate(None)
+
+    @hot('Env.get')
     def get(self, key, location=EnvLocation.ENV_BOTH, exact=True):
         """Return environment variables which contain `key`"""
 
-        result = defaultdict(dict)
+        if exact:
+            return self._collect(location, lambda variables: (key,) if key in variables else ())
+        else:
+            return self._collect(location, lambda variables: variables.index.substring(key))
 
-        if location == EnvLocation.ENV_SYSTEM or location == EnvLocation.ENV_BOTH:
-            for env_key, value in self.system.items():
-                if value[1] == 2:
-                    expanded = self._expand(value[0])
-                else:
-                    expanded = None
-                if (not exact and key in env_key) or (exact and key == env_key):
-                    result[env_key]['system'] = EnvKey(value[0], value[1], expanded)
+    def get_prefix(self, prefix, location=EnvLocation.ENV_BOTH):
+        """Return environment variables whose name starts with `prefix`"""
 
+        return self._collect(location, lambda variables: variables.index.prefix(prefix))
+
+    def search(self, text, location, values=False, within=None):
+        """Return the sorted keys in `location` whose name contains `text`, ignoring case.
+
+        With `values` a key also matches if its raw value contains `text`;
+        with ENV_BOTH the keys common to both locations are searched and a
+        value matches if either location's does. `within` is a previous
+        result for a text which `text` contains; only its keys are checked,
+        so a search refined by typing more characters never rescans the
+        whole location.
+        """
+        text = text.lower()
+        if location == EnvLocation.ENV_BOTH:
+            keys = self._shared
+            index = self._shared_index
+            locations = (self.system, self.user)
+        else:
+            keys = self.variables(location)
+            index = keys.index
+            locations = (keys,)
+
+        def value_matches(key):
+            return any(text in str(variables[key].raw).lower() for variables in locations)
+
+        if within is not None:
+            return [key for key in within
+                    if key in keys and (text in key or (values and value_matches(key)))]
+
+        if not text:
+            return list(index.sorted())
+        matches = set(index.substring(text))
+        if values:
+            matches.update(key for key in keys if key not in matches and value_matches(key))
+        return sorted(matches)
+
+    def build_indexes(self):
+        """Build the substring indexes used by :meth:`get` and :meth:`search` ahead of the first search"""
+        for index in (self.system.index, self.user.index, self._shared_index):
+            index.build()
+
+    def variables(self, location):
+        """Return the variables dict for `location` which must be ENV_SYSTEM or ENV_USER"""
+        if location == EnvLocation.ENV_SYSTEM:
+            return self.system
+        elif location == EnvLocation.ENV_USER:
+            return self.user
+        raise ValueError('A single location is required, not %s' % location)
+
+    def replace(self, location, values):
+        """Replace the variables in `location` with `values` in place.
+
+        Only keys which have been added, removed or whose value has changed
+        are touched. Returns an :class:`EnvDiff` describing the changes.
+        """
+        variables = self.variables(location)
+        diff = EnvDiff()
+
+        for key in [key for key in variables if key not in values]:
+            del variables[key]
+            diff.removed.add((location, key))
+
+        for key, value in values.items():
+            current = variables.get(key)
+            if current is None:
+                variables[key] = value
+                diff.added.add((location, key))
+            elif current != value:
+                variables[key] = value
+                diff.changed.add((location, key))
+
+        return diff
+
+    def _locations(self, location):
+        if location == EnvLocation.ENV_SYSTEM or location == EnvLocation.ENV_BOTH:
+            yield 'system', self.system
         if location == EnvLocation.ENV_USER or location == EnvLocation.ENV_BOTH:
-            for env_key, value in self.user.items():
-                if value[1] == 2:
-                    expanded = self._expand(value[0])
-                else:
-                    expanded = None
-                if (not exact and key in env_key) or (exact and key == env_key):
-                    result[env_key]['user'] = EnvKey(value[0], value[1], expanded)
+            yield 'user', self.user
+
+    def _collect(self, location, matching_keys):
+        result = defaultdict(dict)
+
+        for name, variables in self._locations(location):
+            for env_key in matching_keys(variables):
+                result[env_key][name] = variables[env_key]
 
         return result
 
-    def _expand(self, value):
-        rc = re.compile(r'%(\w+)%')
-        if not isinstance(value, list):
-            value = [value]
+    def invalidate_expansion(self, names=None):
+        """Discard expanded values which reference any of `names`, or all of them if `names` is None.
 
-        expanded = []
-        for elem in value:
-            for match in rc.finditer(elem):
-                env_key = match.group(0)[1:-1]
-                env_value = os.environ.get(env_key, '')
-                elem = elem.replace('%%%s%%' % env_key, env_value)
-            expanded.append(elem)
+        Needed only when variables outside the environment have changed;
+        changes to the environment's own variables are tracked.
+        """
+        self._invalidate(names)
+
+    def dependents(self, key):
+        """Return the ``(location, key)`` pairs whose expansion depends on `key`, directly or not"""
+        return sorted(self._dependencies().dependents((key.lower(),)), key=_node_order)
+
+    def expansion_order(self):
+        """Return the ``(location, key)`` pairs which contain references, each after those it references.
+
+        Variables in a cycle are not included; see :meth:`cycles`.
+        """
+        return self._dependencies().order(self._resolve_reference)[0]
+
+    def cycles(self):
+        """Return the sorted ``(location, key)`` pairs whose references form a cycle"""
+        return sorted(self._cycles(), key=_node_order)
 
+    def _dependencies(self):
+        # Return the dependency graph, building it on first use
+        if self._graph is None:
+            graph = DependencyGraph()
+            for location, expander in self._expanders.items():
+                for key, value in self.variables(location).items():
+                    if value.type == REG_EXPAND_SZ and isinstance(value.raw, str):
+                        graph.set((location, key), expander.template(value.raw).names)
+            self._graph = graph
+        return self._graph
+
+    def _cycles(self):
+        # Return a dict of each node in a cycle to the nodes of its cycle
+        if self._cyclic is None:
+            self._cyclic = self._find_cycles(None)[0]
+        return self._cyclic
+
+    def _find_cycles(self, roots):
+        # Return the cycles among the nodes reachable from `roots`, as _cycles
+        # does, and the set of nodes visited
+        graph = self._dependencies()
+        cyclic = {}
+        visited = set()
+        for component in graph.components(self._resolve_reference, roots):
+            visited.update(component)
+            if graph.is_cycle(component, self._resolve_reference):
+                component = frozenset(component)
+                cyclic.update((node, component) for node in component)
+        return cyclic, visited
+
+    def _resolve(self, location, key, referrer=None):
+        # Return the (location, key) a reference from `location` refers to, or
+        # None if it is not defined. A user variable which references its own
+        # name, as a user Path of %PATH%;... does, extends the system variable.
+        if key in self.variables(location) and referrer != (location, key):
+            return (location, key)
+        if location == EnvLocation.ENV_USER and key in self.system:
+            return (EnvLocation.ENV_SYSTEM, key)
+        if key in self.variables(location):
+            return (location, key)
+        return None
+
+    def _resolve_reference(self, node, name):
+        return self._resolve(node[0], name, node)
+
+    def _self_reference(self, location, value):
+        # Return the key of the user variable `value` if it references its own
+        # name and so the system variable, otherwise None
+        if location != EnvLocation.ENV_USER or value.type != REG_EXPAND_SZ or not isinstance(value.raw, str):
+            return None
+        for name in self._expanders[location].template(value.raw).names:
+            if name in self.system and self.user.get(name) is value:
+                return name
+        return None
+
+    def _own_lookup(self, own):
+        # A lookup for a user value which references its own name `own`
+        def lookup(name):
+            if name.lower() == own:
+                return self._lookup(EnvLocation.ENV_SYSTEM, name)
+            return self._lookup(EnvLocation.ENV_USER, name)
+        return lookup
+
+    def _lookup(self, location, name):
+        # The value of a reference to `name` in `location`, expanding the variable it refers to first
+        key = name.lower()
+        node = self._resolve(location, key)
+        if node is None:
+            return os.environ.get(name, '')
+        if node in self._cycles():
+            return '%%%s%%' % name
+        value = self.variables(node[0])[key]
+        if value.type != REG_EXPAND_SZ or not isinstance(value.raw, str):
+            return str(value.raw)
+        own = self._self_reference(node[0], value)
+        if own is not None:
+            # The result depends on which variable holds the value, so it is not cached by value
+            return self._expanders[node[0]].template(value.raw).render(self._own_lookup(own))
+        return self._expanders[node[0]].expand(value.raw)
+
+    def _variable_set(self, location, key, value, structural):
+        # Called as `key` is set to `value` or removed, when value is None. A
+        # structural change adds or removes the key, which changes where
+        # references to it resolve.
+        if self._graph is None:
+            return
+
+        node = (location, key)
+        if value is not None and value.type == REG_EXPAND_SZ and isinstance(value.raw, str):
+            names = self._expanders[location].template(value.raw).names
+        else:
+            names = frozenset()
+        old = self._graph.set(node, names)
+
+        changed = {key}
+        if self._cyclic is not None and (old != names or (structural and self._graph.is_referenced(key))):
+            self._update_cycles(node, changed)
+        changed.update(name for _location, name in self._graph.dependents(changed))
+        self._invalidate(changed)
+
+    def _update_cycles(self, node, changed):
+        # Find the cycles again around `node`, whose references or whose
+        # referrers' targets have changed, adding the names of the nodes which
+        # joined or left a cycle to `changed`. A cycle can only form or break
+        # through an edge which changed, so only the nodes reachable from
+        # their sources, and the previous cycles through them, are visited.
+        roots = {node}
+        roots.update(self._graph.referrers(node[1]))
+        for root in list(roots):
+            roots.update(self._cyclic.get(root, ()))
+
+        cyclic, visited = self._find_cycles(roots)
+        for member in visited:
+            if self._cyclic.get(member) != cyclic.get(member):
+                changed.add(member[1])
+                self._cyclic.pop(member, None)
+        self._cyclic.update(cyclic)
+
+    def _invalidate(self, names):
+        for expander in self._expanders.values():
+            expander.invalidate(names)
+        self._generation += 1
+
+    @hot('Env._expand')
+    def _expand(self, value, location, variable=None):
+        if self._graph is None:
+            self._dependencies()
+
+        expander = self._expanders[location]
+        own = self._self_reference(location, variable) if variable is not None else None
+        if own is None:
+            expand = expander.expand
+        else:
+            lookup = self._own_lookup(own)
+
+            def expand(elem):
+                template = expander.template(elem)
+                if own in template.names:
+                    return template.render(lookup)
+                return expander.expand(elem)
+
+        if not isinstance(value, list):
+            return expand(value)
+
+        expanded = [expand(elem) for elem in value]
         if len(expanded) == 1:
             return expanded[0]
         else:
             return expanded
 
 
-class WindowsEnvStore():
-    def __init__(self):
-        """Use the Windows Registry to extract environment variables"""
-        self.env = None
-        self._location_system = (winreg.HKEY_LOCAL_MACHINE,
-                                 'SYSTEM\\CurrentControlSet\\Control\\Session Manager\\Environment')
-        self._location_user = (winreg.HKEY_CURRENT_USER,
-                               'Environment')
-
-    def _subkeys(self, key):
-        key = winreg.OpenKey(key[0], key[1])
-        info = winreg.QueryInfoKey(key)
-        for idx in range(info[1]):
-            k = winreg.EnumValue(key, idx)
-            yield k
-
-    def update(self):
-        """Update the environment variables from the Windows Registry"""
-        self.env = Env()
-        for subkey in self._subkeys(self._location_system):
-            if os.pathsep in subkey[1]:
-                value = subkey[1].split(os.pathsep)
-            else:
-                value = subkey[1]
+def _node_order(node):
+    return (node[0].value, node[1])
 
-            self.env.system[str(subkey[0]).lower()] = value, subkey[2]
 
-        for subkey in self._subkeys(self._location_user):
-            if os.pathsep in subkey[1]:
-                value = subkey[1].split(os.pathsep)
+def _make_env(pathsep, system, user):
+    env = Env()
+    env.pathsep = pathsep
+    for variables, values in ((env.system, system), (env.user, user)):
+        for key, (raw, type) in values.items():
+            variables[key] = EnvKey(raw, type)
+    return env
+
+
+class EnvTransaction():
+    """A batch of edits to a store's variables which are written together by :meth:`commit`.
+
+    Edits are buffered in memory; setting the same variable more than once
+    only keeps the final value. Used as a context manager the transaction
+    is committed on success and discarded if an exception is raised.
+    """
+
+    def __init__(self, store):
+        self._store = store
+        self._edits = {}
+        self._names = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    def __len__(self):
+        return len(self._edits)
+
+    def set(self, location, key, value, type=None):
+        """Set `key` in `location` to `value`, which may be a string or a list of strings.
+
+        If `type` is None the existing type of the variable is kept; new
+        variables get the store's :meth:`~EnvStore.default_type`.
+        """
+        env = self._store.env
+        if isinstance(value, (list, tuple)):
+            value = env.pathsep.join(value)
+
+        item = (location, key.lower())
+        if type is None:
+            current = self.get(location, key)
+            if current is not None:
+                type = current.type
             else:
-                value = subkey[1]
+                type = self._store.default_type(value)
+
+        self._edits[item] = EnvKey(value, type)
+        self._names.setdefault(item, key)
+
+    def delete(self, location, key):
+        """Remove `key` from `location`"""
+        item = (location, key.lower())
+        self._edits[item] = None
+        self._names.setdefault(item, key)
+
+    def get(self, location, key):
+        """Return the :class:`EnvKey` `key` will have once committed, or None if it will not exist"""
+        item = (location, key.lower())
+        if item in self._edits:
+            return self._edits[item]
+        return self._store.env.variables(location).get(item[1])
+
+    def rollback(self):
+        """Discard all buffered edits"""
+        self._edits.clear()
+        self._names.clear()
+
+    def commit(self):
+        """Write the edits which change a value to the store and apply them to its :class:`Env`.
+
+        Each changed variable is written once and the store's notifier is
+        called once for the whole batch. Returns an :class:`EnvDiff`.
+
+        Each location is applied to the :class:`Env` once it has been
+        written. If a write fails the exception is raised and the edits
+        which were not written are kept; if another location had already
+        been written, :class:`PartialCommitError` is raised with the diff
+        of what was, after calling the notifier with it.
+        """
+        env = self._store.env
+        diff = EnvDiff()
+        changes = defaultdict(dict)
+
+        for item, value in self._edits.items():
+            location, key = item
+            current = env.variables(location).get(key)
+            if value is None:
+                if current is not None:
+                    diff.removed.add(item)
+                    changes[location][self._names[item]] = None
+            elif current is None:
+                diff.added.add(item)
+                changes[location][self._names[item]] = value
+            elif current != value:
+                diff.changed.add(item)
+                changes[location][self._names[item]] = value
+
+        written = EnvDiff()
+        for location, location_changes in changes.items():
+            try:
+                self._store._write(location, location_changes)
+            except Exception as exc:
+                if not written:
+                    raise
+                self._notify(written)
+                raise PartialCommitError(written, exc) from exc
+
+            variables = env.variables(location)
+            for name, value in location_changes.items():
+                item = (location, name.lower())
+                if value is None:
+                    del variables[item[1]]
+                else:
+                    variables[item[1]] = value
+                del self._edits[item]
+                del self._names[item]
+            for done, changed in ((written.added, diff.added), (written.removed, diff.removed),
+                                  (written.changed, diff.changed)):
+                done.update(item for item in changed if item[0] == location)
+
+        self.rollback()
+        self._notify(diff)
+        return diff
+
+    def _notify(self, diff):
+        if diff and self._store.notifier is not None:
+            self._store.notifier(diff)
+
+
+def broadcast_setting_change(diff=None):
+    """Tell running applications that the environment has changed by broadcasting WM_SETTINGCHANGE"""
+    import ctypes
+
+    HWND_BROADCAST = 0xFFFF
+    WM_SETTINGCHANGE = 0x001A
+    SMTO_ABORTIFHUNG = 0x0002
+
+    result = ctypes.c_void_p()
+    ctypes.windll.user32.SendMessageTimeoutW(HWND_BROADCAST, WM_SETTINGCHANGE, 0, 'Environment',
+                                             SMTO_ABORTIFHUNG, 5000, ctypes.byref(result))
+
+
+class EnvStore():
+    """Base class for stores which load an :class:`Env` and write edits back.
+
+    `notifier` is called with an :class:`EnvDiff` once after each committed
+    transaction which changed anything.
+    """
+
+    locations = (EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER)
+
+    def __init__(self, notifier=None):
+        self.env = Env()
+        self.notifier = notifier
+
+    def read(self, location, force=False):
+        """Read the variables for `location` without changing :attr:`env`.
+
+        Returns a dict of key to :class:`EnvKey`, or None if the location is
+        unchanged since it was last read and `force` is False. Reading does
+        not touch :attr:`env`, so it may be done on another thread and the
+        result applied later with :meth:`Env.replace`.
+        """
+        raise NotImplementedError
+
+    @hot('EnvStore.update')
+    def update(self, force=False):
+        """Update :attr:`env` in place from the store.
+
+        Locations which have not changed since they were last read are
+        skipped. Returns an :class:`EnvDiff` of the changes made.
+        """
+        diff = EnvDiff()
+        for location in self.locations:
+            values = self.read(location, force)
+            if values is not None:
+                diff.merge(self.env.replace(location, values))
+        return diff
+
+    def name(self, location, key):
+        """Return the name of `key` in `location` as the store spells it"""
+        return key
+
+    def default_type(self, value):
+        """Return the type for a new variable set to `value`, which is the type the store reads back"""
+        return REG_SZ
+
+    def stamp(self):
+        """Return a value which changes whenever the stored variables change, or None if unknown.
+
+        It must be cheap to compute and safe to call from any thread, as
+        :class:`~enveditor.watch.EnvWatcher` polls it.
+        """
+        return None
+
+    def watch_paths(self):
+        """Return the directories whose changes may change the stored variables"""
+        return []
+
+    def watch(self, callback, interval=1.0, debounce=0.2, dispatch=None):
+        """Return a started :class:`~enveditor.watch.EnvWatcher` which calls `callback` with each change"""
+        from .watch import EnvWatcher
+
+        watcher = EnvWatcher(self, callback, interval, debounce, dispatch)
+        watcher.start()
+        return watcher
+
+    def transaction(self):
+        """Return a new :class:`EnvTransaction` for batching edits to this store"""
+        return EnvTransaction(self)
+
+    def save_snapshot(self, snapshots, label=None):
+        """Save :attr:`env` to a :class:`~enveditor.snapshot.SnapshotStore` and return the snapshot id"""
+        return snapshots.save(self.env, label)
+
+    def diff_snapshot(self, snapshots, snapshot_id):
+        """Return an :class:`EnvDiff` of the changes from a saved snapshot to :attr:`env`"""
+        return snapshots.diff_live(snapshot_id, self.env)
+
+    def _write(self, location, changes):
+        """Write `changes`, a dict of variable name to :class:`EnvKey` or None to delete it"""
+        raise NotImplementedError
+
+
+class WindowsEnvStore(EnvStore):
+    def __init__(self, registry=None, notifier=None):
+        """Use the Windows Registry to extract environment variables.
+
+        `registry` provides the :mod:`winreg` interface and defaults to
+        :mod:`winreg` itself; pass a :class:`~enveditor.registry.MemoryRegistry`
+        to use the store without a Windows Registry. When using the real
+        registry `notifier` defaults to :func:`broadcast_setting_change`.
+        """
+        if registry is None:
+            registry = system_registry()
+            if registry is None:
+                raise OSError('The Windows Registry is not available on this platform')
+            if notifier is None and sys.platform == 'win32':
+                notifier = broadcast_setting_change
+
+        super().__init__(notifier)
+        self._registry = registry
+        self.env.pathsep = ';'
+        self._locations = {
+            EnvLocation.ENV_SYSTEM: (registry.HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT),
+            EnvLocation.ENV_USER: (registry.HKEY_CURRENT_USER, USER_ENVIRONMENT),
+        }
+        self._last_write = {}
+        self._names = {}
+
+    def default_type(self, value):
+        """Return REG_EXPAND_SZ if `value` contains a ``%VAR%`` reference, otherwise REG_SZ"""
+        return REG_EXPAND_SZ if '%' in value else REG_SZ
+
+    @hot('WindowsEnvStore._subkeys')
+    def _subkeys(self, key, count):
+        for idx in range(count):
+            yield self._registry.EnumValue(key, idx)
+
+    def read(self, location, force=False):
+        """Read the values stored for `location`.
+
+        Returns a dict of key to :class:`EnvKey`, or None if the registry key
+        has not been written to since it was last read. A missing registry
+        key is read as having no values.
+        """
+        if force:
+            self._last_write.pop(location, None)
+
+        try:
+            key = self._registry.OpenKey(*self._locations[location])
+        except FileNotFoundError:
+            if self._last_write.get(location) == 0:
+                return None
+            self._last_write[location] = 0
+            self._names[location] = {}
+            return {}
+
+        with key:
+            info = self._registry.QueryInfoKey(key)
+            if self._last_write.get(location) == info[2]:
+                return None
+
+            values = {}
+            names = {}
+            for subkey in self._subkeys(key, info[1]):
+                name = str(subkey[0])
+                values[name.lower()] = EnvKey(subkey[1], subkey[2])
+                names[name.lower()] = name
+
+        self._last_write[location] = info[2]
+        self._names[location] = names
+        return values
+
+    def name(self, location, key):
+        return self._names.get(location, {}).get(key, key)
+
+    def stamp(self):
+        """Return the last write times of the registry keys"""
+        stamps = []
+        for location in self.locations:
+            try:
+                with self._registry.OpenKey(*self._locations[location]) as key:
+                    stamps.append(self._registry.QueryInfoKey(key)[2])
+            except FileNotFoundError:
+                stamps.append(0)
+        return tuple(stamps)
+
+    def _write(self, location, changes):
+        registry = self._registry
+        names = self._names.setdefault(location, {})
+        access = registry.KEY_READ | registry.KEY_SET_VALUE
+        with registry.OpenKey(*self._locations[location], 0, access) as key:
+            up_to_date = self._last_write.get(location) == registry.QueryInfoKey(key)[2]
+
+            for name, value in changes.items():
+                lower = name.lower()
+                name = names.get(lower, name)
+                if value is None:
+                    registry.DeleteValue(key, name)
+                    names.pop(lower, None)
+                else:
+                    registry.SetValueEx(key, name, 0, value.type, value.raw)
+                    names[lower] = name
+
+            # Only skip the next read if nothing else wrote to the key since it was last read
+            if up_to_date:
+                self._last_write[location] = registry.QueryInfoKey(key)[2]
+
+
+def default_store():
+    """Return the environment store for the current platform"""
+    if sys.platform == 'win32':
+        return WindowsEnvStore()
+    if sys.platform.startswith('linux'):
+        from .filestore import linux_store
 
-            self.env.user[str(subkey[0]).lower()] = value, subkey[2]
+        return linux_store()
+    raise OSError('No environment store is available for %s' % sys.platform)
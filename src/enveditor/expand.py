@@ -0,0 +1,255 @@
+"""Expansion of ``%VAR%`` references in environment variable values"""
+
+from collections import OrderedDict
+import os
+import re
+
+_REFERENCE = re.compile(r'%(\w+)%')
+
+
+def _environ_lookup(name):
+    return os.environ.get(name, '')
+
+
+class Template():
+    """A value parsed once into its literal and reference segments.
+
+    `literals` always has one more element than `references`; the expanded
+    value is the literals interleaved with the values of the references.
+    """
+
+    __slots__ = ('literals', 'references', 'names')
+
+    def __init__(self, value):
+        parts = _REFERENCE.split(value)
+        self.literals = tuple(parts[0::2])
+        self.references = tuple(parts[1::2])
+        self.names = frozenset(name.lower() for name in self.references)
+
+    def render(self, lookup):
+        """Return the template with each reference replaced by `lookup(name)`"""
+        if not self.references:
+            return self.literals[0]
+
+        parts = [self.literals[0]]
+        for name, literal in zip(self.references, self.literals[1:]):
+            parts.append(lookup(name))
+            parts.append(literal)
+        return ''.join(parts)
+
+
+class Expander():
+    """Expands ``%VAR%`` references with memoized templates and results.
+
+    Each distinct value is parsed into a :class:`Template` once. Expanded
+    results are cached against a generation counter which is advanced by
+    :meth:`invalidate`; a cached result is only recomputed when one of the
+    variables it references has been invalidated since it was produced.
+    At most `max_size` templates and results are kept, dropping the least
+    recently used, so values which have been edited away do not accumulate.
+    """
+
+    MAX_SIZE = 1 << 17
+
+    def __init__(self, lookup=None, max_size=MAX_SIZE):
+        self._lookup = lookup or _environ_lookup
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._cache = OrderedDict()
+        self._generation = 0
+        self._reset = 0
+        self._changed = {}
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def template(self, value):
+        """Return the parsed :class:`Template` for `value`"""
+        templates = self._templates
+        template = templates.get(value)
+        if template is None:
+            template = templates[value] = Template(value)
+            if len(templates) > self.max_size:
+                templates.popitem(last=False)
+        else:
+            templates.move_to_end(value)
+        return template
+
+    def expand(self, value):
+        """Return `value` with all ``%VAR%`` references expanded"""
+        cache = self._cache
+        entry = cache.get(value)
+        if entry is not None:
+            cache.move_to_end(value)
+            generation, expanded = entry
+            if generation == self._generation:
+                return expanded
+            if generation >= self._reset and not self._stale(value, generation):
+                self._cache[value] = (self._generation, expanded)
+                return expanded
+
+        expanded = self.template(value).render(self._lookup)
+        cache[value] = (self._generation, expanded)
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+        return expanded
+
+    def invalidate(self, names=None):
+        """Mark the variables in `names` as changed, or all variables if `names` is None"""
+        self._generation += 1
+        if names is None:
+            self._reset = self._generation
+            self._changed.clear()
+        else:
+            for name in names:
+                self._changed[name.lower()] = self._generation
+
+    def clear(self):
+        """Drop all cached templates and results"""
+        self._templates.clear()
+        self._cache.clear()
+
+    def _stale(self, value, generation):
+        changed = self._changed
+        template = self._templates.get(value)
+        if template is None:
+            return True
+        for name in template.names:
+            if changed.get(name, -1) > generation:
+                return True
+        return False
+
+
+class DependencyGraph():
+    """Which variables reference which names.
+
+    Nodes are ``(location, key)`` pairs and each records the lower case
+    names its value references. Which variable a name refers to depends on
+    where it is looked up, so :meth:`order` is given a function to resolve
+    a reference to a node.
+    """
+
+    def __init__(self):
+        self._references = {}
+        self._dependents = {}
+
+    def __len__(self):
+        return len(self._references)
+
+    def set(self, node, names):
+        """Record that `node` references `names`; returns the names it referenced before"""
+        old = self._references.pop(node, frozenset())
+        for name in old:
+            nodes = self._dependents[name]
+            nodes.discard(node)
+            if not nodes:
+                del self._dependents[name]
+        if names:
+            self._references[node] = names
+            for name in names:
+                self._dependents.setdefault(name, set()).add(node)
+        return old
+
+    def references(self, node):
+        return self._references.get(node, frozenset())
+
+    def is_referenced(self, name):
+        return name in self._dependents
+
+    def dependents(self, names):
+        """Return the nodes which reference any of `names`, directly or through other nodes"""
+        result = set()
+        pending = list(names)
+        while pending:
+            for node in self._dependents.get(pending.pop(), ()):
+                if node not in result:
+                    result.add(node)
+                    pending.append(node[1])
+        return result
+
+    def referrers(self, name):
+        """Return the nodes which reference `name` directly"""
+        return self._dependents.get(name, ())
+
+    def targets(self, node, resolve):
+        """Return the nodes which `node` references and which themselves have references, or are `node`"""
+        targets = []
+        for name in self._references.get(node, ()):
+            target = resolve(node, name)
+            if target is not None and (target in self._references or target == node):
+                targets.append(target)
+        return targets
+
+    def components(self, resolve, roots=None):
+        """Yield the strongly connected components reachable from `roots`, or of the whole graph.
+
+        `resolve(node, name)` returns the node a reference from `node`
+        refers to, or None if it is not a node. Each component is a list
+        of nodes and is yielded after every component it references; this
+        is an iterative form of Tarjan's algorithm, which only visits the
+        nodes reachable from `roots`.
+        """
+        edges = {}
+
+        def targets(node):
+            result = edges.get(node)
+            if result is None:
+                result = edges[node] = self.targets(node, resolve)
+            return result
+
+        index = {}
+        lowlink = {}
+        stack = []
+        on_stack = set()
+
+        for root in (self._references if roots is None else roots):
+            if root in index:
+                continue
+            work = [(root, iter(targets(root)))]
+            index[root] = lowlink[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            while work:
+                node, pending = work[-1]
+                for target in pending:
+                    if target not in index:
+                        index[target] = lowlink[target] = len(index)
+                        stack.append(target)
+                        on_stack.add(target)
+                        work.append((target, iter(targets(target))))
+                        break
+                    if target in on_stack:
+                        lowlink[node] = min(lowlink[node], index[target])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        yield component
+
+    def is_cycle(self, component, resolve):
+        """Return True if the component yielded by :meth:`components` is a cycle"""
+        return len(component) > 1 or component[0] in self.targets(component[0], resolve)
+
+    def order(self, resolve):
+        """Return the nodes in dependency order and the set of nodes which are part of a cycle.
+
+        Nodes in a cycle are left out of the order.
+        """
+        order = []
+        cyclic = set()
+        for component in self.components(resolve):
+            if self.is_cycle(component, resolve):
+                cyclic.update(component)
+            else:
+                order.append(component[0])
+        return order, cyclic
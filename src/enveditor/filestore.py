@@ -0,0 +1,267 @@
+"""Environment stores backed by ``KEY=value`` files, as used on Linux.
+
+Each location is the merge of a list of files, later files overriding
+earlier ones. Two syntaxes are understood:
+
+* ``env`` - ``KEY=value`` lines with optional quotes and ``export``, as in
+  ``/etc/environment``, ``environment.d/*.conf`` and ``.env`` files
+* ``pam`` - the ``VAR [DEFAULT=value] [OVERRIDE=value]`` lines of
+  ``~/.pam_environment``; ``KEY=value`` lines are also accepted
+
+The parsed contents of each file are cached against its modification time
+and size, so :meth:`FileEnvStore.read` only re-parses files which changed.
+Files of :attr:`FileEnvStore.MMAP_THRESHOLD` bytes or more are read through
+:mod:`mmap` a line at a time rather than into one buffer.
+"""
+
+import glob
+import mmap
+import os
+import re
+import tempfile
+
+from .envstore import EnvKey, EnvLocation, EnvStore
+from .registry import REG_SZ
+from .serialize import quote_env, unquote_env
+
+_PAM_FIELD = re.compile(r'(DEFAULT|OVERRIDE)=("(?:[^"\\]|\\.)*"|\S*)')
+
+
+def file_format(path):
+    """Return the syntax used by the file at `path`"""
+    name = os.path.basename(path)
+    return 'pam' if name in ('.pam_environment', 'pam_env.conf') else 'env'
+
+
+def parse_line(line, fmt='env'):
+    """Return ``(name, value)`` for a line which sets a variable, otherwise None"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+
+    if fmt == 'pam':
+        name, _sep, rest = line.partition(' ')
+        if '=' not in name and rest:
+            fields = dict(_PAM_FIELD.findall(rest))
+            value = fields.get('OVERRIDE', fields.get('DEFAULT'))
+            if value is None:
+                return None
+            return name, unquote_env(value)
+
+    if line.startswith('export '):
+        line = line[7:].lstrip()
+    name, sep, value = line.partition('=')
+    name = name.strip()
+    if not sep or not name or ' ' in name:
+        return None
+    return name, unquote_env(value)
+
+
+def format_line(name, value, fmt='env'):
+    """Return the line which sets `name` to `value`"""
+    value = quote_env(value)
+    if fmt == 'pam':
+        return '%s DEFAULT=%s' % (name, value)
+    return '%s=%s' % (name, value)
+
+
+class FileEnvStore(EnvStore):
+    """Reads the system and user variables from lists of files and writes edits back to them.
+
+    `system` and `user` are lists of paths, which may start with ``~`` and
+    contain glob patterns; the files matched by a pattern are read in name
+    order and missing files are read as empty. An edit is written to the
+    last file which defines the variable, and a new variable to the
+    location's entry in `targets`, which defaults to the last path in the
+    list which is not a pattern.
+
+    Variable names are matched case insensitively like the rest of the
+    editor; :meth:`name` returns the spelling used in the file.
+    """
+
+    MMAP_THRESHOLD = 1 << 20
+
+    def __init__(self, system=(), user=(), targets=None, notifier=None):
+        super().__init__(notifier)
+        self.env.pathsep = ':'
+        self._paths = {EnvLocation.ENV_SYSTEM: list(system), EnvLocation.ENV_USER: list(user)}
+        self._targets = {}
+        for location, paths in self._paths.items():
+            plain = [path for path in paths if not glob.has_magic(path)]
+            if plain:
+                self._targets[location] = os.path.expanduser(plain[-1])
+        if targets:
+            self._targets.update({location: os.path.expanduser(path) for location, path in targets.items()})
+
+        self._files = {}
+        self._stamps = {}
+        self._names = {}
+        self._sources = {}
+
+    def files(self, location):
+        """Return the files which are read for `location`, in the order they are merged"""
+        result = []
+        for path in self._paths[location]:
+            path = os.path.expanduser(path)
+            if glob.has_magic(path):
+                result.extend(sorted(glob.glob(path)))
+            else:
+                result.append(path)
+        return result
+
+    def read(self, location, force=False):
+        """Read the variables for `location` from its files.
+
+        Returns a dict of key to :class:`~enveditor.envstore.EnvKey`, or None
+        if no file has been changed, added or removed since the last read.
+        """
+        stamps = tuple((path, self._stamp(path)) for path in self.files(location))
+        if not force and self._stamps.get(location) == stamps:
+            return None
+
+        values = {}
+        names = {}
+        sources = {}
+        for path, stamp in stamps:
+            for name, raw in self._parse(path, stamp):
+                key = name.lower()
+                values[key] = EnvKey(raw, REG_SZ)
+                names[key] = name
+                sources.setdefault(key, []).append(path)
+
+        self._stamps[location] = stamps
+        self._names[location] = names
+        self._sources[location] = sources
+        return values
+
+    def name(self, location, key):
+        return self._names.get(location, {}).get(key, key)
+
+    def stamp(self):
+        """Return the modification time and size of every file read"""
+        return tuple((path, self._stamp(path)) for location in self.locations for path in self.files(location))
+
+    def watch_paths(self):
+        """Return the directories holding the files, so that new and replaced files are seen"""
+        directories = []
+        for paths in self._paths.values():
+            for path in paths:
+                directory = os.path.dirname(os.path.expanduser(path)) or '.'
+                if not glob.has_magic(directory) and directory not in directories:
+                    directories.append(directory)
+        return directories
+
+    def _stamp(self, path):
+        try:
+            info = os.stat(path)
+        except OSError:
+            return None
+        return (info.st_mtime_ns, info.st_size)
+
+    def _parse(self, path, stamp):
+        # Return the (name, value) pairs in `path`, parsing it only if its stamp has changed
+        if stamp is None:
+            self._files.pop(path, None)
+            return []
+
+        cached = self._files.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        fmt = file_format(path)
+        try:
+            entries = [entry for entry in (parse_line(line, fmt) for line in self._lines(path, stamp[1]))
+                       if entry is not None]
+        except OSError:
+            return []
+        self._files[path] = (stamp, entries)
+        return entries
+
+    def _lines(self, path, size):
+        with open(path, 'rb') as fp:
+            if size >= self.MMAP_THRESHOLD:
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    for line in iter(data.readline, b''):
+                        yield line.decode('utf-8', 'replace')
+            else:
+                yield from fp.read().decode('utf-8', 'replace').splitlines()
+
+    def _write(self, location, changes):
+        sources = self._sources.setdefault(location, {})
+        names = self._names.setdefault(location, {})
+
+        edits = {}
+        for name, value in changes.items():
+            key = name.lower()
+            paths = sources.get(key) or [self._targets.get(location)]
+            if paths[-1] is None:
+                raise OSError('No file to write %s variables to' % location.name)
+
+            if value is None:
+                # Remove every definition so that an earlier file does not take over
+                for path in paths:
+                    edits.setdefault(path, {})[key] = None
+                sources.pop(key, None)
+                names.pop(key, None)
+            else:
+                edits.setdefault(paths[-1], {})[key] = (names.get(key, name), value.raw)
+                sources[key] = paths
+                names.setdefault(key, name)
+
+        for path, file_edits in edits.items():
+            self._rewrite(path, file_edits)
+
+    def _rewrite(self, path, edits):
+        """Replace, remove and append the lines for `edits` in `path`, keeping every other line"""
+        fmt = file_format(path)
+        try:
+            with open(path, encoding='utf-8') as fp:
+                lines = fp.read().splitlines()
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            lines = []
+            mode = None
+
+        pending = dict(edits)
+        output = []
+        for line in lines:
+            entry = parse_line(line, fmt)
+            key = entry[0].lower() if entry is not None else None
+            if key not in edits:
+                output.append(line)
+            elif pending.get(key) is not None:
+                output.append(format_line(*pending.pop(key), fmt=fmt))
+            else:
+                pending.pop(key, None)
+        for edit in pending.values():
+            if edit is not None:
+                output.append(format_line(*edit, fmt=fmt))
+
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(prefix='.enveditor', dir=directory)
+        try:
+            with os.fdopen(handle, 'w', encoding='utf-8') as fp:
+                fp.write(''.join('%s\n' % line for line in output))
+            if mode is not None:
+                os.chmod(temp_path, mode & 0o7777)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+
+def linux_store(notifier=None):
+    """Return a store for ``/etc/environment`` and the user's ``~/.pam_environment`` and ``environment.d`` files.
+
+    New user variables are written to ``~/.config/environment.d/enveditor.conf``.
+    """
+    return FileEnvStore(system=['/etc/environment'],
+                        user=['~/.pam_environment', '~/.config/environment.d/*.conf'],
+                        targets={EnvLocation.ENV_USER: '~/.config/environment.d/enveditor.conf'},
+                        notifier=notifier)
+
+
+def dotenv_store(path, notifier=None):
+    """Return a store whose user variables are the contents of the ``.env`` file `path`"""
+    return FileEnvStore(user=[path], notifier=notifier)
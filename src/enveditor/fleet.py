@@ -0,0 +1,190 @@
+"""Auditing environments exported from many machines.
+
+Each file is an export in one of the :mod:`~enveditor.serialize` formats,
+and the machine it came from is named by the file name without its
+extension. Files are parsed into :class:`~enveditor.envstore.Env` objects
+and queried in a process pool, several files to a task, and only the
+query results are sent back. Results are yielded as each task finishes,
+so the first machines are reported long before the last file is read.
+"""
+
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+
+from .envstore import Env, EnvDiff, EnvKey, EnvLocation
+from .registry import REG_SZ, REG_EXPAND_SZ
+from . import serialize
+
+FleetResult = namedtuple('FleetResult', ['machine', 'value', 'error'])
+
+
+def machine_name(path):
+    """Return the machine name for the snapshot file `path`"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_env(path, pathsep=';'):
+    """Return a new :class:`~enveditor.envstore.Env` holding the variables in the snapshot file `path`"""
+    env = Env()
+    env.pathsep = pathsep
+    fmt = serialize.format_for(path)
+    with serialize.open_file(path, 'r', fmt) as fp:
+        for location, name, raw, type in serialize.load(fp, fmt):
+            variables = env.variables(location)
+            if raw is None:
+                variables.pop(name.lower(), None)
+                continue
+            if type is None:
+                type = REG_EXPAND_SZ if '%' in raw else REG_SZ
+            variables[name.lower()] = EnvKey(raw, type)
+    return env
+
+
+def _values(env, name, location):
+    # Return {'system': raw, 'user': raw} for the locations in which `name` is defined
+    return {loc: key.raw for loc, key in env.get(name.lower(), location=location).get(name.lower(), {}).items()}
+
+
+class Defines():
+    """Query which is True for environments which define `name` in `location`"""
+
+    def __init__(self, name, location=EnvLocation.ENV_BOTH):
+        self.name = name
+        self.location = location
+
+    def __call__(self, env):
+        return bool(_values(env, self.name, self.location))
+
+
+class Value():
+    """Query for the raw values of `name`, keyed by 'system' and 'user'"""
+
+    def __init__(self, name, location=EnvLocation.ENV_BOTH):
+        self.name = name
+        self.location = location
+
+    def __call__(self, env):
+        return _values(env, self.name, self.location)
+
+
+class Diff():
+    """Query for the :class:`~enveditor.envstore.EnvDiff` from `baseline`, an :class:`~enveditor.envstore.Env`"""
+
+    def __init__(self, baseline, location=EnvLocation.ENV_BOTH):
+        self.baseline = baseline
+        self.location = location
+
+    def __call__(self, env):
+        diff = EnvDiff()
+        for location in (EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER):
+            if self.location == EnvLocation.ENV_BOTH or self.location == location:
+                old = self.baseline.variables(location)
+                new = env.variables(location)
+                for key, value in new.items():
+                    current = old.get(key)
+                    if current is None:
+                        diff.added.add((location, key))
+                    elif current != value:
+                        diff.changed.add((location, key))
+                diff.removed.update((location, key) for key in old if key not in new)
+        return diff
+
+
+def _run(paths, query, pathsep):
+    # Runs in a worker process
+    results = []
+    for path in paths:
+        try:
+            results.append(FleetResult(machine_name(path), query(load_env(path, pathsep)), None))
+        except (OSError, ValueError, KeyError) as exc:
+            results.append(FleetResult(machine_name(path), None, str(exc) or type(exc).__name__))
+    return results
+
+
+class Fleet():
+    """Runs queries over the snapshot files in `paths` in a pool of `max_workers` processes.
+
+    `batch_size` files are parsed by each task, which keeps the cost of
+    sending tasks and results between processes small next to parsing.
+    The files which could not be read by the last query are listed in
+    :attr:`errors` as ``(machine, message)`` tuples.
+    """
+
+    def __init__(self, paths, max_workers=None, batch_size=16, pathsep=';'):
+        self.paths = list(paths)
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.pathsep = pathsep
+        self.errors = []
+
+    @classmethod
+    def from_paths(cls, paths, **kwargs):
+        """Create a fleet from files and directories; directories contribute every file in a known format"""
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for entry in sorted(os.listdir(path)):
+                    if os.path.splitext(entry)[1].lower() in serialize.FORMATS:
+                        files.append(os.path.join(path, entry))
+            else:
+                files.append(path)
+        return cls(files, **kwargs)
+
+    def map(self, query):
+        """Yield a :class:`FleetResult` for each machine as soon as it has been queried.
+
+        `query` is called with each machine's :class:`~enveditor.envstore.Env`
+        in a worker process, so it must be picklable, such as an instance
+        of :class:`Defines`, :class:`Value` or :class:`Diff`.
+        """
+        batches = [self.paths[idx:idx + self.batch_size] for idx in range(0, len(self.paths), self.batch_size)]
+        self.errors = []
+        if not batches:
+            return
+        with ProcessPoolExecutor(self.max_workers) as executor:
+            futures = [executor.submit(_run, batch, query, self.pathsep) for batch in batches]
+            for future in as_completed(futures):
+                for result in future.result():
+                    if result.error is not None:
+                        self.errors.append((result.machine, result.error))
+                    yield result
+
+    def defines(self, name, location=EnvLocation.ENV_BOTH):
+        """Yield the machines which define `name`"""
+        for result in self.map(Defines(name, location)):
+            if result.value:
+                yield result.machine
+
+    def values(self, name, location=EnvLocation.ENV_BOTH):
+        """Yield ``(machine, values)`` with the raw values of `name` keyed by 'system' and 'user'"""
+        for result in self.map(Value(name, location)):
+            if result.error is None:
+                yield result.machine, result.value
+
+    def distribution(self, name, location=EnvLocation.ENV_BOTH, entries=False):
+        """Return a :class:`~collections.Counter` of the values of `name` across the fleet.
+
+        With ENV_BOTH the value counted is the system value followed by the
+        user value, as a process sees it. With `entries` each path entry is
+        counted once per machine instead of the whole value.
+        """
+        counter = Counter()
+        for _machine, values in self.values(name, location):
+            value = self.pathsep.join(values[loc] for loc in ('system', 'user') if loc in values)
+            if entries:
+                counter.update(set(entry for entry in value.split(self.pathsep) if entry))
+            elif values:
+                counter[value] += 1
+        return counter
+
+    def differences(self, baseline, location=EnvLocation.ENV_BOTH):
+        """Yield ``(machine, diff)`` for each machine whose variables differ from `baseline`.
+
+        `baseline` is an :class:`~enveditor.envstore.Env` or the path of a snapshot file.
+        """
+        if not isinstance(baseline, Env):
+            baseline = load_env(baseline, self.pathsep)
+        for result in self.map(Diff(baseline, location)):
+            if result.value:
+                yield result.machine, result.value
@@ -0,0 +1,223 @@
+"""Undo and redo of edits made through a store.
+
+Each step records the state of one variable before and after an edit.
+Multi-value variables are held as :class:`PersistentList` instances, and an
+edit derives the new list from the old one, so consecutive steps share every
+chunk of the list which the edit did not touch. A step therefore costs
+roughly one chunk rather than a copy of the variable, let alone the
+:class:`~enveditor.envstore.Env`.
+"""
+
+from collections import deque, namedtuple
+
+from .envstore import EnvDiff
+
+_Step = namedtuple('_Step', ['location', 'name', 'before', 'after'])
+
+
+class PersistentList():
+    """An immutable list of strings held in chunks which are shared with the lists derived from it.
+
+    :meth:`set`, :meth:`insert`, :meth:`delete` and :meth:`move` return a
+    new list which reuses every chunk except the ones they change.
+    """
+
+    __slots__ = ('_chunks', '_len')
+
+    CHUNK_SIZE = 32
+
+    def __init__(self, items=()):
+        items = tuple(items)
+        size = self.CHUNK_SIZE
+        self._chunks = tuple(items[idx:idx + size] for idx in range(0, len(items), size))
+        self._len = len(items)
+
+    @classmethod
+    def _from_chunks(cls, chunks, length):
+        result = cls.__new__(cls)
+        result._chunks = tuple(chunk for chunk in chunks if chunk)
+        result._len = length
+        return result
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def __getitem__(self, index):
+        chunk, offset = self._locate(index)
+        return self._chunks[chunk][offset]
+
+    def __eq__(self, other):
+        if not isinstance(other, PersistentList):
+            return NotImplemented
+        return self._len == other._len and list(self) == list(other)
+
+    def __repr__(self):
+        return 'PersistentList(%r)' % list(self)
+
+    def set(self, index, value):
+        """Return a new list with the item at `index` replaced by `value`"""
+        chunk, offset = self._locate(index)
+        items = list(self._chunks[chunk])
+        items[offset] = value
+        return self._replace(chunk, (tuple(items),), self._len)
+
+    def insert(self, index, value):
+        """Return a new list with `value` inserted before `index`"""
+        if not self._chunks:
+            return PersistentList([value])
+        if index >= self._len:
+            chunk, offset = len(self._chunks) - 1, len(self._chunks[-1])
+        else:
+            chunk, offset = self._locate(index)
+
+        items = list(self._chunks[chunk])
+        items.insert(offset, value)
+        # Split a chunk which has grown to twice the chunk size so that edits stay cheap
+        if len(items) >= 2 * self.CHUNK_SIZE:
+            half = len(items) // 2
+            replacement = (tuple(items[:half]), tuple(items[half:]))
+        else:
+            replacement = (tuple(items),)
+        return self._replace(chunk, replacement, self._len + 1)
+
+    def delete(self, index):
+        """Return a new list without the item at `index`"""
+        chunk, offset = self._locate(index)
+        items = self._chunks[chunk]
+        return self._replace(chunk, (items[:offset] + items[offset + 1:],), self._len - 1)
+
+    def move(self, old_index, new_index):
+        """Return a new list with the item at `old_index` moved to `new_index`"""
+        return self.delete(old_index).insert(new_index, self[old_index])
+
+    def _locate(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('PersistentList index out of range')
+        for chunk, items in enumerate(self._chunks):
+            if index < len(items):
+                return chunk, index
+            index -= len(items)
+
+    def _replace(self, chunk, replacement, length):
+        return self._from_chunks(self._chunks[:chunk] + replacement + self._chunks[chunk + 1:], length)
+
+
+class History():
+    """Applies edits to `store` in transactions and keeps the last `max_depth` of them for undo.
+
+    The state of a variable is None when it does not exist, otherwise a
+    ``(value, type)`` tuple where `value` is a :class:`PersistentList` for a
+    multi-value variable or the raw string.
+    """
+
+    def __init__(self, store, max_depth=100):
+        self._store = store
+        self._undo = deque(maxlen=max_depth)
+        self._redo = []
+        self._states = {}
+
+    @property
+    def max_depth(self):
+        return self._undo.maxlen
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._states.clear()
+
+    def state(self, location, key):
+        """Return the current state of `key` in `location`.
+
+        The state is cached against the :class:`~enveditor.envstore.EnvKey`
+        it was made from, so the list an edit produced is the one the next
+        edit derives from.
+        """
+        current = self._store.env.variables(location).get(key.lower())
+        if current is None:
+            return None
+
+        cached = self._states.get((location, key.lower()))
+        if cached is not None and cached[0] is current:
+            return cached[1]
+
+        if isinstance(current.value, list):
+            state = (PersistentList(current.value), current.type)
+        else:
+            state = (current.raw, current.type)
+        self._states[(location, key.lower())] = (current, state)
+        return state
+
+    def apply(self, location, name, value, type=None):
+        """Set `name` in `location` to `value`, or delete it if `value` is None, and record the step.
+
+        `value` is a :class:`PersistentList` or a string. Returns the
+        :class:`~enveditor.envstore.EnvDiff` of the commit.
+        """
+        before = self.state(location, name)
+        if value is None:
+            after = None
+        else:
+            if type is None:
+                type = before[1] if before is not None else None
+            after = (value, type)
+
+        diff = self._commit(location, name, after)
+        if diff:
+            self._undo.append(_Step(location, name, before, self.state(location, name)))
+            self._redo.clear()
+        return diff
+
+    def undo(self):
+        """Revert the most recent step; returns its :class:`~enveditor.envstore.EnvDiff`"""
+        if not self._undo:
+            return EnvDiff()
+        step = self._undo[-1]
+        diff = self._commit(step.location, step.name, step.before)
+        self._redo.append(self._undo.pop())
+        return diff
+
+    def redo(self):
+        """Reapply the most recently undone step; returns its :class:`~enveditor.envstore.EnvDiff`"""
+        if not self._redo:
+            return EnvDiff()
+        step = self._redo[-1]
+        diff = self._commit(step.location, step.name, step.after)
+        self._undo.append(self._redo.pop())
+        return diff
+
+    def _commit(self, location, name, state):
+        txn = self._store.transaction()
+        if state is None:
+            txn.delete(location, name)
+        else:
+            value, type = state
+            txn.set(location, name, list(value) if isinstance(value, PersistentList) else value, type)
+        diff = txn.commit()
+
+        # Keep the state only if it splits the same way the committed value does
+        current = self._store.env.variables(location).get(name.lower())
+        item = (location, name.lower())
+        if state is not None and current is not None and self._matches(state[0], current.value):
+            self._states[item] = (current, state)
+        else:
+            self._states.pop(item, None)
+        return diff
+
+    def _matches(self, value, current):
+        if isinstance(value, PersistentList):
+            return isinstance(current, list) and len(current) == len(value)
+        return not isinstance(current, list)
@@ -0,0 +1,121 @@
+"""Key indexes for fast exact, prefix and substring lookups"""
+
+from bisect import bisect_left
+
+GRAM_SIZE = 3
+
+
+def _grams(key):
+    return {key[idx:idx + GRAM_SIZE] for idx in range(len(key) - GRAM_SIZE + 1)}
+
+
+class KeyIndex():
+    """A sorted key list and a trigram index over a live collection of keys.
+
+    Both indexes are built from `keys` the first time they are needed and
+    are then kept up to date by calls to :meth:`add` and :meth:`discard`.
+    """
+
+    def __init__(self, keys):
+        self._keys = keys
+        self._sorted = None
+        self._grams = None
+        self._short = None
+
+    def add(self, key):
+        """Add a key which has just been added to the collection"""
+        if self._sorted is not None:
+            idx = bisect_left(self._sorted, key)
+            if idx == len(self._sorted) or self._sorted[idx] != key:
+                self._sorted.insert(idx, key)
+
+        if self._grams is not None:
+            self._index(key)
+
+    def discard(self, key):
+        """Remove a key which has just been removed from the collection"""
+        if self._sorted is not None:
+            idx = bisect_left(self._sorted, key)
+            if idx < len(self._sorted) and self._sorted[idx] == key:
+                del self._sorted[idx]
+
+        if self._grams is not None:
+            if len(key) < GRAM_SIZE:
+                self._short.discard(key)
+            for gram in _grams(key):
+                keys = self._grams.get(gram)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._grams[gram]
+
+    def reset(self):
+        """Drop the indexes; they are rebuilt on next use"""
+        self._sorted = None
+        self._grams = None
+        self._short = None
+
+    def sorted(self):
+        """Return the keys in sorted order.
+
+        The list returned is maintained by the index and must not be modified.
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self._keys)
+        return self._sorted
+
+    def prefix(self, prefix):
+        """Return the keys which start with `prefix` in sorted order"""
+        keys = self.sorted()
+        start = bisect_left(keys, prefix)
+        end = start
+        while end < len(keys) and keys[end].startswith(prefix):
+            end += 1
+        return keys[start:end]
+
+    def substring(self, text):
+        """Return the set of keys which contain `text`"""
+        if not text:
+            return set(self._keys)
+
+        if self._grams is None:
+            self._build()
+
+        if len(text) >= GRAM_SIZE:
+            postings = sorted((self._grams.get(gram, ()) for gram in _grams(text)), key=len)
+            if not postings[0]:
+                return set()
+            candidates = set(postings[0])
+            for keys in postings[1:]:
+                candidates.intersection_update(keys)
+                if not candidates:
+                    break
+            if len(text) == GRAM_SIZE:
+                return candidates
+            return {key for key in candidates if text in key}
+
+        result = {key for key in self._short if text in key}
+        for gram, keys in self._grams.items():
+            if text in gram:
+                result.update(keys)
+        return result
+
+    def build(self):
+        """Build the trigram index now rather than on the first substring lookup"""
+        if self._grams is None:
+            self._build()
+
+    def _build(self):
+        self._grams = {}
+        self._short = set()
+        for key in self._keys:
+            self._index(key)
+
+    def _index(self, key):
+        if len(key) < GRAM_SIZE:
+            self._short.add(key)
+        for gram in _grams(key):
+            keys = self._grams.get(gram)
+            if keys is None:
+                keys = self._grams[gram] = set()
+            keys.add(key)
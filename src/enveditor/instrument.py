@@ -0,0 +1,160 @@
+"""Opt-in timing of the editor's hot paths.
+
+Functions are marked with :func:`hot`, which leaves them untouched, so
+instrumentation costs nothing until it is enabled. :func:`enable` replaces
+each marked function on its class or module with a wrapper which records
+the number of calls and a histogram of their durations; :func:`disable`
+puts the originals back. Setting the ``ENVEDITOR_INSTRUMENT`` environment
+variable to a non-empty value enables it from the start.
+
+Durations are counted in power of two buckets of nanoseconds, so bucket
+`n` holds calls which took less than ``2 ** n`` ns.
+"""
+
+import functools
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = 'ENVEDITOR_INSTRUMENT'
+BUCKETS = 40
+
+_hot = {}
+_stats = {}
+_lock = threading.Lock()
+_enabled = [False]
+
+
+class Stats():
+    """The calls recorded for one function"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.histogram = [0] * BUCKETS
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram[min(elapsed.bit_length(), BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Return the upper bound in ns of the bucket holding the given fraction of calls"""
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return 1 << bucket
+        return 0
+
+    def as_dict(self):
+        return {'count': self.count,
+                'total_ns': self.total,
+                'mean_ns': self.total // self.count if self.count else 0,
+                'max_ns': self.max,
+                'p50_ns': self.percentile(0.5),
+                'p95_ns': self.percentile(0.95),
+                'histogram': {str(1 << bucket): count for bucket, count in enumerate(self.histogram) if count}}
+
+
+def _record(name, elapsed):
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = Stats(name)
+        stats.add(elapsed)
+
+
+def _wrap(name, func):
+    import inspect
+
+    counter = time.perf_counter_ns
+
+    if inspect.isgeneratorfunction(func):
+        # Time the whole iteration rather than the creation of the generator
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = counter()
+            try:
+                yield from func(*args, **kwargs)
+            finally:
+                _record(name, counter() - start)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(name, counter() - start)
+
+    return wrapper
+
+
+def hot(name):
+    """Mark a function or method to be timed as `name` when instrumentation is enabled"""
+    def decorator(func):
+        _hot[name] = func
+        if _enabled[0]:
+            return _wrap(name, func)
+        return func
+    return decorator
+
+
+def _owner(func):
+    # Return the class or module which holds `func`, found from its qualified name
+    owner = sys.modules[func.__module__]
+    for part in func.__qualname__.split('.')[:-1]:
+        owner = getattr(owner, part)
+    return owner
+
+
+def enabled():
+    return _enabled[0]
+
+
+def enable():
+    """Start timing every function marked with :func:`hot`"""
+    if _enabled[0]:
+        return
+    _enabled[0] = True
+    for name, func in _hot.items():
+        setattr(_owner(func), func.__name__, _wrap(name, func))
+
+
+def disable():
+    """Stop timing and restore the original functions; recorded data is kept"""
+    if not _enabled[0]:
+        return
+    _enabled[0] = False
+    for func in _hot.values():
+        setattr(_owner(func), func.__name__, func)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def snapshot():
+    """Return a dict of name to the recorded data, as :meth:`Stats.as_dict` returns"""
+    with _lock:
+        return {name: stats.as_dict() for name, stats in sorted(_stats.items())}
+
+
+def dump(path):
+    """Write the recorded data to `path` as JSON"""
+    import json
+
+    with open(path, 'w') as fp:
+        json.dump({'enabled': _enabled[0], 'time': time.time(), 'functions': snapshot()}, fp, indent=1)
+
+
+if os.environ.get(ENV_VAR):
+    _enabled[0] = True
@@ -0,0 +1,216 @@
+"""Health checks for the entries of multi-value path variables"""
+
+from collections import namedtuple
+from concurrent.futures import Future, wait
+from enum import Enum
+import os
+import queue
+import stat
+import threading
+import time
+
+
+class PathState(Enum):
+    OK = 0
+    MISSING = 1
+    NOT_DIRECTORY = 2
+    UNREACHABLE = 3
+    DUPLICATE = 4
+    EMPTY = 5
+
+
+PathStatus = namedtuple('PathStatus', ['index', 'entry', 'path', 'state', 'duplicate_of'])
+
+
+# Variables which hold directories even if none of their entries contains a separator
+PATH_VARIABLES = frozenset(['path', 'psmodulepath', 'pythonpath', 'ld_library_path', 'library_path',
+                            'manpath', 'infopath', 'cdpath', 'include', 'lib', 'libpath',
+                            'pkg_config_path', 'xdg_config_dirs', 'xdg_data_dirs'])
+
+
+def is_path_variable(name, entries):
+    """Return True if the variable `name` with the values `entries` is a list of directories.
+
+    Lists such as PATHEXT or LANGUAGE are not, so their entries are not checked.
+    """
+    if name.lower() in PATH_VARIABLES:
+        return True
+    return any('/' in entry or '\\' in entry for entry in entries)
+
+
+def normalize(path, casefold=True):
+    """Return the form of `path` used to find duplicates which differ only by a trailing separator.
+
+    With `casefold` paths which differ only by case are also the same, as
+    on Windows.
+    """
+    path = path.rstrip('\\/')
+    return path.casefold() if casefold else path
+
+
+class _DaemonPool():
+    """A minimal thread pool whose workers are daemon threads.
+
+    The workers of :class:`concurrent.futures.ThreadPoolExecutor` are
+    joined when the interpreter exits, so a stat stuck on a hung mount
+    would stop the program from exiting.
+    """
+
+    def __init__(self, max_workers, name):
+        self._max_workers = max_workers
+        self._name = name
+        self._queue = queue.SimpleQueue()
+        self._threads = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('cannot submit after shutdown')
+            self._queue.put((future, func, args))
+            if len(self._threads) < self._max_workers:
+                thread = threading.Thread(target=self._work, daemon=True,
+                                          name='%s_%d' % (self._name, len(self._threads)))
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def shutdown(self):
+        """Cancel the work which has not started and let the workers exit without waiting for them"""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    item[0].cancel()
+            for _thread in self._threads:
+                self._queue.put(None)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            future, func, args = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+
+class PathChecker():
+    """Checks path entries by stat'ing directories concurrently in a thread pool.
+
+    Results are cached for `ttl` seconds. A directory which has not been
+    stat'ed within `timeout` seconds is reported as unreachable; its stat is
+    left running and the result is cached when it eventually completes, so a
+    hung mount point only ever occupies one worker. The workers are daemon
+    threads, so one stuck on a hung mount does not delay exiting. Entries
+    which differ only by case are reported as duplicates if `casefold` is
+    true, which suits a case-insensitive filesystem.
+    """
+
+    def __init__(self, max_workers=8, ttl=30.0, timeout=2.0, casefold=True):
+        self.ttl = ttl
+        self.casefold = casefold
+        self.timeout = timeout
+        self._executor = _DaemonPool(max_workers, 'pathcheck')
+        self._cache = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def check(self, entries, expanded=None):
+        """Return a :class:`PathStatus` for each entry in `entries`.
+
+        `expanded` optionally gives the expanded form of each entry, which
+        is the path that is checked. Blocks for at most :attr:`timeout`.
+        """
+        if expanded is None:
+            expanded = entries
+
+        seen = {}
+        statuses = [None] * len(entries)
+        futures = {}
+        for idx, (entry, path) in enumerate(zip(entries, expanded)):
+            if not path.strip():
+                statuses[idx] = PathStatus(idx, entry, path, PathState.EMPTY, None)
+                continue
+
+            key = normalize(path, self.casefold)
+            if key in seen:
+                statuses[idx] = PathStatus(idx, entry, path, PathState.DUPLICATE, seen[key])
+                continue
+            seen[key] = idx
+
+            state = self._cached(path)
+            if state is not None:
+                statuses[idx] = PathStatus(idx, entry, path, state, None)
+            else:
+                futures[idx] = self._submit(path)
+
+        if futures:
+            wait(futures.values(), timeout=self.timeout)
+            for idx, future in futures.items():
+                if future.done():
+                    state = future.result()
+                else:
+                    state = PathState.UNREACHABLE
+                statuses[idx] = PathStatus(idx, entries[idx], expanded[idx], state, None)
+
+        return statuses
+
+    def check_async(self, entries, callback, expanded=None):
+        """Run :meth:`check` on a background thread and pass the result to `callback` on that thread"""
+        thread = threading.Thread(target=lambda: callback(self.check(entries, expanded)), daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """Forget all cached results"""
+        with self._lock:
+            self._cache.clear()
+
+    def close(self):
+        """Cancel the pending checks and stop the workers without waiting for running ones"""
+        self._executor.shutdown()
+
+    def _cached(self, path):
+        with self._lock:
+            entry = self._cache.get(path)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _submit(self, path):
+        with self._lock:
+            future = self._pending.get(path)
+            if future is None:
+                try:
+                    future = self._pending[path] = self._executor.submit(self._stat, path)
+                except RuntimeError:
+                    # Closed; report the path as unreachable rather than failing the check
+                    future = Future()
+                    future.set_result(PathState.UNREACHABLE)
+        return future
+
+    def _stat(self, path):
+        try:
+            mode = os.stat(path).st_mode
+        except (FileNotFoundError, NotADirectoryError):
+            state = PathState.MISSING
+        except OSError:
+            state = PathState.UNREACHABLE
+        else:
+            state = PathState.OK if stat.S_ISDIR(mode) else PathState.NOT_DIRECTORY
+
+        with self._lock:
+            self._cache[path] = (time.monotonic() + self.ttl, state)
+            self._pending.pop(path, None)
+        return state
@@ -0,0 +1,203 @@
+"""Registry access for :class:`~enveditor.envstore.WindowsEnvStore`.
+
+The store talks to the registry through an object with the same interface
+as the :mod:`winreg` module. :func:`system_registry` returns :mod:`winreg`
+itself where it is available, and :class:`MemoryRegistry` implements the
+same calls in memory so that the store can be used on any platform.
+"""
+
+import time
+
+try:
+    import winreg
+except ImportError:
+    winreg = None
+
+HKEY_CURRENT_USER = 0x80000001
+HKEY_LOCAL_MACHINE = 0x80000002
+
+KEY_READ = 0x20019
+KEY_SET_VALUE = 0x0002
+KEY_WRITE = 0x20006
+KEY_ALL_ACCESS = 0xF003F
+
+REG_SZ = 1
+REG_EXPAND_SZ = 2
+
+SYSTEM_ENVIRONMENT = 'SYSTEM\\CurrentControlSet\\Control\\Session Manager\\Environment'
+USER_ENVIRONMENT = 'Environment'
+
+# Offset between the Unix epoch and 1601-01-01 in 100ns intervals
+_EPOCH_OFFSET = 116444736000000000
+
+
+def system_registry():
+    """Return the :mod:`winreg` module, or None if it is not available"""
+    return winreg
+
+
+class _KeyData():
+    __slots__ = ('values', 'last_write', '_ordered')
+
+    def __init__(self):
+        self.values = {}
+        self.last_write = 0
+        self._ordered = None
+
+    def ordered(self):
+        if self._ordered is None:
+            self._ordered = tuple(self.values.values())
+        return self._ordered
+
+    def touch(self, last_write):
+        self.last_write = last_write
+        self._ordered = None
+
+
+class MemoryKey():
+    """An open key handle returned by :meth:`MemoryRegistry.OpenKey`"""
+
+    __slots__ = ('_data', 'access')
+
+    def __init__(self, data, access):
+        self._data = data
+        self.access = access
+
+    def Close(self):
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.Close()
+
+    @property
+    def data(self):
+        if self._data is None:
+            raise OSError('The handle is invalid')
+        return self._data
+
+
+class MemoryRegistry():
+    """An in-memory registry which implements the parts of :mod:`winreg` used by the stores.
+
+    Key paths and value names are case insensitive and case preserving as in
+    the real registry, and every write advances the key's last-write time.
+    """
+
+    HKEY_CURRENT_USER = HKEY_CURRENT_USER
+    HKEY_LOCAL_MACHINE = HKEY_LOCAL_MACHINE
+    KEY_READ = KEY_READ
+    KEY_SET_VALUE = KEY_SET_VALUE
+    KEY_WRITE = KEY_WRITE
+    KEY_ALL_ACCESS = KEY_ALL_ACCESS
+    REG_SZ = REG_SZ
+    REG_EXPAND_SZ = REG_EXPAND_SZ
+
+    def __init__(self):
+        self._keys = {}
+        self._clock = 0
+
+    def OpenKey(self, key, sub_key, reserved=0, access=KEY_READ):
+        data = self._keys.get((key, sub_key.lower()))
+        if data is None:
+            raise FileNotFoundError(2, 'The system cannot find the file specified')
+        return MemoryKey(data, access)
+
+    def CreateKey(self, key, sub_key):
+        data = self._keys.get((key, sub_key.lower()))
+        if data is None:
+            data = self._keys[(key, sub_key.lower())] = _KeyData()
+            data.touch(self._tick())
+        return MemoryKey(data, KEY_ALL_ACCESS)
+
+    def CloseKey(self, hkey):
+        hkey.Close()
+
+    def QueryInfoKey(self, key):
+        data = key.data
+        return 0, len(data.values), data.last_write
+
+    def EnumValue(self, key, index):
+        values = key.data.ordered()
+        if index >= len(values):
+            raise OSError(259, 'No more data is available')
+        return values[index]
+
+    def QueryValueEx(self, key, value_name):
+        value = key.data.values.get(value_name.lower())
+        if value is None:
+            raise FileNotFoundError(2, 'The system cannot find the file specified')
+        return value[1], value[2]
+
+    def SetValueEx(self, key, value_name, reserved, type, value):
+        self._check_write(key)
+        data = key.data
+        data.values[value_name.lower()] = (value_name, value, type)
+        data.touch(self._tick())
+
+    def DeleteValue(self, key, value):
+        self._check_write(key)
+        data = key.data
+        if value.lower() not in data.values:
+            raise FileNotFoundError(2, 'The system cannot find the file specified')
+        del data.values[value.lower()]
+        data.touch(self._tick())
+
+    def set_value(self, hkey, sub_key, name, value, type=REG_SZ):
+        """Create the key if needed and set a value on it; used to seed the registry"""
+        with self.CreateKey(hkey, sub_key) as key:
+            self.SetValueEx(key, name, 0, type, value)
+
+    def _check_write(self, key):
+        if not key.access & KEY_SET_VALUE:
+            raise PermissionError(5, 'Access is denied')
+
+    def _tick(self):
+        now = _EPOCH_OFFSET + int(time.time() * 10000000)
+        self._clock = max(now, self._clock + 1)
+        return self._clock
+
+
+def synthetic_registry(variables=1000, path_entries=100, shared=0.1, expand=0.2, lists=0.0, seed=0):
+    """Return a :class:`MemoryRegistry` seeded with synthetic system and user environments.
+
+    Each location is given `variables` values plus a ``Path`` value with
+    `path_entries` directories. A fraction `shared` of the names appear in
+    both locations, a fraction `expand` are REG_EXPAND_SZ values which
+    reference other variables and a fraction `lists` are lists of
+    directories drawn from the same pool as ``Path``.
+    """
+    import random
+
+    rng = random.Random(seed)
+    registry = MemoryRegistry()
+    directories = ['%%SystemRoot%%\\Tools\\%d\\bin' % idx for idx in range(path_entries * 2)]
+    locations = ((HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, 'Sys'),
+                 (HKEY_CURRENT_USER, USER_ENVIRONMENT, 'Usr'))
+
+    for hkey, sub_key, prefix in locations:
+        with registry.CreateKey(hkey, sub_key) as key:
+            registry.SetValueEx(key, 'SystemRoot', 0, REG_SZ, 'C:\\Windows')
+
+            for idx in range(variables):
+                if rng.random() < shared:
+                    name = 'Shared_%d' % idx
+                else:
+                    name = '%s_Var_%d' % (prefix, idx)
+
+                choice = rng.random()
+                if choice < lists:
+                    value = ';'.join(rng.sample(directories, min(10, len(directories))))
+                    registry.SetValueEx(key, name, 0, REG_EXPAND_SZ, value)
+                elif choice < lists + expand:
+                    value = '%%SystemRoot%%\\%s\\%d' % (prefix, rng.randrange(1000))
+                    registry.SetValueEx(key, name, 0, REG_EXPAND_SZ, value)
+                else:
+                    registry.SetValueEx(key, name, 0, REG_SZ, 'value-%d' % rng.randrange(100000))
+
+            path = ';'.join(rng.choice(directories) for _ in range(path_entries))
+            registry.SetValueEx(key, 'Path', 0, REG_EXPAND_SZ, path)
+
+    return registry
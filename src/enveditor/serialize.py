@@ -0,0 +1,331 @@
+"""Streaming import and export of environment variables.
+
+Three formats are supported, chosen from the file extension:
+
+* ``jsonl`` - JSON Lines, one object per variable holding its location,
+  name, raw value and registry type
+* ``env`` - ``NAME=value`` lines; ``# [system]`` and ``# [user]`` comment
+  lines select the location of the lines which follow
+* ``reg`` - a Windows Registry Editor 5.00 file
+
+Writers emit each variable as soon as it is produced and readers yield one
+record at a time, so neither ever holds a whole file in memory. Records are
+``(location, name, raw, type)`` tuples; `type` is None when the format does
+not record it and `raw` is None for a deletion.
+"""
+
+import codecs
+import json
+import re
+
+from .envstore import EnvLocation
+from .registry import REG_SZ, REG_EXPAND_SZ, SYSTEM_ENVIRONMENT, USER_ENVIRONMENT
+
+FORMATS = {'.jsonl': 'jsonl', '.json': 'jsonl', '.env': 'env', '.reg': 'reg'}
+
+_LOCATION_NAMES = {EnvLocation.ENV_SYSTEM: 'system', EnvLocation.ENV_USER: 'user'}
+_NAME_LOCATIONS = {name: location for location, name in _LOCATION_NAMES.items()}
+
+_REG_HEADER = 'Windows Registry Editor Version 5.00'
+_REG_KEYS = {EnvLocation.ENV_SYSTEM: 'HKEY_LOCAL_MACHINE\\' + SYSTEM_ENVIRONMENT,
+             EnvLocation.ENV_USER: 'HKEY_CURRENT_USER\\' + USER_ENVIRONMENT}
+_REG_LOCATIONS = {key.lower(): location for location, key in _REG_KEYS.items()}
+_REG_LINE_LENGTH = 80
+
+_ENV_SPECIAL = re.compile(r'[\s#"\'\\]')
+
+
+def format_for(path):
+    """Return the format name for `path` from its extension"""
+    for extension, fmt in FORMATS.items():
+        if path.lower().endswith(extension):
+            return fmt
+    raise ValueError('Unknown environment file format: %s' % path)
+
+
+def open_file(path, mode='r', fmt=None):
+    """Open `path` as text with the encoding its format uses.
+
+    ``.reg`` files are written as UTF-16 as regedit does; when reading, the
+    encoding is taken from the byte order mark.
+    """
+    fmt = fmt or format_for(path)
+    if 'w' in mode:
+        encoding = 'utf-16' if fmt == 'reg' else 'utf-8'
+    else:
+        with open(path, 'rb') as fp:
+            start = fp.read(3)
+        if start.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            encoding = 'utf-16'
+        else:
+            encoding = 'utf-8-sig'
+    return open(path, mode, encoding=encoding, newline='' if fmt == 'reg' else None)
+
+
+def store_records(store, location=EnvLocation.ENV_BOTH):
+    """Yield ``(location, name, raw, type)`` for the variables in `store` in sorted order"""
+    env = store.env
+    for loc in (EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER):
+        if location != EnvLocation.ENV_BOTH and location != loc:
+            continue
+        variables = env.variables(loc)
+        for key in env.sorted_keys(loc):
+            value = variables[key]
+            yield loc, store.name(loc, key), value.raw, value.type
+
+
+def dump(records, fp, fmt):
+    """Write `records` to the text file `fp` one at a time; returns the number written"""
+    return _WRITERS[fmt](records, fp)
+
+
+def load(fp, fmt, location=EnvLocation.ENV_USER):
+    """Yield records from the text file `fp`.
+
+    `location` is used for ``env`` files until a location comment is found.
+    """
+    return _READERS[fmt](fp, location)
+
+
+def export_store(store, path, fmt=None, location=EnvLocation.ENV_BOTH):
+    """Write the variables in `store` to `path`; returns the number written"""
+    fmt = fmt or format_for(path)
+    with open_file(path, 'w', fmt) as fp:
+        return dump(store_records(store, location), fp, fmt)
+
+
+def import_store(store, path, fmt=None, location=EnvLocation.ENV_USER):
+    """Apply the records in `path` to `store` in a single transaction.
+
+    Returns the :class:`~enveditor.envstore.EnvDiff` of the commit.
+    """
+    fmt = fmt or format_for(path)
+    txn = store.transaction()
+    with open_file(path, 'r', fmt) as fp:
+        for loc, name, raw, type in load(fp, fmt, location):
+            if raw is None:
+                txn.delete(loc, name)
+            else:
+                txn.set(loc, name, raw, type)
+    return txn.commit()
+
+
+def _write_jsonl(records, fp):
+    count = 0
+    for location, name, raw, type in records:
+        fp.write(json.dumps({'location': _LOCATION_NAMES[location], 'name': name,
+                             'value': raw, 'type': type}))
+        fp.write('\n')
+        count += 1
+    return count
+
+
+def _read_jsonl(fp, location):
+    for number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ValueError('Line %d: %s' % (number, exc))
+        yield _jsonl_record(record, location, number)
+
+
+def _jsonl_record(record, location, number):
+    # Return the record for a parsed line, raising ValueError if it is malformed
+    if not isinstance(record, dict):
+        raise ValueError('Line %d: expected an object' % number)
+
+    location_name = record.get('location', _LOCATION_NAMES[location])
+    if location_name not in _NAME_LOCATIONS:
+        raise ValueError('Line %d: unknown location %r' % (number, location_name))
+
+    name = record.get('name')
+    if not isinstance(name, str) or not name:
+        raise ValueError('Line %d: missing name' % number)
+
+    type = record.get('type')
+    if type is not None and (not isinstance(type, int) or isinstance(type, bool)):
+        raise ValueError('Line %d: invalid type %r for %s' % (number, type, name))
+
+    raw = record.get('value')
+    if not (raw is None or isinstance(raw, str)
+            or (type is not None and isinstance(raw, int) and not isinstance(raw, bool))):
+        raise ValueError('Line %d: invalid value for %s' % (number, name))
+
+    return _NAME_LOCATIONS[location_name], name, raw, type
+
+
+def quote_env(value):
+    """Return `value` as it is written after ``NAME=`` in an ``env`` file.
+
+    Values with whitespace, quotes, ``#`` or backslashes are double quoted
+    with backslashes, double quotes and line breaks escaped, so that each
+    variable stays on one line. ``$`` is left for the program which reads
+    the file to expand.
+    """
+    if value and not _ENV_SPECIAL.search(value):
+        return value
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+    return '"%s"' % escaped
+
+
+def unquote_env(value):
+    """Return the value written after ``NAME=`` in an ``env`` file without its quotes and escapes"""
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] == "'":
+        return value[1:-1]
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        chars = []
+        escapes = {'n': '\n', 'r': '\r', 't': '\t'}
+        idx = 1
+        while idx < len(value) - 1:
+            char = value[idx]
+            if char == '\\' and idx + 1 < len(value) - 1:
+                idx += 1
+                char = escapes.get(value[idx], value[idx])
+            chars.append(char)
+            idx += 1
+        return ''.join(chars)
+    if ' #' in value:
+        value = value[:value.index(' #')].rstrip()
+    return value
+
+
+def _write_env(records, fp):
+    count = 0
+    current = None
+    for location, name, raw, type in records:
+        if location != current:
+            fp.write('%s# [%s]\n' % ('\n' if current is not None else '', _LOCATION_NAMES[location]))
+            current = location
+        fp.write('%s=%s\n' % (name, quote_env(raw)))
+        count += 1
+    return count
+
+
+def _read_env(fp, location):
+    for number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            section = line[1:].strip()
+            if section.startswith('[') and section.endswith(']'):
+                location = _NAME_LOCATIONS.get(section[1:-1].strip().lower(), location)
+            continue
+        if line.startswith('export '):
+            line = line[7:].lstrip()
+        name, sep, value = line.partition('=')
+        if sep:
+            name = name.strip()
+            if not name:
+                raise ValueError('Line %d: missing name' % number)
+            if any(char.isspace() for char in name):
+                raise ValueError('Line %d: invalid name %r' % (number, name))
+            yield location, name, unquote_env(value), None
+
+
+def _quote_reg(value):
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _hex_reg(prefix, data):
+    # Wrap the comma separated bytes as regedit does, with a trailing \ on continued lines
+    lines = []
+    line = prefix
+    for idx, byte in enumerate(data):
+        item = '%02x' % byte
+        if idx < len(data) - 1:
+            item += ','
+        if len(line) + len(item) > _REG_LINE_LENGTH - 1:
+            lines.append(line + '\\')
+            line = '  '
+        line += item
+    lines.append(line)
+    return '\r\n'.join(lines)
+
+
+def _write_reg(records, fp):
+    fp.write(_REG_HEADER + '\r\n')
+    count = 0
+    current = None
+    for location, name, raw, type in records:
+        if location != current:
+            fp.write('\r\n[%s]\r\n' % _REG_KEYS[location])
+            current = location
+        prefix = '%s=' % _quote_reg(name)
+        if type == REG_EXPAND_SZ:
+            fp.write(_hex_reg(prefix + 'hex(2):', (raw + '\0').encode('utf-16-le')))
+        else:
+            fp.write(prefix + _quote_reg(raw))
+        fp.write('\r\n')
+        count += 1
+    return count
+
+
+def _reg_lines(fp):
+    # Join lines continued with a trailing backslash into logical lines
+    pending = ''
+    for line in fp:
+        line = line.rstrip('\r\n')
+        if line.endswith('\\'):
+            pending += line[:-1].strip()
+            continue
+        yield pending + line.strip() if pending else line
+        pending = ''
+    if pending:
+        yield pending
+
+
+def _parse_reg_string(text, start):
+    # Return the unescaped string starting at the quote at `start` and the index after it
+    chars = []
+    idx = start + 1
+    while idx < len(text):
+        char = text[idx]
+        if char == '\\' and idx + 1 < len(text):
+            idx += 1
+            chars.append(text[idx])
+        elif char == '"':
+            return ''.join(chars), idx + 1
+        else:
+            chars.append(char)
+        idx += 1
+    raise ValueError('Unterminated string in .reg file: %s' % text)
+
+
+def _read_reg(fp, location):
+    # The location comes from the key sections; values outside them are ignored
+    location = None
+    for line in _reg_lines(fp):
+        line = line.strip()
+        if not line or line.startswith(';') or line == _REG_HEADER:
+            continue
+        if line.startswith('['):
+            location = _REG_LOCATIONS.get(line.strip('[]').lower())
+            continue
+        if location is None or not line.startswith('"'):
+            continue
+
+        name, idx = _parse_reg_string(line, 0)
+        data = line[idx:].lstrip()
+        if not data.startswith('='):
+            continue
+        data = data[1:].strip()
+        if not name:
+            raise ValueError('Missing name in .reg file: %s' % line)
+
+        if data == '-':
+            yield location, name, None, None
+        elif data.startswith('"'):
+            yield location, name, _parse_reg_string(data, 0)[0], REG_SZ
+        elif data.lower().startswith('hex(2):'):
+            hex_data = data[7:].replace(',', '').replace(' ', '')
+            value = bytes.fromhex(hex_data).decode('utf-16-le').rstrip('\0')
+            yield location, name, value, REG_EXPAND_SZ
+
+
+_WRITERS = {'jsonl': _write_jsonl, 'env': _write_env, 'reg': _write_reg}
+_READERS = {'jsonl': _read_jsonl, 'env': _read_env, 'reg': _read_reg}
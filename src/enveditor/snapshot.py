@@ -0,0 +1,160 @@
+"""Timestamped snapshots of an :class:`~enveditor.envstore.Env` in a SQLite database.
+
+Values are stored once per distinct content, keyed by their SHA-1 hash. The
+variables of each location form a manifest, itself identified by the hash of
+its names, types and value hashes, so a location which is unchanged between
+snapshots adds no rows at all. Diffs compare manifests and value hashes and
+never need to read the values themselves.
+"""
+
+import hashlib
+import sqlite3
+import time
+
+from .envstore import Env, EnvDiff, EnvKey, EnvLocation
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    value TEXT NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS manifests (
+    hash BLOB NOT NULL,
+    name TEXT NOT NULL,
+    type INTEGER NOT NULL,
+    value_hash BLOB NOT NULL,
+    PRIMARY KEY (hash, name)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    taken REAL NOT NULL,
+    label TEXT,
+    pathsep TEXT NOT NULL,
+    system_manifest BLOB NOT NULL,
+    user_manifest BLOB NOT NULL
+);
+'''
+
+_LOCATIONS = ((EnvLocation.ENV_SYSTEM, 'system_manifest'),
+              (EnvLocation.ENV_USER, 'user_manifest'))
+
+
+def value_hash(raw):
+    """Return the content hash of a raw value"""
+    return hashlib.sha1(str(raw).encode('utf-8', 'surrogatepass')).digest()
+
+
+def _manifest(variables):
+    # Return the manifest hash and a dict of name to (type, value hash)
+    entries = {key: (value.type, value_hash(value.raw)) for key, value in variables.items()}
+    digest = hashlib.sha1()
+    for key in sorted(entries):
+        type, hash = entries[key]
+        digest.update(key.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0%d\0' % type)
+        digest.update(hash)
+    return digest.digest(), entries
+
+
+class SnapshotStore():
+    """Saves, loads and diffs snapshots of environments in the SQLite file `path`.
+
+    Methods which take a snapshot id raise :class:`KeyError` with the id if
+    there is no such snapshot.
+    """
+
+    def __init__(self, path):
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def save(self, env, label=None, taken=None):
+        """Save a snapshot of `env` and return its id"""
+        manifests = []
+        with self._db:
+            for location, _column in _LOCATIONS:
+                variables = env.variables(location)
+                manifest, entries = _manifest(variables)
+                manifests.append(manifest)
+
+                if self._db.execute('SELECT 1 FROM manifests WHERE hash = ? LIMIT 1', (manifest,)).fetchone():
+                    continue
+
+                self._db.executemany('INSERT OR IGNORE INTO blobs (hash, value) VALUES (?, ?)',
+                                     ((hash, str(variables[key].raw)) for key, (type, hash) in entries.items()))
+                self._db.executemany('INSERT INTO manifests (hash, name, type, value_hash) VALUES (?, ?, ?, ?)',
+                                     ((manifest, key, type, hash) for key, (type, hash) in entries.items()))
+
+            cursor = self._db.execute('INSERT INTO snapshots (taken, label, pathsep, system_manifest, user_manifest) '
+                                      'VALUES (?, ?, ?, ?, ?)',
+                                      (time.time() if taken is None else taken, label, env.pathsep,
+                                       manifests[0], manifests[1]))
+        return cursor.lastrowid
+
+    def snapshots(self):
+        """Return a list of ``(id, taken, label)`` for every snapshot, oldest first"""
+        return self._db.execute('SELECT id, taken, label FROM snapshots ORDER BY taken, id').fetchall()
+
+    def load(self, snapshot_id):
+        """Return a new :class:`~enveditor.envstore.Env` holding the variables in a snapshot"""
+        env = Env()
+        env.pathsep = self._snapshot_column(snapshot_id, 'pathsep')
+        for location, column in _LOCATIONS:
+            variables = env.variables(location)
+            rows = self._db.execute('SELECT m.name, m.type, b.value FROM manifests m '
+                                    'JOIN blobs b ON b.hash = m.value_hash WHERE m.hash = ?',
+                                    (self._snapshot_column(snapshot_id, column),))
+            for name, type, value in rows:
+                variables[name] = EnvKey(value, type)
+        return env
+
+    def diff(self, old_id, new_id):
+        """Return an :class:`~enveditor.envstore.EnvDiff` of the changes from one snapshot to another"""
+        diff = EnvDiff()
+        for location, column in _LOCATIONS:
+            old = self._snapshot_column(old_id, column)
+            new = self._snapshot_column(new_id, column)
+            if old != new:
+                self._compare(diff, location, self._entries(old), self._entries(new))
+        return diff
+
+    def diff_live(self, snapshot_id, env):
+        """Return an :class:`~enveditor.envstore.EnvDiff` of the changes from a snapshot to `env`"""
+        diff = EnvDiff()
+        for location, column in _LOCATIONS:
+            old = self._snapshot_column(snapshot_id, column)
+            new, entries = _manifest(env.variables(location))
+            if old != new:
+                self._compare(diff, location, self._entries(old), entries)
+        return diff
+
+    def _snapshot_column(self, snapshot_id, column):
+        row = self._db.execute('SELECT %s FROM snapshots WHERE id = ?' % column, (snapshot_id,)).fetchone()
+        if row is None:
+            raise KeyError(snapshot_id)
+        return row[0]
+
+    def _entries(self, manifest):
+        rows = self._db.execute('SELECT name, type, value_hash FROM manifests WHERE hash = ?', (manifest,))
+        return {name: (type, hash) for name, type, hash in rows}
+
+    def _compare(self, diff, location, old, new):
+        for key, entry in new.items():
+            current = old.get(key)
+            if current is None:
+                diff.added.add((location, key))
+            elif current != entry:
+                diff.changed.add((location, key))
+        for key in old:
+            if key not in new:
+                diff.removed.add((location, key))
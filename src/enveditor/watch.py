@@ -0,0 +1,159 @@
+"""Watching a store for changes made by other programs.
+
+An :class:`EnvWatcher` compares the store's :meth:`~enveditor.envstore.EnvStore.stamp`
+on a background thread, which costs a registry query or a few ``stat``
+calls per interval. Where inotify is available it also waits on the
+directories of a file-backed store, so changes are seen as soon as they
+are made. Once a change is seen the watcher waits for the store to be
+quiet for the debounce period, so that a burst of writes produces a
+single update.
+"""
+
+import os
+import select
+import sys
+import threading
+
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+
+
+class _Inotify():
+    """Waits for changes in a set of directories using inotify through :mod:`ctypes`"""
+
+    def __init__(self, directories):
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        watched = 0
+        for directory in directories:
+            if libc.inotify_add_watch(self._fd, os.fsencode(directory), _IN_MASK) >= 0:
+                watched += 1
+        if not watched:
+            os.close(self._fd)
+            raise OSError('No directories could be watched')
+
+        self._wakeup = os.pipe()
+
+    def wait(self, timeout):
+        """Return True if there were events within `timeout` seconds, draining them"""
+        ready, _w, _x = select.select([self._fd, self._wakeup[0]], [], [], timeout)
+        if self._fd not in ready:
+            return False
+        try:
+            while os.read(self._fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def wake(self):
+        os.write(self._wakeup[1], b'\0')
+
+    def close(self):
+        for fd in (self._fd,) + self._wakeup:
+            os.close(fd)
+
+
+class EnvWatcher():
+    """Calls `callback` with an :class:`~enveditor.envstore.EnvDiff` when the variables in `store` change.
+
+    The store is checked every `interval` seconds, and a change is acted on
+    once the store has been unchanged for `debounce` seconds. The update is
+    passed to `dispatch`, which should run it on the thread which owns the
+    store's :class:`~enveditor.envstore.Env`; by default it runs on the
+    watcher thread. The update calls :meth:`~enveditor.envstore.EnvStore.update`
+    and then `callback` if anything changed.
+    """
+
+    def __init__(self, store, callback, interval=1.0, debounce=0.2, dispatch=None):
+        self.interval = interval
+        self.debounce = debounce
+        self._store = store
+        self._callback = callback
+        self._dispatch = dispatch or (lambda update: update())
+        self._stamp = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def uses_inotify(self):
+        return self._inotify is not None
+
+    def start(self):
+        if self.running:
+            return
+        self._stopping.clear()
+        self._stamp = self._store.stamp()
+        self._inotify = self._create_inotify()
+        self._thread = threading.Thread(target=self._run, name='envwatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._inotify is not None:
+            self._inotify.wake()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _create_inotify(self):
+        if not sys.platform.startswith('linux'):
+            return None
+        directories = [path for path in self._store.watch_paths() if os.path.isdir(path)]
+        if not directories:
+            return None
+        try:
+            return _Inotify(directories)
+        except (AttributeError, OSError):
+            return None
+
+    def _wait(self, timeout):
+        # Return True if inotify reported events; returns early when stopping
+        if self._inotify is not None:
+            return self._inotify.wait(timeout)
+        self._stopping.wait(timeout)
+        return False
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wait(self.interval)
+            stamp = self._store.stamp()
+            if self._stopping.is_set() or (stamp is not None and stamp == self._stamp):
+                continue
+
+            # Wait until a whole debounce period passes with no events and no change
+            while stamp is not None and not self._stopping.is_set():
+                events = self._wait(self.debounce)
+                latest = self._store.stamp()
+                if not events and latest == stamp:
+                    break
+                stamp = latest
+
+            if not self._stopping.is_set():
+                self._stamp = stamp
+                self._dispatch(self._update)
+
+    def _update(self):
+        diff = self._store.update()
+        if diff:
+            self._callback(diff)
+        return diff
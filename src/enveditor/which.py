@@ -0,0 +1,206 @@
+"""Resolution of command names to executables across the directories of a PATH"""
+
+import os
+import stat
+
+from .envstore import EnvLocation
+
+
+class ExecutableIndex():
+    """An index of the executables found in a list of directories.
+
+    Directory listings are read with :func:`os.scandir` and cached by the
+    directory's modification time. With `pathext` (a list of extensions such
+    as ``['.COM', '.EXE']``) names resolve case insensitively as on Windows;
+    without it any file with an execute bit is an executable.
+
+    Resolutions are computed on demand and cached per command; reordering,
+    adding or removing directories only discards the commands found in the
+    directories whose position changed.
+    """
+
+    def __init__(self, directories=(), pathext=None):
+        self._pathext = [ext.lower() for ext in pathext] if pathext else None
+        self._listings = {}
+        self._commands = {}
+        self._resolved = {}
+        self._directories = []
+        self._positions = {}
+        self.set_path(directories)
+
+    @classmethod
+    def from_env(cls, env, location=EnvLocation.ENV_BOTH):
+        """Create an index from the expanded ``path`` and ``pathext`` variables in an :class:`~enveditor.envstore.Env`.
+
+        With ENV_BOTH the system directories come before the user directories.
+        """
+        directories = path_directories(env, location)
+
+        pathext = None
+        if env.pathsep == ';':
+            for key in env.get('pathext', location=location).get('pathext', {}).values():
+                pathext = [ext for ext in key.raw.split(';') if ext]
+                break
+            else:
+                pathext = ['.com', '.exe', '.bat', '.cmd']
+
+        return cls(directories, pathext)
+
+    @property
+    def directories(self):
+        return list(self._directories)
+
+    def which(self, name):
+        """Return the path `name` resolves to, or None"""
+        candidates = self.candidates(name)
+        return candidates[0] if candidates else None
+
+    def candidates(self, name):
+        """Return every path `name` could resolve to in resolution order; all but the first are shadowed"""
+        command, extension = self._command(name)
+        resolved = self._resolved.get(command)
+        if resolved is None:
+            directories = sorted(self._commands.get(command, ()), key=self._positions.__getitem__)
+            resolved = []
+            for directory in directories:
+                for filename in self._listings[directory][1][command]:
+                    resolved.append(os.path.join(directory, filename))
+            self._resolved[command] = resolved
+
+        if extension:
+            return [path for path in resolved if path.lower().endswith(extension)]
+        return list(resolved)
+
+    def shadowed(self):
+        """Return a dict of command name to its candidates for every command found more than once"""
+        result = {}
+        for command in self._commands:
+            candidates = self.candidates(command)
+            if len(candidates) > 1:
+                result[command] = candidates
+        return result
+
+    def set_path(self, directories):
+        """Replace the directory list, rescanning only directories not already cached"""
+        positions = {}
+        for directory in directories:
+            if directory and directory not in positions:
+                positions[directory] = len(positions)
+
+        affected = set()
+        for directory, position in positions.items():
+            if self._positions.get(directory) != position:
+                affected.add(directory)
+        for directory in self._positions:
+            if directory not in positions:
+                affected.add(directory)
+                self._unindex(directory)
+
+        self._directories = list(directories)
+        self._positions = positions
+        for directory in affected:
+            if directory in positions:
+                self._scan(directory)
+            self._invalidate(directory)
+
+    def move(self, old_index, new_index):
+        """Move the directory at `old_index` to `new_index`, as Move Up and Move Down do"""
+        directories = list(self._directories)
+        directories.insert(new_index, directories.pop(old_index))
+        self.set_path(directories)
+
+    def refresh(self):
+        """Rescan the directories whose modification time has changed"""
+        for directory in self._positions:
+            mtime = self._mtime(directory)
+            cached = self._listings.get(directory)
+            if cached is None or cached[0] != mtime:
+                self._scan(directory)
+                self._invalidate(directory)
+
+    def _command(self, name):
+        if self._pathext:
+            name = name.lower()
+            root, extension = os.path.splitext(name)
+            if extension in self._pathext:
+                return root, extension
+        return name, None
+
+    def _mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self, directory):
+        mtime = self._mtime(directory)
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            listing = cached[1]
+        else:
+            listing = self._read_directory(directory) if mtime is not None else {}
+
+        self._invalidate(directory)
+        self._unindex(directory)
+        self._listings[directory] = (mtime, listing)
+        for command in listing:
+            self._commands.setdefault(command, set()).add(directory)
+
+    def _unindex(self, directory):
+        cached = self._listings.get(directory)
+        if cached is None:
+            return
+        for command in cached[1]:
+            directories = self._commands.get(command)
+            if directories is not None:
+                directories.discard(directory)
+                if not directories:
+                    del self._commands[command]
+
+    def _invalidate(self, directory):
+        cached = self._listings.get(directory)
+        if cached is not None:
+            for command in cached[1]:
+                self._resolved.pop(command, None)
+
+    def _read_directory(self, directory):
+        # Return a dict of command name to the matching file names in resolution order
+        listing = {}
+        pathext = self._pathext
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        if pathext:
+                            root, extension = os.path.splitext(entry.name.lower())
+                            if extension not in pathext:
+                                continue
+                        else:
+                            if not entry.stat().st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+                                continue
+                            root = entry.name
+                    except OSError:
+                        continue
+                    listing.setdefault(root, []).append(entry.name)
+        except OSError:
+            return {}
+
+        if pathext:
+            order = {ext: idx for idx, ext in enumerate(pathext)}
+            for filenames in listing.values():
+                filenames.sort(key=lambda filename: order[os.path.splitext(filename.lower())[1]])
+        return listing
+
+
+def path_directories(env, location=EnvLocation.ENV_BOTH):
+    """Return the expanded directories of the ``path`` variable in `location` of an :class:`~enveditor.envstore.Env`.
+
+    With ENV_BOTH the system directories come before the user directories.
+    """
+    directories = []
+    for name, key in sorted(env.get('path', location=location).get('path', {}).items(),
+                            key=lambda item: item[0] != 'system'):
+        directories.extend(key.entries)
+    return directories
@@ -2,3 +2,61 @@ import os
 import sys
 sys.path.insert(0,
                 os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+
+from enveditor.envstore import WindowsEnvStore
+from enveditor.filestore import FileEnvStore
+from enveditor.registry import MemoryRegistry, HKEY_CURRENT_USER, HKEY_LOCAL_MACHINE, \
+    SYSTEM_ENVIRONMENT, USER_ENVIRONMENT, REG_SZ, REG_EXPAND_SZ
+
+SYSTEM_VALUES = [('Path', 'C:\\Windows;%Root%\\bin', REG_EXPAND_SZ),
+                 ('Root', 'C:\\Tools', REG_SZ),
+                 ('PathExt', '.COM;.EXE', REG_SZ),
+                 ('OS', 'Windows_NT', REG_SZ)]
+USER_VALUES = [('Path', 'C:\\Users\\me\\bin', REG_SZ),
+               ('Temp', 'C:\\Temp', REG_SZ)]
+
+
+@pytest.fixture
+def make_store():
+    """Return a function which builds an updated WindowsEnvStore on a MemoryRegistry.
+
+    `system` and `user` are lists of ``(name, value, type)`` and default to
+    the values above; other keyword arguments are passed to the store. The
+    registry is the store's ``_registry``.
+    """
+    def make(system=SYSTEM_VALUES, user=USER_VALUES, registry=None, **kwargs):
+        registry = registry or MemoryRegistry()
+        for root, sub_key, values in ((HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, system),
+                                      (HKEY_CURRENT_USER, USER_ENVIRONMENT, user)):
+            registry.CreateKey(root, sub_key).Close()
+            for name, value, type in values:
+                registry.set_value(root, sub_key, name, value, type)
+        store = WindowsEnvStore(registry, **kwargs)
+        store.update()
+        return store
+    return make
+
+
+@pytest.fixture
+def store(make_store):
+    """A store holding the default values"""
+    return make_store()
+
+
+@pytest.fixture
+def file_store(tmp_path):
+    """Return a function which writes a system file and user files in `tmp_path` and builds an updated FileEnvStore for them"""
+    def make():
+        (tmp_path / 'environment').write_text('PATH="/usr/local/bin:/usr/bin"\nLANG=en_GB.UTF-8\n')
+        (tmp_path / '.pam_environment').write_text('# comment\nEDITOR DEFAULT=vim\nPAGER DEFAULT=less OVERRIDE=most\n')
+        conf = tmp_path / 'environment.d'
+        conf.mkdir()
+        (conf / '10-go.conf').write_text('GOPATH=/home/me/go\nEDITOR=nano\n')
+        (conf / '20-path.conf').write_text('PATH=/home/me/bin:/home/me/go/bin\n')
+        store = FileEnvStore(system=[str(tmp_path / 'environment')],
+                             user=[str(tmp_path / '.pam_environment'), str(conf / '*.conf')])
+        store.update()
+        return store
+    return make
@@ -0,0 +1,16 @@
+import copy
+
+from benchmark import bench_suite
+
+
+def test_bench_suite_run_compare():
+    results = bench_suite.run(sizes=[100], cases=['env.get_exact', 'store.update_unchanged'],
+                              repeat=2, min_time=0, gui=False)
+    assert [(result['case'], result['size']) for result in results['results']] == \
+        [('store.update_unchanged', 100), ('env.get_exact', 100)]
+    assert all(result['best'] > 0 for result in results['results'])
+
+    slower = copy.deepcopy(results)
+    slower['results'][1]['best'] *= 2
+    rows = bench_suite.compare(results, slower, threshold=0.5)
+    assert [(row[0], row[5]) for row in rows] == [('store.update_unchanged', False), ('env.get_exact', True)]
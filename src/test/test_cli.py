@@ -0,0 +1,73 @@
+import io
+import os
+import subprocess
+import sys
+
+from enveditor.cli import main
+from enveditor.registry import HKEY_CURRENT_USER, USER_ENVIRONMENT, REG_SZ
+
+
+def run(store, *argv):
+    out = io.StringIO()
+    status = main(list(argv), store=store, out=out)
+    return status, out.getvalue()
+
+
+def test_cli_get(store):
+    assert run(store, 'get', 'PATH') == (0, 'system\tC:\\Windows;%Root%\\bin\nuser\tC:\\Users\\me\\bin\n')
+    assert run(store, 'get', 'temp', '-l', 'user') == (0, 'C:\\Temp\n')
+    assert run(store, 'get', 'missing') == (1, '')
+
+
+def test_cli_search(store):
+    assert run(store, 'search', 'path') == (0, 'path\tsystem,user\npathext\tsystem\n')
+    assert run(store, 'search', 'pathe', '--prefix') == (0, 'pathext\tsystem\n')
+
+
+def test_cli_list(store):
+    assert run(store, 'list') == (0, 'os\npath\npathext\nroot\ntemp\n')
+    assert run(store, 'list', '-l', 'user') == (0, 'path\ntemp\n')
+
+
+def test_cli_shared(store):
+    assert run(store, 'shared') == (0, 'path\n')
+
+
+def test_cli_import_is_headless():
+    src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    code = ('import sys, enveditor.cli, enveditor.envstore; '
+            'print(",".join(m for m in ("tkinter", "ctypes", "random", "pprint", "inspect") if m in sys.modules))')
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=src)
+    assert output.strip() == b''
+
+
+def test_cli_which(tmp_path, make_store):
+    for name in ('a', 'b'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'tool.exe').write_text('')
+    store = make_store(system=[('Path', str(tmp_path / 'a'), REG_SZ)], user=[('Path', str(tmp_path / 'b'), REG_SZ)])
+    out = io.StringIO()
+    assert main(['which', '-a', 'tool'], store=store, out=out) == 0
+    assert out.getvalue() == '%s\n%s (shadowed)\n' % (tmp_path / 'a' / 'tool.exe', tmp_path / 'b' / 'tool.exe')
+
+
+def test_cli_snapshot(tmp_path, store):
+    database = str(tmp_path / 'history.db')
+    registry = store._registry
+    out = io.StringIO()
+    assert main(['snapshot', database, 'save', '--label', 'before'], store=store, out=out) == 0
+    assert out.getvalue() == '1\n'
+
+    registry.set_value(HKEY_CURRENT_USER, USER_ENVIRONMENT, 'Temp', 'D:\\Temp')
+    out = io.StringIO()
+    assert main(['snapshot', database, 'diff', '1'], store=store, out=out) == 1
+    assert out.getvalue() == '~ user\ttemp\n'
+
+
+def test_cli_snapshot_unknown_id(tmp_path, capsys, store):
+    database = str(tmp_path / 'history.db')
+    assert main(['snapshot', database, 'save'], store=store, out=io.StringIO()) == 0
+    assert main(['snapshot', database, 'diff', '99'], store=store, out=io.StringIO()) == 2
+    assert capsys.readouterr().err == 'enveditor: no snapshot 99\n'
+    assert main(['snapshot', database, 'diff', '1', '98'], store=store, out=io.StringIO()) == 2
+    assert capsys.readouterr().err == 'enveditor: no snapshot 98\n'
@@ -0,0 +1,336 @@
+import pytest
+
+from enveditor.envstore import Env, EnvKey, EnvLocation, PartialCommitError, WindowsEnvStore
+from enveditor.registry import MemoryRegistry, HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, REG_SZ, REG_EXPAND_SZ
+
+
+def test_EnvKey_lazy_value():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey('a;b', REG_SZ)
+    key = env.system['path']
+    assert key._value is None
+    assert key.value == ['a', 'b']
+    assert key.expanded is None
+
+
+def test_EnvKey_expanded(monkeypatch):
+    monkeypatch.setenv('ENVEDITOR_TEST_ROOT', 'C:\\Tools')
+    env = Env()
+    env.pathsep = ';'
+    env.user['path'] = EnvKey('%ENVEDITOR_TEST_ROOT%\\bin;x', REG_EXPAND_SZ)
+    assert env.user['path'].expanded == ['C:\\Tools\\bin', 'x']
+
+
+def test_Env_expand_own_variables(monkeypatch):
+    monkeypatch.setenv('TOOLS_ROOT', 'C:\\Elsewhere')
+    env = Env()
+    env.pathsep = ';'
+    env.system['tools_root'] = EnvKey('%SystemDrive%\\Tools', REG_EXPAND_SZ)
+    env.system['systemdrive'] = EnvKey('C:', REG_SZ)
+    env.system['path'] = EnvKey('%TOOLS_ROOT%\\bin;%Undefined_Enveditor%x', REG_EXPAND_SZ)
+    env.user['tools_root'] = EnvKey('D:\\Tools', REG_SZ)
+    env.user['path'] = EnvKey('%TOOLS_ROOT%\\bin;%SystemDrive%', REG_EXPAND_SZ)
+
+    # System values only see system variables; user values see user variables first
+    assert env.system['path'].expanded == ['C:\\Tools\\bin', 'x']
+    assert env.user['path'].expanded == ['D:\\Tools\\bin', 'C:']
+    order = env.expansion_order()
+    assert sorted(order, key=lambda node: (node[0].value, node[1])) == [
+        (EnvLocation.ENV_SYSTEM, 'path'), (EnvLocation.ENV_SYSTEM, 'tools_root'), (EnvLocation.ENV_USER, 'path')]
+    assert order.index((EnvLocation.ENV_SYSTEM, 'tools_root')) < order.index((EnvLocation.ENV_SYSTEM, 'path'))
+
+
+def test_Env_expand_cycles():
+    env = Env()
+    env.pathsep = ';'
+    env.system['a'] = EnvKey('%B%\\a', REG_EXPAND_SZ)
+    env.system['b'] = EnvKey('%A%\\b', REG_EXPAND_SZ)
+    env.system['c'] = EnvKey('%A%;c', REG_EXPAND_SZ)
+    env.user['path'] = EnvKey('%PATH%;x', REG_EXPAND_SZ)
+
+    assert env.cycles() == [(EnvLocation.ENV_SYSTEM, 'a'), (EnvLocation.ENV_SYSTEM, 'b'),
+                            (EnvLocation.ENV_USER, 'path')]
+    assert env.system['a'].expanded == '%B%\\a'
+    assert env.system['c'].expanded == ['%A%', 'c']
+    assert env.user['path'].expanded == ['%PATH%', 'x']
+
+    # Breaking the cycle expands the references again
+    env.system['b'] = EnvKey('B', REG_SZ)
+    assert env.cycles() == [(EnvLocation.ENV_USER, 'path')]
+    assert env.system['a'].expanded == 'B\\a'
+    assert env.system['c'].expanded == ['B\\a', 'c']
+
+    # As does forming a longer one, found from the changed variable alone
+    env.system['b'] = EnvKey('%C%', REG_EXPAND_SZ)
+    assert env.cycles() == [(EnvLocation.ENV_SYSTEM, 'a'), (EnvLocation.ENV_SYSTEM, 'b'),
+                            (EnvLocation.ENV_SYSTEM, 'c'), (EnvLocation.ENV_USER, 'path')]
+    assert env.system['c'].expanded == ['%A%', 'c']
+    del env.system['c']
+    assert env.system['a'].expanded == '\\a'
+
+
+def test_Env_expand_user_path_extends_system_path():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey('C:\\Windows;%TOOLS%', REG_EXPAND_SZ)
+    env.system['tools'] = EnvKey('C:\\Tools', REG_SZ)
+    env.user['path'] = EnvKey('%PATH%;%TOOLS%\\bin', REG_EXPAND_SZ)
+    env.user['tools'] = EnvKey('D:\\Tools', REG_SZ)
+    env.user['copy'] = EnvKey('%PATH%', REG_EXPAND_SZ)
+    env.user['same'] = EnvKey('%PATH%;%TOOLS%\\bin', REG_EXPAND_SZ)
+
+    assert env.cycles() == []
+    # expanded keeps one element for each entry of the value; entries splits them
+    assert env.user['path'].expanded == ['C:\\Windows;C:\\Tools', 'D:\\Tools\\bin']
+    assert env.user['path'].entries == ['C:\\Windows', 'C:\\Tools', 'D:\\Tools\\bin']
+    assert env.user['copy'].entries == ['C:\\Windows', 'C:\\Tools', 'D:\\Tools\\bin']
+    assert env.user['copy'].expanded == 'C:\\Windows;C:\\Tools;D:\\Tools\\bin'
+    # The same value in another variable refers to the user Path
+    assert env.user['same'].expanded == ['C:\\Windows;C:\\Tools;D:\\Tools\\bin', 'D:\\Tools\\bin']
+
+    env.system['tools'] = EnvKey('E:\\Tools', REG_SZ)
+    assert env.user['path'].expanded == ['C:\\Windows;E:\\Tools', 'D:\\Tools\\bin']
+    assert env.user['copy'].expanded == 'C:\\Windows;E:\\Tools;D:\\Tools\\bin'
+
+
+def test_Env_expand_incremental():
+    env = Env()
+    env.pathsep = ';'
+    env.system['tools_root'] = EnvKey('C:\\Tools', REG_SZ)
+    env.system['python'] = EnvKey('%TOOLS_ROOT%\\Python', REG_EXPAND_SZ)
+    env.system['path'] = EnvKey('%PYTHON%;%TOOLS_ROOT%\\bin;%WINDIR%', REG_EXPAND_SZ)
+    env.system['windir'] = EnvKey('C:\\Windows', REG_SZ)
+    env.user['path'] = EnvKey('%PYTHON%\\Scripts', REG_EXPAND_SZ)
+    env.user['other'] = EnvKey('%WINDIR%\\other', REG_EXPAND_SZ)
+    assert env.system['path'].expanded == ['C:\\Tools\\Python', 'C:\\Tools\\bin', 'C:\\Windows']
+    assert env.user['other'].expanded == 'C:\\Windows\\other'
+
+    assert env.dependents('TOOLS_ROOT') == [(EnvLocation.ENV_SYSTEM, 'path'), (EnvLocation.ENV_SYSTEM, 'python'),
+                                            (EnvLocation.ENV_USER, 'path')]
+
+    looked_up = []
+    lookup = env._lookup
+    env._lookup = lambda location, name: looked_up.append(name.lower()) or lookup(location, name)
+    for location, expander in env._expanders.items():
+        expander._lookup = lambda name, location=location: env._lookup(location, name)
+
+    env.system['tools_root'] = EnvKey('D:\\Tools', REG_SZ)
+    assert env.system['path'].expanded == ['D:\\Tools\\Python', 'D:\\Tools\\bin', 'C:\\Windows']
+    assert env.user['path'].expanded == 'D:\\Tools\\Python\\Scripts'
+    assert env.user['other'].expanded == 'C:\\Windows\\other'
+    # Only the references to the changed variable and its dependents were looked up again
+    assert 'windir' not in looked_up
+    assert set(looked_up) == {'python', 'tools_root'}
+
+    del env.system['tools_root']
+    assert env.system['python'].expanded == '\\Python'
+
+
+def test_Env_get():
+    env = Env()
+    env.system['path'] = EnvKey('a', REG_SZ)
+    env.system['pathext'] = EnvKey('.exe', REG_SZ)
+    env.user['path'] = EnvKey('b', REG_SZ)
+
+    result = env.get('path')
+    assert set(result) == {'path'}
+    assert set(result['path']) == {'system', 'user'}
+
+    result = env.get('ext', exact=False)
+    assert set(result) == {'pathext'}
+
+    result = env.get('path', location=EnvLocation.ENV_USER, exact=False)
+    assert set(result) == {'path'}
+    assert set(result['path']) == {'user'}
+
+    result = env.get_prefix('path', location=EnvLocation.ENV_SYSTEM)
+    assert set(result) == {'path', 'pathext'}
+
+
+def test_WindowsEnvStore_update(make_store):
+    store = WindowsEnvStore(make_store()._registry)
+    diff = store.update()
+
+    assert set(store.env.system) == {'path', 'root', 'pathext', 'os'}
+    assert set(store.env.user) == {'path', 'temp'}
+    assert store.env.system['path'].value == ['C:\\Windows', '%Root%\\bin']
+    assert len(diff.added) == 6
+
+
+def test_WindowsEnvStore_update_incremental(store):
+    registry = store._registry
+    env = store.env
+    path = env.user['path']
+
+    assert not store.update()
+
+    registry.set_value(HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, 'OS', 'ReactOS')
+    registry.set_value(HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, 'New', '1')
+    with registry.OpenKey(HKEY_LOCAL_MACHINE, SYSTEM_ENVIRONMENT, access=registry.KEY_SET_VALUE) as key:
+        registry.DeleteValue(key, 'Path')
+
+    diff = store.update()
+    assert store.env is env
+    assert env.user['path'] is path
+    assert diff.added == {(EnvLocation.ENV_SYSTEM, 'new')}
+    assert diff.removed == {(EnvLocation.ENV_SYSTEM, 'path')}
+    assert diff.changed == {(EnvLocation.ENV_SYSTEM, 'os')}
+    assert env.system['os'].value == 'ReactOS'
+
+
+class CountingRegistry(MemoryRegistry):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def SetValueEx(self, key, value_name, reserved, type, value):
+        self.writes.append(('set', value_name))
+        super().SetValueEx(key, value_name, reserved, type, value)
+
+    def DeleteValue(self, key, value):
+        self.writes.append(('delete', value))
+        super().DeleteValue(key, value)
+
+
+def test_EnvTransaction_commit(make_store):
+    notifications = []
+    store = make_store(registry=CountingRegistry(), notifier=notifications.append)
+    registry = store._registry
+    registry.writes.clear()
+
+    with store.transaction() as txn:
+        for idx in range(100):
+            txn.set(EnvLocation.ENV_SYSTEM, 'path', ['C:\\Windows', '%%TOOLS%%\\%d' % idx])
+        txn.set(EnvLocation.ENV_SYSTEM, 'OS', 'Windows_NT')
+        txn.set(EnvLocation.ENV_USER, 'New', 'value')
+        txn.delete(EnvLocation.ENV_USER, 'temp')
+
+    assert sorted(registry.writes) == [('delete', 'Temp'), ('set', 'New'), ('set', 'Path')]
+    assert len(notifications) == 1
+    diff = notifications[0]
+    assert diff.changed == {(EnvLocation.ENV_SYSTEM, 'path')}
+    assert diff.added == {(EnvLocation.ENV_USER, 'new')}
+    assert diff.removed == {(EnvLocation.ENV_USER, 'temp')}
+
+    assert store.env.system['path'].value == ['C:\\Windows', '%TOOLS%\\99']
+    assert store.env.system['path'].type == REG_EXPAND_SZ
+    assert not store.update()
+
+
+def test_EnvTransaction_rollback(make_store):
+    notifications = []
+    store = make_store(registry=CountingRegistry(), notifier=notifications.append)
+    registry = store._registry
+    registry.writes.clear()
+
+    txn = store.transaction()
+    txn.set(EnvLocation.ENV_USER, 'TEMP', 'D:\\Temp')
+    txn.rollback()
+    assert not txn.commit()
+    assert registry.writes == []
+    assert notifications == []
+
+
+def test_EnvTransaction_commit_failure(make_store):
+    notifications = []
+    store = make_store(notifier=notifications.append)
+    write = store._write
+    failing = set()
+
+    def fail(location, changes):
+        if location in failing:
+            raise PermissionError('Access is denied')
+        write(location, changes)
+    store._write = fail
+
+    txn = store.transaction()
+    txn.set(EnvLocation.ENV_SYSTEM, 'New', 'C:\\New')
+    txn.set(EnvLocation.ENV_USER, 'TEMP', 'D:\\Temp')
+
+    # Nothing is written, so nothing is lost
+    failing.update((EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER))
+    with pytest.raises(PermissionError):
+        txn.commit()
+    assert len(txn) == 2
+    assert 'new' not in store.env.system
+    assert notifications == []
+
+    # The system variables are written and applied, the user edit is kept
+    failing.discard(EnvLocation.ENV_SYSTEM)
+    with pytest.raises(PartialCommitError) as info:
+        txn.commit()
+    assert info.value.diff.added == {(EnvLocation.ENV_SYSTEM, 'new')}
+    assert not info.value.diff.changed
+    assert store.env.system['new'].raw == 'C:\\New'
+    assert store.env.user['temp'].raw == 'C:\\Temp'
+    assert notifications == [info.value.diff]
+    assert len(txn) == 1
+
+    failing.clear()
+    diff = txn.commit()
+    assert diff.changed == {(EnvLocation.ENV_USER, 'temp')} and not diff.added
+    assert store.env.user['temp'].raw == 'D:\\Temp'
+    assert len(txn) == 0
+
+
+def test_Env_interned_segments():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey(';'.join(['C:\\Windows', 'C:\\Tools']), REG_SZ)
+    env.user['path'] = EnvKey(';'.join(['C:\\Tools', 'C:\\Users\\me']), REG_SZ)
+    assert env.system['path'].value[1] is env.user['path'].value[0]
+
+
+def test_Env_prunes_interned_segments(monkeypatch):
+    monkeypatch.setattr(Env, 'MIN_INTERNED', 10)
+    env = Env()
+    env.pathsep = ';'
+    env.user['other'] = EnvKey('C:\\Keep;C:\\Tools', REG_SZ)
+    kept = env.user['other'].value
+    for idx in range(100):
+        env.system['path'] = EnvKey('C:\\Tools;C:\\edit%d' % idx, REG_SZ)
+        assert env.system['path'].value[0] is kept[1]
+    assert len(env._strings) <= 20
+    assert env._strings['C:\\Keep'] is kept[0]
+
+
+def test_Env_shared_variables():
+    env = Env()
+    env.system['path'] = EnvKey('a', REG_SZ)
+    env.system['temp'] = EnvKey('a', REG_SZ)
+    env.user['temp'] = EnvKey('b', REG_SZ)
+    assert env.shared_variables() == ['temp']
+
+    env.user['path'] = EnvKey('b', REG_SZ)
+    assert env.shared_variables() == ['path', 'temp']
+    assert env.sorted_keys(EnvLocation.ENV_BOTH) == ['path', 'temp']
+
+    del env.system['temp']
+    assert env.shared_variables() == ['path']
+    assert env.sorted_keys(EnvLocation.ENV_USER) == ['path', 'temp']
+
+    env.user.clear()
+    assert env.shared_variables() == []
+
+
+def test_Env_search():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey('C:\\Windows;C:\\Python', REG_SZ)
+    env.system['pathext'] = EnvKey('.COM;.EXE', REG_SZ)
+    env.system['pythonhome'] = EnvKey('C:\\Python', REG_SZ)
+    env.user['path'] = EnvKey('C:\\Users\\me', REG_SZ)
+    env.user['temp'] = EnvKey('C:\\Temp', REG_SZ)
+
+    assert env.search('PATH', EnvLocation.ENV_SYSTEM) == ['path', 'pathext']
+    assert env.search('python', EnvLocation.ENV_SYSTEM) == ['pythonhome']
+    assert env.search('python', EnvLocation.ENV_SYSTEM, values=True) == ['path', 'pythonhome']
+    assert env.search('users', EnvLocation.ENV_BOTH, values=True) == ['path']
+    assert env.search('', EnvLocation.ENV_USER) == ['path', 'temp']
+
+    # Refining only checks the previous matches, which must still exist
+    previous = env.search('pa', EnvLocation.ENV_SYSTEM)
+    del env.system['pathext']
+    env.system['pathology'] = EnvKey('x', REG_SZ)
+    assert env.search('pat', EnvLocation.ENV_SYSTEM, within=previous) == ['path']
@@ -1,12 +1,17 @@
+import sys
+
+import pytest
 from enveditor.envstore import WindowsEnvStore
 
+pytestmark = pytest.mark.skipif(sys.platform != 'win32', reason='requires the Windows Registry')
+
 def test_WindowsEnvStore_init():
     store = WindowsEnvStore()
     assert store.env is not None
 
 def test_WindowsEnvStore_load():
     store = WindowsEnvStore()
-    store.load()
+    store.update()
 
     assert len(store.env.system) != 0
     assert len(store.env.user) != 0
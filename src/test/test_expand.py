@@ -0,0 +1,90 @@
+from enveditor.expand import DependencyGraph, Expander, Template
+
+
+def test_Template_segments():
+    template = Template('%ROOT%\\bin;%Other%')
+    assert template.literals == ('', '\\bin;', '')
+    assert template.references == ('ROOT', 'Other')
+    assert template.names == {'root', 'other'}
+
+
+def test_Expander_expand():
+    values = {'ROOT': 'C:\\Tools'}
+    expander = Expander(lambda name: values.get(name, ''))
+    assert expander.expand('%ROOT%\\bin') == 'C:\\Tools\\bin'
+    assert expander.expand('%MISSING%\\bin') == '\\bin'
+    assert expander.expand('plain') == 'plain'
+
+
+def test_Expander_invalidate_referenced():
+    values = {'ROOT': 'C:\\Tools', 'OTHER': 'x'}
+    calls = []
+
+    def lookup(name):
+        calls.append(name)
+        return values.get(name, '')
+
+    expander = Expander(lookup)
+    expander.expand('%ROOT%\\bin')
+    expander.expand('%ROOT%\\bin')
+    assert calls == ['ROOT']
+
+    values['OTHER'] = 'y'
+    expander.invalidate(['other'])
+    assert expander.expand('%ROOT%\\bin') == 'C:\\Tools\\bin'
+    assert calls == ['ROOT']
+
+    values['ROOT'] = 'D:\\Tools'
+    expander.invalidate(['root'])
+    assert expander.expand('%ROOT%\\bin') == 'D:\\Tools\\bin'
+    assert calls == ['ROOT', 'ROOT']
+
+
+def test_Expander_invalidate_all():
+    values = {'ROOT': 'a'}
+    expander = Expander(lambda name: values.get(name, ''))
+    assert expander.expand('%ROOT%') == 'a'
+    values['ROOT'] = 'b'
+    expander.invalidate()
+    assert expander.expand('%ROOT%') == 'b'
+
+
+def test_Expander_max_size():
+    calls = []
+    expander = Expander(lambda name: calls.append(name) or name, max_size=2)
+    expander.expand('%A%')
+    expander.expand('%B%')
+    expander.expand('%A%')
+    expander.expand('%C%')
+    assert len(expander._cache) == 2 and len(expander._templates) == 2
+    # B was the least recently used, so it is expanded again
+    expander.expand('%A%')
+    expander.expand('%B%')
+    assert calls == ['A', 'B', 'C', 'B']
+
+
+def test_DependencyGraph():
+    graph = DependencyGraph()
+    a, b, c, d, e, f = [('sys', name) for name in 'abcdef']
+    graph.set(a, frozenset(['b']))
+    graph.set(b, frozenset(['c']))
+    graph.set(c, frozenset(['x']))
+    graph.set(d, frozenset(['a', 'e']))
+    graph.set(e, frozenset(['d']))
+    graph.set(f, frozenset(['f']))
+
+    assert graph.dependents(['c']) == {a, b, d, e}
+    assert graph.dependents(['x']) == {a, b, c, d, e}
+    assert graph.dependents(['z']) == set()
+
+    resolve = lambda node, name: ('sys', name)
+    order, cyclic = graph.order(resolve)
+    assert order == [c, b, a]
+    assert cyclic == {d, e, f}
+
+    assert graph.set(d, frozenset(['a'])) == frozenset(['a', 'e'])
+    assert graph.set(f, frozenset()) == frozenset(['f'])
+    assert not graph.is_referenced('f')
+    order, cyclic = graph.order(resolve)
+    assert order.index(a) < order.index(d) < order.index(e)
+    assert cyclic == set()
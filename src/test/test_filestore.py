@@ -0,0 +1,100 @@
+import io
+
+import pytest
+
+from enveditor.cli import main
+from enveditor.envstore import EnvLocation
+from enveditor.filestore import FileEnvStore, dotenv_store, format_line, parse_line
+from enveditor.registry import REG_SZ
+
+SYSTEM = EnvLocation.ENV_SYSTEM
+USER = EnvLocation.ENV_USER
+
+
+def test_parse_line():
+    assert parse_line('export NAME="a b"') == ('NAME', 'a b')
+    assert parse_line("NAME='x'") == ('NAME', 'x')
+    assert parse_line('# NAME=value') is None
+    assert parse_line('NAME DEFAULT=${HOME}/x', 'pam') == ('NAME', '${HOME}/x')
+    assert parse_line('NAME OVERRIDE=', 'pam') == ('NAME', '')
+
+
+@pytest.mark.parametrize('fmt', ['env', 'pam'])
+@pytest.mark.parametrize('value', ['plain', '', 'a b', 'x\ny', 'x\r\ny', 'say "hi"', "it's", 'C:\\bin', '${HOME}/bin'])
+def test_format_line_roundtrip(fmt, value):
+    line = format_line('NAME', value, fmt)
+    assert '\n' not in line
+    assert parse_line(line, fmt) == ('NAME', value)
+
+
+def test_FileEnvStore_read(file_store):
+    store = file_store()
+    env = store.env
+    assert env.system['path'].value == ['/usr/local/bin', '/usr/bin']
+    assert env.system['lang'].raw == 'en_GB.UTF-8'
+    assert env.user['editor'].raw == 'nano'
+    assert env.user['pager'].raw == 'most'
+    assert env.user['path'].value == ['/home/me/bin', '/home/me/go/bin']
+    assert store.name(USER, 'gopath') == 'GOPATH'
+    assert env.shared_variables() == ['path']
+
+
+def test_FileEnvStore_reparses_changed_files(tmp_path, file_store):
+    store = file_store()
+    parsed = []
+    lines = store._lines
+    store._lines = lambda path, size: parsed.append(path) or lines(path, size)
+
+    assert not store.update()
+    assert parsed == []
+
+    (tmp_path / 'environment.d' / '30-new.conf').write_text('NEW=1\n')
+    diff = store.update()
+    assert diff.added == {(USER, 'new')}
+    assert parsed == [str(tmp_path / 'environment.d' / '30-new.conf')]
+
+
+def test_FileEnvStore_mmap(monkeypatch, file_store):
+    monkeypatch.setattr(FileEnvStore, 'MMAP_THRESHOLD', 16)
+    store = file_store()
+    assert store.env.user['gopath'].raw == '/home/me/go'
+
+
+def test_FileEnvStore_write(tmp_path, file_store):
+    store = file_store()
+    with store.transaction() as txn:
+        txn.set(USER, 'Editor', 'emacs')
+        txn.set(USER, 'Pager', 'less -R')
+        txn.delete(SYSTEM, 'LANG')
+        txn.set(SYSTEM, 'Shell', '/bin/bash')
+
+    assert (tmp_path / 'environment').read_text() == 'PATH="/usr/local/bin:/usr/bin"\nShell=/bin/bash\n'
+    assert (tmp_path / '.pam_environment').read_text() == '# comment\nEDITOR DEFAULT=vim\nPAGER DEFAULT="less -R"\n'
+    assert (tmp_path / 'environment.d' / '10-go.conf').read_text() == 'GOPATH=/home/me/go\nEDITOR=emacs\n'
+
+    store.update()
+    assert store.env.user['pager'].raw == 'less -R'
+    assert 'lang' not in store.env.system
+
+
+def test_FileEnvStore_write_keeps_type(file_store):
+    store = file_store()
+    with store.transaction() as txn:
+        txn.set(USER, 'URL', 'http://host/a%20b')
+
+    assert store.env.user['url'].type == REG_SZ
+    assert not store.update()
+
+
+def test_cli_env_file(tmp_path):
+    path = tmp_path / '.env'
+    path.write_text('export TOKEN=abc\nDEBUG=1\n')
+    out = io.StringIO()
+    assert main(['--env-file', str(path), 'list'], out=out) == 0
+    assert out.getvalue() == 'debug\ntoken\n'
+
+    store = dotenv_store(str(path))
+    store.update()
+    with store.transaction() as txn:
+        txn.set(USER, 'DEBUG', '0')
+    assert path.read_text() == 'export TOKEN=abc\nDEBUG=0\n'
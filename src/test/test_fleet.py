@@ -0,0 +1,63 @@
+import io
+import pickle
+
+from enveditor.cli import main
+from enveditor.envstore import Env, EnvKey, EnvLocation
+from enveditor.fleet import Fleet, load_env
+from enveditor.registry import REG_SZ, REG_EXPAND_SZ
+from enveditor import serialize
+
+SYSTEM = EnvLocation.ENV_SYSTEM
+USER = EnvLocation.ENV_USER
+
+
+def write_fleet(tmp_path, machines=20):
+    for idx in range(machines):
+        records = [(SYSTEM, 'Path', 'C:\\Windows;C:\\Tools%d' % (idx % 2), REG_SZ),
+                   (USER, 'Temp', 'C:\\Temp', REG_SZ)]
+        if idx % 5 == 0:
+            records.append((USER, 'Proxy', 'http://proxy:%d' % idx, REG_SZ))
+        with serialize.open_file(str(tmp_path / ('pc%02d.jsonl' % idx)), 'w') as fp:
+            serialize.dump(records, fp, 'jsonl')
+    (tmp_path / 'broken.jsonl').write_text('{not json\n')
+
+
+def test_Env_pickle():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey('a;%ROOT%', REG_EXPAND_SZ)
+    env.user['path'] = EnvKey('b', REG_SZ)
+    copy = pickle.loads(pickle.dumps(env))
+    assert copy.system['path'] == env.system['path']
+    assert copy.system['path'].value == ['a', '%ROOT%']
+    assert copy.shared_variables() == ['path']
+
+
+def test_Fleet_queries(tmp_path):
+    write_fleet(tmp_path)
+    fleet = Fleet.from_paths([str(tmp_path)], max_workers=2, batch_size=3)
+
+    assert sorted(fleet.defines('PROXY')) == ['pc00', 'pc05', 'pc10', 'pc15']
+    assert fleet.errors and fleet.errors[0][0] == 'broken'
+
+    assert fleet.distribution('path', SYSTEM) == {'C:\\Windows;C:\\Tools0': 10, 'C:\\Windows;C:\\Tools1': 10}
+    assert fleet.distribution('path', entries=True) == {'C:\\Windows': 20, 'C:\\Tools0': 10, 'C:\\Tools1': 10}
+
+    baseline = load_env(str(tmp_path / 'pc00.jsonl'))
+    differences = dict(fleet.differences(baseline))
+    assert 'pc00' not in differences
+    assert differences['pc10'].changed == {(USER, 'proxy')}
+    assert differences['pc01'].changed == {(SYSTEM, 'path')}
+    assert differences['pc01'].removed == {(USER, 'proxy')}
+    assert len(differences) == 19
+
+
+def test_cli_fleet(tmp_path):
+    write_fleet(tmp_path, 6)
+    out = io.StringIO()
+    assert main(['fleet', 'defines', 'proxy', str(tmp_path), '-j', '2'], out=out) == 0
+    assert sorted(out.getvalue().split()) == ['pc00', 'pc05']
+
+    out = io.StringIO()
+    assert main(['fleet', 'diff', str(tmp_path / 'pc00.jsonl'), str(tmp_path / 'pc02.jsonl')], out=out) == 1
+    assert out.getvalue() == 'pc02\t- user\tproxy\n'
@@ -0,0 +1,85 @@
+from enveditor.envstore import EnvLocation
+from enveditor.history import History, PersistentList
+from enveditor.registry import REG_EXPAND_SZ
+
+SYSTEM = EnvLocation.ENV_SYSTEM
+USER = EnvLocation.ENV_USER
+
+
+def system_path(entries):
+    return [('Path', ';'.join('C:\\dir%d' % idx for idx in range(entries)), REG_EXPAND_SZ)]
+
+
+def test_PersistentList_operations():
+    items = ['item%d' % idx for idx in range(100)]
+    lst = PersistentList(items)
+    assert list(lst) == items
+    assert lst[40] == 'item40' and lst[-1] == 'item99'
+
+    assert list(lst.set(40, 'x')) == items[:40] + ['x'] + items[41:]
+    assert list(lst.delete(0)) == items[1:]
+    assert list(lst.insert(100, 'end')) == items + ['end']
+    assert list(lst.move(5, 2)) == items[:2] + ['item5'] + items[2:5] + items[6:]
+    assert list(lst) == items
+
+    grown = lst
+    for idx in range(100):
+        grown = grown.insert(50, 'new%d' % idx)
+    assert list(grown) == items[:50] + ['new%d' % idx for idx in reversed(range(100))] + items[50:]
+    assert max(len(chunk) for chunk in grown._chunks) < 2 * PersistentList.CHUNK_SIZE
+
+
+def test_PersistentList_shares_chunks():
+    lst = PersistentList('item%d' % idx for idx in range(1000))
+    edited = lst.set(500, 'x')
+    shared = sum(1 for old, new in zip(lst._chunks, edited._chunks) if old is new)
+    assert shared == len(lst._chunks) - 1
+
+
+def test_History_undo_redo(make_store):
+    store = make_store(system=system_path(4))
+    history = History(store)
+
+    path = history.state(SYSTEM, 'path')[0]
+    history.apply(SYSTEM, 'Path', path.move(3, 0))
+    history.apply(USER, 'New', 'value')
+    history.apply(USER, 'Temp', None)
+    assert store.env.system['path'].raw == 'C:\\dir3;C:\\dir0;C:\\dir1;C:\\dir2'
+    assert store.env.system['path'].type == REG_EXPAND_SZ
+    assert set(store.env.user) == {'new', 'path'}
+
+    diff = history.undo()
+    assert diff.added == {(USER, 'temp')}
+    assert store.env.user['temp'].raw == 'C:\\Temp'
+    history.undo()
+    history.undo()
+    assert store.env.system['path'].raw == 'C:\\dir0;C:\\dir1;C:\\dir2;C:\\dir3'
+    assert not history.can_undo and history.undo().keys() == set()
+
+    diff = history.redo()
+    assert diff.changed == {(SYSTEM, 'path')}
+    assert store.env.system['path'].raw.startswith('C:\\dir3;')
+    assert history.can_redo
+
+    history.apply(USER, 'Temp', 'D:\\Temp')
+    assert not history.can_redo
+
+
+def test_History_max_depth_and_sharing(make_store):
+    store = make_store(system=system_path(1000))
+    history = History(store, max_depth=10)
+    for idx in range(20):
+        path = history.state(SYSTEM, 'path')[0]
+        history.apply(SYSTEM, 'path', path.set(idx, 'D:\\edit%d' % idx))
+
+    steps = list(history._undo)
+    assert len(steps) == 10
+    # Consecutive steps derive from each other and share all but the edited chunks
+    assert steps[1].before is steps[0].after
+    before, after = steps[0].before[0], steps[0].after[0]
+    assert sum(1 for old, new in zip(before._chunks, after._chunks) if old is not new) == 1
+
+    for _idx in range(10):
+        history.undo()
+    assert store.env.system['path'].value[9] == 'D:\\edit9'
+    assert store.env.system['path'].value[10] == 'C:\\dir10'
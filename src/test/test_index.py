@@ -0,0 +1,43 @@
+from enveditor.index import KeyIndex
+
+
+def test_KeyIndex_sorted():
+    keys = {'path', 'temp', 'pathext'}
+    index = KeyIndex(keys)
+    assert index.sorted() == ['path', 'pathext', 'temp']
+
+    keys.add('os')
+    index.add('os')
+    keys.discard('temp')
+    index.discard('temp')
+    assert index.sorted() == ['os', 'path', 'pathext']
+
+
+def test_KeyIndex_prefix():
+    index = KeyIndex({'path', 'pathext', 'psmodulepath', 'temp'})
+    assert index.prefix('path') == ['path', 'pathext']
+    assert index.prefix('x') == []
+
+
+def test_KeyIndex_substring():
+    keys = {'path', 'pathext', 'psmodulepath', 'temp', 'os'}
+    index = KeyIndex(keys)
+    assert index.substring('path') == {'path', 'pathext', 'psmodulepath'}
+    assert index.substring('ext') == {'pathext'}
+    assert index.substring('at') == {'path', 'pathext', 'psmodulepath'}
+    assert index.substring('o') == {'os', 'psmodulepath'}
+    assert index.substring('') == keys
+    assert index.substring('missing') == set()
+
+
+def test_KeyIndex_substring_maintained():
+    keys = {'path'}
+    index = KeyIndex(keys)
+    assert index.substring('at') == {'path'}
+
+    keys.add('data')
+    index.add('data')
+    keys.discard('path')
+    index.discard('path')
+    assert index.substring('at') == {'data'}
+    assert index.substring('pat') == set()
@@ -0,0 +1,41 @@
+import json
+
+from enveditor import instrument
+from enveditor.envstore import Env, EnvKey, WindowsEnvStore
+from enveditor.registry import MemoryRegistry, HKEY_CURRENT_USER, USER_ENVIRONMENT, REG_SZ
+
+
+def test_instrument_enable_disable(tmp_path):
+    original = Env.get
+    instrument.reset()
+    instrument.enable()
+    try:
+        assert Env.get is not original
+        registry = MemoryRegistry()
+        registry.set_value(HKEY_CURRENT_USER, USER_ENVIRONMENT, 'Temp', 'C:\\Temp')
+        store = WindowsEnvStore(registry)
+        store.update()
+        store.env.get('temp')
+        store.env.get('temp', exact=False)
+    finally:
+        instrument.disable()
+    assert Env.get is original
+
+    data = instrument.snapshot()
+    assert data['Env.get']['count'] == 2
+    assert data['EnvStore.update']['count'] == 1
+    assert data['WindowsEnvStore._subkeys']['count'] == 1
+    assert sum(data['Env.get']['histogram'].values()) == 2
+    assert data['Env.get']['p95_ns'] >= data['Env.get']['p50_ns'] > 0
+
+    # Nothing is recorded while disabled
+    env = Env()
+    env.user['x'] = EnvKey('1', REG_SZ)
+    env.get('x')
+    assert instrument.snapshot()['Env.get']['count'] == 2
+
+    path = tmp_path / 'timings.json'
+    instrument.dump(str(path))
+    assert json.loads(path.read_text())['functions']['Env.get']['count'] == 2
+    instrument.reset()
+    assert instrument.snapshot() == {}
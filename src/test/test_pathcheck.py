@@ -0,0 +1,113 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from enveditor.pathcheck import PathChecker, PathState, is_path_variable
+
+
+def test_PathChecker_check(tmp_path):
+    existing = tmp_path / 'bin'
+    existing.mkdir()
+    a_file = tmp_path / 'file.txt'
+    a_file.write_text('')
+    entries = [str(existing), str(tmp_path / 'missing'), str(existing).upper() + os.sep,
+               str(a_file), '']
+
+    checker = PathChecker()
+    states = [status.state for status in checker.check(entries)]
+    assert states[:2] == [PathState.OK, PathState.MISSING]
+    assert states[3:] == [PathState.NOT_DIRECTORY, PathState.EMPTY]
+    duplicate = checker.check(entries)[2]
+    assert duplicate.state == PathState.DUPLICATE
+    assert duplicate.duplicate_of == 0
+    checker.close()
+
+
+def test_PathChecker_case_sensitive(tmp_path):
+    (tmp_path / 'Foo').mkdir()
+    entries = [str(tmp_path / 'Foo'), str(tmp_path / 'foo'), str(tmp_path / 'Foo') + os.sep]
+
+    checker = PathChecker(casefold=False)
+    states = [status.state for status in checker.check(entries)]
+    assert states[0] == PathState.OK
+    assert states[1] != PathState.DUPLICATE
+    assert states[2] == PathState.DUPLICATE
+    checker.close()
+
+
+def test_is_path_variable():
+    assert is_path_variable('Path', ['bin', 'tools'])
+    assert is_path_variable('TOOLS', ['C:\\Tools', 'D:\\Tools'])
+    assert is_path_variable('tools', ['/opt/tools', '/usr/local/tools'])
+    assert not is_path_variable('PATHEXT', ['.COM', '.EXE', '.BAT'])
+    assert not is_path_variable('LANGUAGE', ['en_GB', 'en'])
+
+
+def test_PathChecker_cache(tmp_path, monkeypatch):
+    calls = []
+    real_stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        calls.append(path)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    checker = PathChecker()
+    checker.check([str(tmp_path)])
+    checker.check([str(tmp_path)])
+    assert calls == [str(tmp_path)]
+
+    checker.clear()
+    checker.check([str(tmp_path)])
+    assert len(calls) == 2
+    checker.close()
+
+
+def test_PathChecker_unreachable(tmp_path, monkeypatch):
+    release = threading.Event()
+    real_stat = os.stat
+    hung = str(tmp_path / 'hung')
+
+    def slow_stat(path, *args, **kwargs):
+        if path == hung:
+            release.wait(5)
+        return real_stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', slow_stat)
+    checker = PathChecker(timeout=0.1)
+    start = time.monotonic()
+    statuses = checker.check([hung, str(tmp_path)])
+    assert time.monotonic() - start < 2
+    assert [status.state for status in statuses] == [PathState.UNREACHABLE, PathState.OK]
+    release.set()
+    checker.close()
+
+
+def test_PathChecker_check_async(tmp_path):
+    done = threading.Event()
+    results = []
+
+    def callback(statuses):
+        results.extend(statuses)
+        done.set()
+
+    checker = PathChecker()
+    checker.check_async(['%ROOT%'], callback, expanded=[str(tmp_path)])
+    assert done.wait(5)
+    assert results[0].state == PathState.OK
+    assert results[0].entry == '%ROOT%'
+    checker.close()
+
+
+def test_PathChecker_hung_stat_does_not_block_exit():
+    src = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    code = ('import os, threading\n'
+            'from enveditor.pathcheck import PathChecker, PathState\n'
+            'os.stat = lambda path, *args, **kwargs: threading.Event().wait()\n'
+            'checker = PathChecker(timeout=0.1)\n'
+            'assert checker.check(["/hung"])[0].state == PathState.UNREACHABLE\n'
+            'checker.close()\n'
+            'assert checker.check(["/other"])[0].state == PathState.UNREACHABLE\n')
+    subprocess.run([sys.executable, '-c', code], cwd=src, check=True, timeout=30)
@@ -0,0 +1,49 @@
+import pytest
+
+from enveditor.registry import MemoryRegistry, synthetic_registry, HKEY_CURRENT_USER, REG_SZ, REG_EXPAND_SZ
+
+
+def test_MemoryRegistry_enum():
+    registry = MemoryRegistry()
+    registry.set_value(HKEY_CURRENT_USER, 'Environment', 'Temp', 'C:\\Temp')
+    registry.set_value(HKEY_CURRENT_USER, 'Environment', 'Path', '%ROOT%\\bin', REG_EXPAND_SZ)
+
+    with registry.OpenKey(HKEY_CURRENT_USER, 'environment') as key:
+        info = registry.QueryInfoKey(key)
+        assert info[1] == 2
+        values = [registry.EnumValue(key, idx) for idx in range(info[1])]
+        with pytest.raises(OSError):
+            registry.EnumValue(key, info[1])
+
+    assert values == [('Temp', 'C:\\Temp', REG_SZ), ('Path', '%ROOT%\\bin', REG_EXPAND_SZ)]
+
+
+def test_MemoryRegistry_last_write():
+    registry = MemoryRegistry()
+    registry.set_value(HKEY_CURRENT_USER, 'Environment', 'Temp', 'a')
+    with registry.OpenKey(HKEY_CURRENT_USER, 'Environment') as key:
+        before = registry.QueryInfoKey(key)[2]
+
+    registry.set_value(HKEY_CURRENT_USER, 'Environment', 'TEMP', 'b')
+    with registry.OpenKey(HKEY_CURRENT_USER, 'Environment') as key:
+        assert registry.QueryInfoKey(key)[2] > before
+        assert registry.QueryValueEx(key, 'temp') == ('b', REG_SZ)
+
+
+def test_MemoryRegistry_read_only_handle():
+    registry = MemoryRegistry()
+    registry.set_value(HKEY_CURRENT_USER, 'Environment', 'Temp', 'a')
+    with registry.OpenKey(HKEY_CURRENT_USER, 'Environment') as key:
+        with pytest.raises(PermissionError):
+            registry.SetValueEx(key, 'Temp', 0, REG_SZ, 'b')
+
+
+def test_MemoryRegistry_missing_key():
+    with pytest.raises(FileNotFoundError):
+        MemoryRegistry().OpenKey(HKEY_CURRENT_USER, 'Environment')
+
+
+def test_synthetic_registry():
+    registry = synthetic_registry(variables=50, path_entries=10)
+    with registry.OpenKey(HKEY_CURRENT_USER, 'Environment') as key:
+        assert registry.QueryInfoKey(key)[1] == 52
@@ -0,0 +1,88 @@
+import pytest
+
+from enveditor.envstore import EnvLocation
+from enveditor.registry import REG_SZ, REG_EXPAND_SZ
+from enveditor.serialize import export_store, import_store, format_for
+
+
+SYSTEM = [('Path', 'C:\\Windows;%SystemRoot%\\System32;' + ';'.join('C:\\Tools\\%d' % idx for idx in range(50)),
+           REG_EXPAND_SZ),
+          ('OS', 'Windows_NT', REG_SZ)]
+USER = [('Quoted', 'say "hi" # not a comment $HOME', REG_SZ),
+        ('Empty', '', REG_SZ)]
+
+
+@pytest.mark.parametrize('extension', ['.jsonl', '.env', '.reg'])
+def test_roundtrip(tmp_path, extension, make_store):
+    source = make_store(SYSTEM, USER)
+    path = str(tmp_path / ('profile' + extension))
+    assert export_store(source, path) == 4
+
+    target = make_store((), ())
+    diff = import_store(target, path)
+    assert len(diff.added) == 4
+
+    for location in (EnvLocation.ENV_SYSTEM, EnvLocation.ENV_USER):
+        variables = target.env.variables(location)
+        for key, value in source.env.variables(location).items():
+            assert variables[key].raw == value.raw
+            assert variables[key].type == value.type
+    assert target.name(EnvLocation.ENV_SYSTEM, 'path') == 'Path'
+
+
+def test_import_reg_deletion(tmp_path, make_store):
+    store = make_store(SYSTEM, USER)
+    path = tmp_path / 'delete.reg'
+    path.write_text('Windows Registry Editor Version 5.00\r\n\r\n'
+                    '[HKEY_CURRENT_USER\\Environment]\r\n'
+                    '"Quoted"=-\r\n'
+                    '"New"="C:\\\\New"\r\n', encoding='utf-16')
+    diff = import_store(store, str(path))
+    assert diff.removed == {(EnvLocation.ENV_USER, 'quoted')}
+    assert store.env.user['new'].raw == 'C:\\New'
+
+
+def test_import_env_default_location(tmp_path, make_store):
+    store = make_store((), ())
+    path = tmp_path / 'profile.env'
+    path.write_text('# comment\nexport EDITOR=vim\nTOOLS=%ROOT%\\bin  # trailing\n')
+    import_store(store, str(path))
+    assert store.env.user['editor'].raw == 'vim'
+    assert store.env.user['tools'].raw == '%ROOT%\\bin'
+    assert store.env.user['tools'].type == REG_EXPAND_SZ
+
+
+@pytest.mark.parametrize('line, message', [
+    ('{"location": "machine", "name": "A", "value": "x"}', 'Line 2: unknown location'),
+    ('{"location": "user", "value": "x"}', 'Line 2: missing name'),
+    ('{"name": "A", "value": ["x"]}', 'Line 2: invalid value'),
+    ('{"name": "A", "value": "x", "type": "REG_SZ"}', 'Line 2: invalid type'),
+    ('[1, 2]', 'Line 2: expected an object'),
+    ('{"name": ', 'Line 2: '),
+])
+def test_import_jsonl_malformed(tmp_path, line, message, make_store):
+    store = make_store((), ())
+    path = tmp_path / 'bad.jsonl'
+    path.write_text('{"location": "user", "name": "OK", "value": "1"}\n%s\n' % line)
+    with pytest.raises(ValueError, match=message):
+        import_store(store, str(path))
+    assert 'ok' not in store.env.user
+
+
+@pytest.mark.parametrize('line, message', [
+    ('=oops', 'Line 2: missing name'),
+    ('A B=1', "Line 2: invalid name 'A B'"),
+])
+def test_import_env_malformed(tmp_path, line, message, make_store):
+    store = make_store((), ())
+    path = tmp_path / 'bad.env'
+    path.write_text('OK=1\n%s\n' % line)
+    with pytest.raises(ValueError, match=message):
+        import_store(store, str(path))
+    assert 'ok' not in store.env.user
+
+
+def test_format_for():
+    assert format_for('x.JSONL') == 'jsonl'
+    with pytest.raises(ValueError):
+        format_for('x.txt')
@@ -0,0 +1,52 @@
+from enveditor.envstore import EnvLocation
+from enveditor.registry import REG_EXPAND_SZ
+from enveditor.snapshot import SnapshotStore
+
+
+def count(snapshots, table):
+    return snapshots._db.execute('SELECT COUNT(*) FROM %s' % table).fetchone()[0]
+
+
+def test_SnapshotStore_save_load(tmp_path, store):
+    with SnapshotStore(str(tmp_path / 'history.db')) as snapshots:
+        first = store.save_snapshot(snapshots, 'first')
+        env = snapshots.load(first)
+        assert env.system['path'].raw == 'C:\\Windows;%Root%\\bin'
+        assert env.system['path'].type == REG_EXPAND_SZ
+        assert env.system['path'].value == ['C:\\Windows', '%Root%\\bin']
+        assert set(env.user) == {'path', 'temp'}
+        assert [label for _id, _taken, label in snapshots.snapshots()] == ['first']
+
+
+def test_SnapshotStore_deduplicates(tmp_path, store):
+    with SnapshotStore(str(tmp_path / 'history.db')) as snapshots:
+        store.save_snapshot(snapshots)
+        rows = count(snapshots, 'manifests'), count(snapshots, 'blobs')
+        store.save_snapshot(snapshots)
+        assert (count(snapshots, 'manifests'), count(snapshots, 'blobs')) == rows
+
+        with store.transaction() as txn:
+            txn.set(EnvLocation.ENV_USER, 'Temp', 'D:\\Temp')
+        store.save_snapshot(snapshots)
+        # Only the user manifest is new, with a row per user variable
+        assert count(snapshots, 'manifests') == rows[0] + len(store.env.user)
+        assert count(snapshots, 'blobs') == rows[1] + 1
+
+
+def test_SnapshotStore_diff(tmp_path, store):
+    with SnapshotStore(str(tmp_path / 'history.db')) as snapshots:
+        first = store.save_snapshot(snapshots)
+        with store.transaction() as txn:
+            txn.set(EnvLocation.ENV_USER, 'Temp', 'D:\\Temp')
+            txn.set(EnvLocation.ENV_USER, 'New', '1')
+            txn.delete(EnvLocation.ENV_SYSTEM, 'OS')
+
+        live = store.diff_snapshot(snapshots, first)
+        second = store.save_snapshot(snapshots)
+        saved = snapshots.diff(first, second)
+
+        for diff in (live, saved):
+            assert diff.added == {(EnvLocation.ENV_USER, 'new')}
+            assert diff.removed == {(EnvLocation.ENV_SYSTEM, 'os')}
+            assert diff.changed == {(EnvLocation.ENV_USER, 'temp')}
+        assert not snapshots.diff(second, second)
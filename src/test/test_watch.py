@@ -0,0 +1,74 @@
+import sys
+import threading
+
+from enveditor.envstore import EnvLocation
+from enveditor.filestore import FileEnvStore
+from enveditor.registry import HKEY_CURRENT_USER, USER_ENVIRONMENT
+from enveditor.watch import EnvWatcher
+
+USER = EnvLocation.ENV_USER
+
+
+def watch(store, **kwargs):
+    diffs = []
+    changed = threading.Event()
+
+    def callback(diff):
+        diffs.append(diff)
+        changed.set()
+
+    watcher = EnvWatcher(store, callback, **kwargs)
+    watcher.start()
+    return watcher, diffs, changed
+
+
+def test_EnvWatcher_registry_burst(store):
+    registry = store._registry
+
+    watcher, diffs, changed = watch(store, interval=0.01, debounce=0.2)
+    try:
+        for idx in range(5):
+            registry.set_value(HKEY_CURRENT_USER, USER_ENVIRONMENT, 'Var%d' % idx, str(idx))
+        assert changed.wait(5)
+    finally:
+        watcher.stop()
+
+    assert len(diffs) == 1
+    assert diffs[0].added == {(USER, 'var%d' % idx) for idx in range(5)}
+    assert store.env.user['var4'].raw == '4'
+
+
+def test_EnvWatcher_files(tmp_path):
+    path = tmp_path / 'environment'
+    path.write_text('A=1\n')
+    store = FileEnvStore(user=[str(path)])
+    store.update()
+
+    updates = []
+    watcher, diffs, changed = watch(store, interval=0.05, debounce=0.1, dispatch=updates.append)
+    try:
+        assert watcher.uses_inotify == sys.platform.startswith('linux')
+        path.write_text('A=2\nB=3\n')
+        for _attempt in range(100):
+            if updates:
+                break
+            changed.wait(0.05)
+    finally:
+        watcher.stop()
+
+    # The update runs where dispatch sends it, here on this thread
+    assert store.env.user['a'].raw == '1'
+    for update in updates:
+        update()
+    assert diffs[0].changed == {(USER, 'a')} and diffs[0].added == {(USER, 'b')}
+    assert not watcher.running
+
+
+def test_EnvWatcher_ignores_unchanged(store):
+
+    watcher, diffs, changed = watch(store, interval=0.01, debounce=0.01)
+    try:
+        assert not changed.wait(0.2)
+    finally:
+        watcher.stop()
+    assert diffs == []
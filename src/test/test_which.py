@@ -0,0 +1,100 @@
+import os
+
+from enveditor.envstore import Env, EnvKey, EnvLocation
+from enveditor.registry import REG_SZ, REG_EXPAND_SZ
+from enveditor.which import ExecutableIndex, path_directories
+
+
+def make_tree(tmp_path, layout):
+    directories = []
+    for name, files in layout:
+        directory = tmp_path / name
+        directory.mkdir()
+        for filename in files:
+            path = directory / filename
+            path.write_text('')
+            path.chmod(0o755)
+        directories.append(str(directory))
+    return directories
+
+
+def test_ExecutableIndex_pathext(tmp_path):
+    directories = make_tree(tmp_path, [('a', ['python.exe', 'readme.txt']),
+                                       ('b', ['Python.cmd', 'python.com', 'pip.exe'])])
+    index = ExecutableIndex(directories, ['.COM', '.EXE', '.CMD'])
+
+    assert index.which('python') == os.path.join(directories[0], 'python.exe')
+    assert index.candidates('PYTHON') == [os.path.join(directories[0], 'python.exe'),
+                                          os.path.join(directories[1], 'python.com'),
+                                          os.path.join(directories[1], 'Python.cmd')]
+    assert index.which('python.cmd') == os.path.join(directories[1], 'Python.cmd')
+    assert index.which('readme') is None
+    assert set(index.shadowed()) == {'python'}
+
+
+def test_ExecutableIndex_move(tmp_path):
+    directories = make_tree(tmp_path, [('a', ['python.exe']), ('b', ['python.exe']), ('c', ['git.exe'])])
+    index = ExecutableIndex(directories, ['.EXE'])
+    assert index.which('python') == os.path.join(directories[0], 'python.exe')
+
+    index.move(1, 0)
+    assert index.directories == [directories[1], directories[0], directories[2]]
+    assert index.which('python') == os.path.join(directories[1], 'python.exe')
+    assert index.which('git') == os.path.join(directories[2], 'git.exe')
+
+    index.set_path(directories[2:])
+    assert index.which('python') is None
+
+
+def test_ExecutableIndex_refresh(tmp_path):
+    directories = make_tree(tmp_path, [('a', []), ('b', ['tool'])])
+    index = ExecutableIndex(directories)
+    assert index.which('tool') == os.path.join(directories[1], 'tool')
+
+    new = tmp_path / 'a' / 'tool'
+    new.write_text('')
+    new.chmod(0o755)
+    os.utime(directories[0], ns=(0, 1))
+    index.refresh()
+    assert index.which('tool') == str(new)
+
+
+def test_ExecutableIndex_from_env(tmp_path):
+    directories = make_tree(tmp_path, [('sys', ['cmd.exe']), ('usr', ['cmd.bat'])])
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey(directories[0] + ';', REG_SZ)
+    env.system['pathext'] = EnvKey('.EXE;.BAT', REG_SZ)
+    env.user['path'] = EnvKey(directories[1], REG_SZ)
+
+    index = ExecutableIndex.from_env(env)
+    assert index.candidates('cmd') == [os.path.join(directories[0], 'cmd.exe'),
+                                       os.path.join(directories[1], 'cmd.bat')]
+
+
+def test_ExecutableIndex_from_env_splits_references():
+    env = Env()
+    env.pathsep = ';'
+    env.system['path'] = EnvKey('C:\\Windows;C:\\Tools', REG_SZ)
+    env.user['path'] = EnvKey('%PATH%;D:\\bin', REG_EXPAND_SZ)
+
+    index = ExecutableIndex.from_env(env, EnvLocation.ENV_USER)
+    assert index.directories == ['C:\\Windows', 'C:\\Tools', 'D:\\bin']
+
+
+def test_ExecutableIndex_follows_reordered_path(tmp_path):
+    directories = make_tree(tmp_path, [('a', ['tool.exe']), ('b', ['tool.exe']), ('c', ['other.exe'])])
+    env = Env()
+    env.pathsep = ';'
+    env.user['path'] = EnvKey(';'.join(directories), REG_SZ)
+    env.user['pathext'] = EnvKey('.EXE', REG_SZ)
+    index = ExecutableIndex.from_env(env, EnvLocation.ENV_USER)
+    assert index.which('tool') == os.path.join(directories[0], 'tool.exe')
+
+    env.user['path'] = EnvKey(';'.join([directories[1], directories[0], directories[2]]), REG_SZ)
+    scanned = []
+    scan = index._scan
+    index._scan = lambda directory: scanned.append(directory) or scan(directory)
+    index.set_path(path_directories(env, EnvLocation.ENV_USER))
+    assert index.which('tool') == os.path.join(directories[1], 'tool.exe')
+    assert sorted(scanned) == sorted(directories[:2])